@@ -10,41 +10,181 @@ bl_info = {
 
 if "bpy" in locals():
     import importlib
+    if "formats" in locals():
+        importlib.reload(formats)
+    if "workers" in locals():
+        importlib.reload(workers)
+    if "lod" in locals():
+        importlib.reload(lod)
+    if "optimize" in locals():
+        importlib.reload(optimize)
+    if "snapshot" in locals():
+        importlib.reload(snapshot)
+    if "validate" in locals():
+        importlib.reload(validate)
+    if "diff" in locals():
+        importlib.reload(diff)
+    if "spatial" in locals():
+        importlib.reload(spatial)
+    if "collision" in locals():
+        importlib.reload(collision)
+    if "raycast" in locals():
+        importlib.reload(raycast)
+    if "bake" in locals():
+        importlib.reload(bake)
+    if "atlas" in locals():
+        importlib.reload(atlas)
+    if "nodes" in locals():
+        importlib.reload(nodes)
+    if "zones" in locals():
+        importlib.reload(zones)
+    if "visibility" in locals():
+        importlib.reload(visibility)
+    if "budget" in locals():
+        importlib.reload(budget)
+    if "overlay" in locals():
+        importlib.reload(overlay)
+    if "server" in locals():
+        importlib.reload(server)
     if "decode" in locals():
         importlib.reload(decode)
     if "encode" in locals():
         importlib.reload(encode)
 
-import bpy, bmesh, struct
+import bpy, bmesh, struct, threading, time, os, json
 from bpy.props import *
 from bpy_extras.io_utils import ImportHelper, ExportHelper, axis_conversion
 from . import panels
 from mathutils import Matrix
 
-class IMPORT_MESH_OT_revolt_model(bpy.types.Operator, ImportHelper):
+# Mixin for import operators. When started from the UI the files are read in a background thread and the Blender data is created in small steps on a timer, so Blender stays responsive and the import can be cancelled with ESC.
+# Operators using it define read(), which returns a function and its arguments to run in the thread, and build(context, data), a generator yielding the progress (0 to 1).
+class AsyncImport:
+    run_modal = BoolProperty(default = False, options = {'HIDDEN', 'SKIP_SAVE'})
+    
+    # Data created by the import that is removed again when it's cancelled. Objects come first so the data they use has no users left.
+    created_data = ("objects", "groups", "meshes", "lamps", "images")
+    
+    def invoke(self, context, event):
+        self.run_modal = not bpy.app.background
+        return ImportHelper.invoke(self, context, event)
+    
+    def execute(self, context):
+        from . import decode
+        function, args = self.read()
+        
+        # Imports everything at once when called from a script.
+        if not self.run_modal:
+            decode.run_steps(self.build(context, function(*args)))
+            return {'FINISHED'}
+        
+        # The thread only writes to this dict.
+        self._state = {"data": None, "error": None, "done": False}
+        def read_in_background(state):
+            try:
+                state["data"] = function(*args)
+            except Exception as error:
+                state["error"] = error
+            state["done"] = True
+        threading.Thread(target = read_in_background, args = (self._state,), daemon = True).start()
+        
+        self._steps = None
+        self._existing = dict([(name, set([item.name for item in getattr(bpy.data, name)])) for name in self.created_data])
+        self._timer = context.window_manager.event_timer_add(0.02, context.window)
+        context.window_manager.modal_handler_add(self)
+        context.window_manager.progress_begin(0, 100)
+        return {'RUNNING_MODAL'}
+    
+    def modal(self, context, event):
+        if event.type == "ESC":
+            self.cancel(context)
+            self.report({'WARNING'}, "Import cancelled")
+            return {'CANCELLED'}
+        
+        if event.type != "TIMER":
+            return {'PASS_THROUGH'}
+        
+        # Waits for the background thread.
+        if not self._state["done"]:
+            return {'RUNNING_MODAL'}
+        if self._state["error"] != None:
+            self.cleanup(context)
+            self.report({'ERROR'}, "Import failed: " + str(self._state["error"]))
+            return {'CANCELLED'}
+        
+        # Runs as many steps as fit in a time slice, then gives control back to Blender.
+        if self._steps == None:
+            self._steps = self.build(context, self._state["data"])
+        end_time = time.time() + 0.05
+        try:
+            while time.time() < end_time:
+                context.window_manager.progress_update(10 + 90 * next(self._steps))
+        except StopIteration:
+            self.cleanup(context)
+            return {'FINISHED'}
+        except Exception as error:
+            self.cancel(context)
+            self.report({'ERROR'}, "Import failed: " + str(error))
+            return {'CANCELLED'}
+        return {'RUNNING_MODAL'}
+    
+    # Called on ESC, on errors and when Blender cancels the operator. Removes the objects and meshes created so far, also the ones that were only partly built.
+    def cancel(self, context):
+        self.cleanup(context)
+        for name in self.created_data:
+            collection = getattr(bpy.data, name)
+            for item in [item for item in collection if item.name not in self._existing[name]]:
+                if name == "objects":
+                    for scene in item.users_scene:
+                        scene.objects.unlink(item)
+                    for group in item.users_group:
+                        group.objects.unlink(item)
+                collection.remove(item)
+    
+    def cleanup(self, context):
+        context.window_manager.event_timer_remove(self._timer)
+        context.window_manager.progress_end()
+
+class IMPORT_MESH_OT_revolt_model(bpy.types.Operator, AsyncImport, ImportHelper):
     bl_idname = "import_mesh.revolt_model"
     bl_label = "Import Re-Volt model"
     bl_options = {'UNDO'}
 
     filename_ext = ".prm"
     filter_glob = StringProperty(default="*.prm;*.m", options={'HIDDEN'})
+    files = CollectionProperty(type = bpy.types.OperatorFileListElement, options = {'HIDDEN', 'SKIP_SAVE'})
+    directory = StringProperty(subtype = "DIR_PATH", options = {'HIDDEN', 'SKIP_SAVE'})
     
     scale = FloatProperty(default=0.01, name = "Scale", min = 0.0005, max = 1, step = 0.01)
     up_axis = EnumProperty(default = "-Y", name = "Up axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
     forward_axis = EnumProperty(default = "Z", name = "Forward axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
+    whole_directory = BoolProperty(default = False, name = "Whole directory")
+    placement = EnumProperty(default = "ORIGINAL", name = "Placement", items = (("ORIGINAL", "Original positions", "Keep the positions stored in the files"), ("GRID", "Grid", "Place the models next to each other")))
     
-    def execute(self, context):
+    # Returns the selected files, or every model in the directory.
+    def get_filepaths(self):
+        directory = self.directory or os.path.dirname(self.properties.filepath)
+        if self.whole_directory:
+            names = sorted([name for name in os.listdir(directory) if os.path.splitext(name)[1].lower() in (".prm", ".m")])
+        else:
+            names = [file.name for file in self.files if file.name != ""]
+        return [os.path.join(directory, name) for name in names] or [self.properties.filepath]
+    
+    def read(self):
         from . import decode
-        decode.import_model(self.properties.filepath, axis_conversion(to_up = self.up_axis, to_forward = self.forward_axis).to_4x4() * self.scale)
-        return {'FINISHED'}
+        return decode.read_files, (self.get_filepaths(),)
+    
+    def build(self, context, data):
+        from . import decode
+        return decode.iter_import_models(self.get_filepaths(), axis_conversion(to_up = self.up_axis, to_forward = self.forward_axis).to_4x4() * self.scale, self.placement, data)
 
-class IMPORT_SCENE_OT_revolt_world(bpy.types.Operator, ImportHelper):
+class IMPORT_SCENE_OT_revolt_world(bpy.types.Operator, AsyncImport, ImportHelper):
     bl_idname = "import_scene.revolt_world"
     bl_label = "Import Re-Volt world"
     bl_options = {'UNDO'}
 
     filename_ext = ".w"
-    filter_glob = StringProperty(default="*.w", options={'HIDDEN'})
+    filter_glob = StringProperty(default="*.w;*.rvs", options={'HIDDEN'})
     
     scale = FloatProperty(default=0.01, name = "Scale", min = 0.0005, max = 1, step = 0.01)
     up_axis = EnumProperty(default = "-Y", name = "Up axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
@@ -53,6 +193,11 @@ class IMPORT_SCENE_OT_revolt_world(bpy.types.Operator, ImportHelper):
     include_objects = BoolProperty(default = True, name = "Include pickups")
     include_hitboxes = BoolProperty(default = True, name = "Include hitboxes")
     hide_hitboxes = BoolProperty(default = True, name = "Hide hitboxes")
+    include_lights = BoolProperty(default = True, name = "Include lights")
+    compact = BoolProperty(default = False, name = "Compact (edit on demand)")
+    split_chunks = BoolProperty(default = False, name = "Keep meshes separate", description = "Imports each mesh of the W-file as its own object so edits only touch one mesh and unchanged meshes are exported as they were")
+    quantize = BoolProperty(default = False, name = "16-bit positions")
+    save_snapshot = BoolProperty(default = False, name = "Save snapshot (.rvs)")
     
     def draw(self, context):
         self.layout.prop(self, "scale")
@@ -63,14 +208,35 @@ class IMPORT_SCENE_OT_revolt_world(bpy.types.Operator, ImportHelper):
         self.layout.prop(self, "include_hitboxes")
         if self.include_hitboxes:
             self.layout.prop(self, "hide_hitboxes")
+        self.layout.prop(self, "include_lights")
+        self.layout.prop(self, "compact")
+        if self.compact:
+            self.layout.prop(self, "quantize")
+        else:
+            self.layout.prop(self, "split_chunks")
+        self.layout.prop(self, "save_snapshot")
     
-    def execute(self, context):
+    # Snapshots are memory mapped. W-files are read into a snapshot together with all other track files, so none of them is parsed on the main thread.
+    # The snapshot is saved next to the W-file if save_snapshot is set.
+    def read(self):
+        from . import decode, snapshot
+        if self.properties.filepath.lower().endswith(".rvs"):
+            return snapshot.load, (self.properties.filepath,)
+        snapshot_path = os.path.splitext(self.properties.filepath)[0] + ".rvs" if self.save_snapshot else None
+        return decode.read_world, (self.properties.filepath, self.compact and self.quantize, snapshot_path, self.include_objects, self.include_models, self.include_hitboxes)
+    
+    def build(self, context, data):
         from . import decode
-        decode.import_world(self.properties.filepath, axis_conversion(to_up = self.up_axis, to_forward = self.forward_axis).to_4x4() * self.scale, self.include_objects, self.include_models, self.include_hitboxes, self.hide_hitboxes)
         context.scene.revolt_world.scale = self.scale
         context.scene.revolt_world.up_axis = self.up_axis
         context.scene.revolt_world.forward_axis = self.forward_axis
-        return {'FINISHED'}
+        matrix = axis_conversion(to_up = self.up_axis, to_forward = self.forward_axis).to_4x4() * self.scale
+        if self.properties.filepath.lower().endswith(".rvs"):
+            return decode.iter_import_snapshot(data, matrix, self.include_objects, self.include_models, self.include_hitboxes, self.hide_hitboxes, self.compact, self.split_chunks, self.include_lights)
+        if data == None:
+            return iter(())
+        snap, world_data = data
+        return decode.iter_import_snapshot(snap, matrix, self.include_objects, self.include_models, self.include_hitboxes, self.hide_hitboxes, self.compact, self.split_chunks, self.include_lights, world_data)
         
 class IMPORT_MESH_OT_revolt_hitbox(bpy.types.Operator, ImportHelper):
     bl_idname = "import_mesh.revolt_hitbox"
@@ -89,7 +255,63 @@ class IMPORT_MESH_OT_revolt_hitbox(bpy.types.Operator, ImportHelper):
         decode.import_hitbox(self.properties.filepath, axis_conversion(to_up = self.up_axis, to_forward = self.forward_axis).to_4x4() * self.scale)
         return {'FINISHED'}
 
-class IMPORT_SCENE_OT_revolt_car(bpy.types.Operator, ImportHelper):
+class IMPORT_SCENE_OT_revolt_nodes(bpy.types.Operator, ImportHelper):
+    bl_idname = "import_scene.revolt_nodes"
+    bl_label = "Import Re-Volt nodes"
+    bl_options = {'UNDO'}
+
+    filename_ext = ".pan"
+    filter_glob = StringProperty(default="*.pan;*.fan", options={'HIDDEN'})
+    
+    scale = FloatProperty(default=0.01, name = "Scale", min = 0.0005, max = 1, step = 0.01)
+    up_axis = EnumProperty(default = "-Y", name = "Up axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
+    forward_axis = EnumProperty(default = "Z", name = "Forward axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
+    
+    # The imported object is also set as the nodes to export with the world.
+    def execute(self, context):
+        from . import decode
+        matrix = axis_conversion(to_up = self.up_axis, to_forward = self.forward_axis).to_4x4() * self.scale
+        if self.properties.filepath.lower().endswith(".fan"):
+            context.scene.revolt_world.ai_nodes = decode.import_ai_nodes(self.properties.filepath, matrix).name
+        else:
+            context.scene.revolt_world.position_nodes = decode.import_position_nodes(self.properties.filepath, matrix).name
+        return {'FINISHED'}
+
+class IMPORT_SCENE_OT_revolt_zones(bpy.types.Operator, ImportHelper):
+    bl_idname = "import_scene.revolt_zones"
+    bl_label = "Import Re-Volt track zones"
+    bl_options = {'UNDO'}
+
+    filename_ext = ".taz"
+    filter_glob = StringProperty(default="*.taz", options={'HIDDEN'})
+    
+    scale = FloatProperty(default=0.01, name = "Scale", min = 0.0005, max = 1, step = 0.01)
+    up_axis = EnumProperty(default = "-Y", name = "Up axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
+    forward_axis = EnumProperty(default = "Z", name = "Forward axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
+    
+    def execute(self, context):
+        from . import decode
+        decode.import_zones(self.properties.filepath, axis_conversion(to_up = self.up_axis, to_forward = self.forward_axis).to_4x4() * self.scale)
+        return {'FINISHED'}
+
+class IMPORT_SCENE_OT_revolt_lights(bpy.types.Operator, ImportHelper):
+    bl_idname = "import_scene.revolt_lights"
+    bl_label = "Import Re-Volt lights"
+    bl_options = {'UNDO'}
+
+    filename_ext = ".lit"
+    filter_glob = StringProperty(default="*.lit", options={'HIDDEN'})
+    
+    scale = FloatProperty(default=0.01, name = "Scale", min = 0.0005, max = 1, step = 0.01)
+    up_axis = EnumProperty(default = "-Y", name = "Up axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
+    forward_axis = EnumProperty(default = "Z", name = "Forward axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
+    
+    def execute(self, context):
+        from . import decode
+        decode.import_lights(self.properties.filepath, axis_conversion(to_up = self.up_axis, to_forward = self.forward_axis).to_4x4() * self.scale)
+        return {'FINISHED'}
+
+class IMPORT_SCENE_OT_revolt_car(bpy.types.Operator, AsyncImport, ImportHelper):
     bl_idname = "import_scene.revolt_car"
     bl_label = "Import Re-Volt car"
     bl_options = {'UNDO'}
@@ -101,10 +323,16 @@ class IMPORT_SCENE_OT_revolt_car(bpy.types.Operator, ImportHelper):
     up_axis = EnumProperty(default = "-Y", name = "Up axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
     forward_axis = EnumProperty(default = "Z", name = "Forward axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
     
-    def execute(self, context):
+    def read(self):
         from . import decode
-        decode.import_car(self.properties.filepath, axis_conversion(to_up = self.up_axis, to_forward = self.forward_axis).to_4x4() * self.scale)
-        return {'FINISHED'}
+        return decode.read_car, (self.properties.filepath,)
+    
+    def build(self, context, data):
+        from . import decode
+        context.scene.revolt_car.scale = self.scale
+        context.scene.revolt_car.up_axis = self.up_axis
+        context.scene.revolt_car.forward_axis = self.forward_axis
+        return decode.iter_import_car(self.properties.filepath, axis_conversion(to_up = self.up_axis, to_forward = self.forward_axis).to_4x4() * self.scale, data)
 
 class EXPORT_MESH_OT_revolt_model(bpy.types.Operator, ExportHelper):
     bl_idname = "export_mesh.revolt_model"
@@ -118,10 +346,15 @@ class EXPORT_MESH_OT_revolt_model(bpy.types.Operator, ExportHelper):
     up_axis = EnumProperty(default = "-Y", name = "Up axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
     forward_axis = EnumProperty(default = "Z", name = "Forward axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
     include_texture = BoolProperty(default=True, name = "Include texture")
+    lod_levels = IntProperty(default = 1, name = "Levels of detail", min = 1, max = 8)
+    lod_ratio = FloatProperty(default = 0.5, name = "Level ratio", min = 0.05, max = 0.95)
+    optimize_order = BoolProperty(default = False, name = "Optimize vertex cache")
+    sort_faces = BoolProperty(default = False, name = "Sort faces by render state", description = "Sorts the faces by texture page and then by the translucent, additive and double sided flags")
     
     def execute(self, context):
         from . import encode
-        encode.export_model(self.properties.filepath, axis_conversion(from_up = self.up_axis, from_forward = self.forward_axis).to_4x4() * (1 / self.scale), self.include_texture)
+        budgets = encode.export_model(self.properties.filepath, axis_conversion(from_up = self.up_axis, from_forward = self.forward_axis).to_4x4() * (1 / self.scale), self.include_texture, None, self.lod_levels, self.lod_ratio, self.optimize_order, self.sort_faces)
+        self.report({'INFO'}, "Triangles per level: " + ", ".join([str(x) for x in budgets]))
         return {'FINISHED'}
 
 class EXPORT_SCENE_OT_revolt_world(bpy.types.Operator, ImportHelper):
@@ -135,10 +368,12 @@ class EXPORT_SCENE_OT_revolt_world(bpy.types.Operator, ImportHelper):
     scale = FloatProperty(default=0.01, name = "Scale", min = 0.0005, max = 1, step = 0.01)
     up_axis = EnumProperty(default = "-Y", name = "Up axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
     forward_axis = EnumProperty(default = "Z", name = "Forward axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
+    sort_faces = BoolProperty(default = False, name = "Sort faces by render state", description = "Sorts the faces by texture page and then by the translucent, additive and double sided flags")
     
     def execute(self, context):
         from . import encode
-        encode.export_world(self.properties.filepath, axis_conversion(from_up = self.up_axis, from_forward = self.forward_axis).to_4x4() * (1 / self.scale))
+        runs = encode.export_world(self.properties.filepath, axis_conversion(from_up = self.up_axis, from_forward = self.forward_axis).to_4x4() * (1 / self.scale), None, self.sort_faces)
+        self.report({'INFO'}, "Texture and render state runs: " + str(runs))
         return {'FINISHED'}
         
 class EXPORT_MESH_OT_revolt_hitbox(bpy.types.Operator, ImportHelper):
@@ -153,9 +388,79 @@ class EXPORT_MESH_OT_revolt_hitbox(bpy.types.Operator, ImportHelper):
     up_axis = EnumProperty(default = "-Y", name = "Up axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
     forward_axis = EnumProperty(default = "Z", name = "Forward axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
     
+    raster_size = IntProperty(default = 1024, name = "Grid size", min = 16, max = 65536)
+    
+    def execute(self, context):
+        from . import encode
+        encode.export_hitbox(self.properties.filepath, axis_conversion(from_up = self.up_axis, from_forward = self.forward_axis).to_4x4() * (1 / self.scale), None, self.raster_size)
+        return {'FINISHED'}
+
+class EXPORT_SCENE_OT_revolt_nodes(bpy.types.Operator, ExportHelper):
+    bl_idname = "export_scene.revolt_nodes"
+    bl_label = "Export Re-Volt nodes"
+
+    filename_ext = ".pan"
+    filter_glob = StringProperty(default="*.pan;*.fan", options={'HIDDEN'})
+    check_extension = False
+    
+    scale = FloatProperty(default=0.01, name = "Scale", min = 0.0005, max = 1, step = 0.01)
+    up_axis = EnumProperty(default = "-Y", name = "Up axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
+    forward_axis = EnumProperty(default = "Z", name = "Forward axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
+    
+    @classmethod
+    def poll(self, context):
+        return context.object != None and context.object.type == "MESH"
+    
+    # Exports the active object as AI nodes if the file ends with .fan and as position nodes otherwise.
     def execute(self, context):
         from . import encode
-        encode.export_hitbox(self.properties.filepath, axis_conversion(from_up = self.up_axis, from_forward = self.forward_axis).to_4x4() * (1 / self.scale))
+        matrix = axis_conversion(from_up = self.up_axis, from_forward = self.forward_axis).to_4x4() * (1 / self.scale)
+        if self.properties.filepath.lower().endswith(".fan"):
+            problems = encode.export_ai_nodes(self.properties.filepath, matrix, context.object)
+        else:
+            problems = encode.export_position_nodes(self.properties.filepath, matrix, context.object)
+        if len(problems) > 0:
+            self.report({'WARNING'}, ", ".join([message + " (" + str(len(items)) + ")" for rule, message, items in problems]))
+        return {'FINISHED'}
+
+class EXPORT_SCENE_OT_revolt_zones(bpy.types.Operator, ExportHelper):
+    bl_idname = "export_scene.revolt_zones"
+    bl_label = "Export Re-Volt track zones"
+
+    filename_ext = ".taz"
+    filter_glob = StringProperty(default="*.taz", options={'HIDDEN'})
+    
+    scale = FloatProperty(default=0.01, name = "Scale", min = 0.0005, max = 1, step = 0.01)
+    up_axis = EnumProperty(default = "-Y", name = "Up axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
+    forward_axis = EnumProperty(default = "Z", name = "Forward axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
+    
+    # Exports every track zone in the scene. The floors and AI nodes of the track next to the file are checked against the new zones.
+    def execute(self, context):
+        from . import encode, validate
+        encode.export_zones(self.properties.filepath, axis_conversion(from_up = self.up_axis, from_forward = self.forward_axis).to_4x4() * (1 / self.scale), [obj for obj in context.scene.objects if obj.revolt.type == "ZONE"])
+        base = os.path.splitext(self.properties.filepath)[0]
+        issues = validate.check_zone_coverage(self.properties.filepath, base + ".ncp", base + ".fan")
+        if len(issues) > 0:
+            self.report({'WARNING'}, ", ".join([issue["message"] + " (" + str(issue["count"]) + ")" for issue in issues]))
+        return {'FINISHED'}
+
+class EXPORT_SCENE_OT_revolt_lights(bpy.types.Operator, ExportHelper):
+    bl_idname = "export_scene.revolt_lights"
+    bl_label = "Export Re-Volt lights"
+
+    filename_ext = ".lit"
+    filter_glob = StringProperty(default="*.lit", options={'HIDDEN'})
+    
+    scale = FloatProperty(default=0.01, name = "Scale", min = 0.0005, max = 1, step = 0.01)
+    up_axis = EnumProperty(default = "-Y", name = "Up axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
+    forward_axis = EnumProperty(default = "Z", name = "Forward axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
+    use_selection = BoolProperty(default = True, name = "Selected lamps only")
+    
+    def execute(self, context):
+        from . import encode
+        objects = context.selected_objects if self.use_selection else context.scene.objects
+        count = encode.export_lights(self.properties.filepath, axis_conversion(from_up = self.up_axis, from_forward = self.forward_axis).to_4x4() * (1 / self.scale), objects)
+        self.report({'INFO'}, str(count) + " light(s) exported")
         return {'FINISHED'}
 
 class EXPORT_MESH_OT_revolt_convex_hull(bpy.types.Operator, ImportHelper):
@@ -175,6 +480,101 @@ class EXPORT_MESH_OT_revolt_convex_hull(bpy.types.Operator, ImportHelper):
         encode.export_convex_hull(self.properties.filepath, axis_conversion(from_up = self.up_axis, from_forward = self.forward_axis).to_4x4() * (1 / self.scale))
         return {'FINISHED'}
 
+class IMPORT_SCENE_OT_revolt_diff(bpy.types.Operator, ImportHelper):
+    bl_idname = "import_scene.revolt_diff"
+    bl_label = "Compare Re-Volt files"
+    bl_options = {'UNDO'}
+
+    filename_ext = ".w"
+    filter_glob = StringProperty(default="*.w;*.prm;*.m;*.ncp", options={'HIDDEN'})
+    
+    old_filepath = StringProperty(name = "Old version", subtype = "FILE_PATH")
+    tolerance = FloatProperty(default = 0.01, name = "Tolerance", min = 0.0001, description = "Corners closer than this are equal (in file units)")
+    move_radius = FloatProperty(default = 100, name = "Move radius", min = 0, description = "Faces that moved farther than this count as removed and added (in file units)")
+    save_report = BoolProperty(default = False, name = "Save report (.json)")
+    scale = FloatProperty(default=0.01, name = "Scale", min = 0.0005, max = 1, step = 0.01)
+    up_axis = EnumProperty(default = "-Y", name = "Up axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
+    forward_axis = EnumProperty(default = "Z", name = "Forward axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
+    
+    # The selected file is the new version.
+    def execute(self, context):
+        from . import decode, diff
+        old_filepath = bpy.path.abspath(self.old_filepath)
+        if not os.path.isfile(old_filepath):
+            self.report({'ERROR'}, "Select the old version of the file")
+            return {'CANCELLED'}
+        result = diff.compare(old_filepath, self.properties.filepath, self.tolerance, self.move_radius)
+        if self.save_report:
+            diff.write_report(result, os.path.splitext(self.properties.filepath)[0] + ".diff.json")
+        decode.import_diff(result, axis_conversion(to_up = self.up_axis, to_forward = self.forward_axis).to_4x4() * self.scale, self.tolerance)
+        self.report({'INFO'}, ", ".join([key + ": " + str(value) for key, value in sorted(diff.summary(result).items())]))
+        return {'FINISHED'}
+
+class IMPORT_MESH_OT_revolt_collision_grid(bpy.types.Operator, ImportHelper):
+    bl_idname = "import_mesh.revolt_collision_grid"
+    bl_label = "Simulate Re-Volt collision grid"
+
+    filename_ext = ".ncp"
+    filter_glob = StringProperty(default="*.ncp", options={'HIDDEN'})
+    
+    raster_sizes = StringProperty(default = "256 512 1024 2048", name = "Grid sizes")
+    spacing = FloatProperty(default = 64, name = "Sample spacing", min = 1, description = "Distance between sampled positions when no path is supplied (in file units)")
+    radius = FloatProperty(default = 0, name = "Car radius", min = 0, description = "Size of the area tested around each position (in file units)")
+    path_file = StringProperty(name = "Car path", subtype = "FILE_PATH", description = "Text file with one x y z position per line")
+    
+    # Writes a report and a heat map next to the NCP-file.
+    def execute(self, context):
+        from . import collision
+        base = os.path.splitext(self.properties.filepath)[0]
+        raster_sizes = [float(x) for x in self.raster_sizes.replace(",", " ").split()]
+        report = collision.analyze(self.properties.filepath, base + ".grid.json", base + ".grid.bmp", raster_sizes, self.spacing, self.radius, bpy.path.abspath(self.path_file) if self.path_file else None)
+        bpy.data.images.load(base + ".grid.bmp")
+        self.report({'INFO'}, ", ".join([str(int(result["raster_size"])) + ": " + str(round(result["average_tests"], 1)) + " avg / " + str(result["worst_tests"]) + " max" for result in report["raster_sizes"]]))
+        return {'FINISHED'}
+
+class EXPORT_SCENE_OT_revolt_validate(bpy.types.Operator, ImportHelper):
+    bl_idname = "export_scene.revolt_validate"
+    bl_label = "Validate Re-Volt tracks"
+
+    filename_ext = ".json"
+    filter_glob = StringProperty(default="*.json", options={'HIDDEN'})
+    
+    max_cell_candidates = IntProperty(default = 256, name = "Max polyhedrons per cell", min = 1)
+    
+    # Validates every track in the folder of the report and its subfolders.
+    def execute(self, context):
+        from . import validate
+        report = validate.validate_tracks([os.path.dirname(self.properties.filepath)], self.properties.filepath, self.max_cell_candidates)
+        issue_count = sum(report["summary"].values())
+        self.report({'WARNING'} if issue_count > 0 else {'INFO'}, str(len(report["tracks"])) + " track(s), " + str(issue_count) + " issue(s) in " + str(report["seconds"]) + " s")
+        return {'FINISHED'}
+
+class EXPORT_SCENE_OT_revolt_budget(bpy.types.Operator, ImportHelper):
+    bl_idname = "export_scene.revolt_budget"
+    bl_label = "Analyze Re-Volt track budgets"
+
+    filename_ext = ".json"
+    filter_glob = StringProperty(default="*.json", options={'HIDDEN'})
+    
+    world_triangles = IntProperty(default = 40000, name = "Max W triangles", min = 1)
+    mesh_triangles = IntProperty(default = 2000, name = "Max triangles per mesh", min = 1)
+    translucent_ratio = FloatProperty(default = 0.25, name = "Max translucent area", min = 0, max = 1)
+    video_megabytes = FloatProperty(default = 4, name = "Max texture memory (MB)", min = 0)
+    budgets_file = StringProperty(name = "Budgets", subtype = "FILE_PATH", description = "JSON file with limits overriding the ones above, e.g. {\"instances\": 300}")
+    
+    # Measures every track in the folder of the report and its subfolders.
+    def execute(self, context):
+        from . import budget
+        budgets = {"world_triangles": self.world_triangles, "mesh_triangles": self.mesh_triangles, "translucent_ratio": self.translucent_ratio, "video_bytes": int(self.video_megabytes * 1024 * 1024)}
+        if self.budgets_file:
+            fh = open(bpy.path.abspath(self.budgets_file), "r")
+            budgets.update(json.load(fh))
+            fh.close()
+        report = budget.analyze_tracks([os.path.dirname(self.properties.filepath)], self.properties.filepath, budgets)
+        over_count = sum(report["summary"].values())
+        self.report({'WARNING'} if over_count > 0 else {'INFO'}, str(len(report["tracks"])) + " track(s), " + str(over_count) + " budget(s) exceeded in " + str(report["seconds"]) + " s")
+        return {'FINISHED'}
+
 class INFO_MT_revolt_add(bpy.types.Menu):
     bl_idname = "INFO_MT_revolt_add"
     bl_label = "Re-Volt"
@@ -188,31 +588,113 @@ class OBJECT_OT_add_revolt_startpos(bpy.types.Operator):
     bl_options = {'UNDO'}
     
     matrix = FloatVectorProperty(subtype = "MATRIX", size = 16, default = (0.01, 0, 0, 0, 0, 0, -0.01, 0, 0, 0.01, 0, 0, 0, 0, 0, 0.01))
+    snap = BoolProperty(default = True, name = "Snap to track", description = "Place the start position on the track surface below the cursor")
     
     def execute(self, context):
         from . import decode
         obj = decode.add_revolt_startpos(self.matrix)
         obj.location = bpy.context.scene.cursor_location
+        
+        # Drops the start position onto the hitbox (or the world) of the imported track.
+        index = decode.get_track_index() if self.snap else None
+        if index != None:
+            hit = index.ray_cast(obj.location, (0, 0, -1)) or index.find_nearest(obj.location)
+            if hit != None:
+                obj.location = hit.location
         obj.select = True
         bpy.context.scene.objects.active = obj
         return {'FINISHED'}
         
+class OBJECT_OT_revolt_expand(bpy.types.Operator):
+    bl_idname = "object.revolt_expand"
+    bl_label = "Edit Re-Volt geometry"
+    bl_options = {'UNDO'}
+    
+    @classmethod
+    def poll(self, context):
+        return context.object != None and "revolt_source" in context.object
+    
+    def execute(self, context):
+        from . import decode
+        obj = decode.expand_compact_object(context.object)
+        if obj == None:
+            self.report({'ERROR'}, "Source file not found: " + context.object["revolt_source"])
+            return {'CANCELLED'}
+        obj.select = True
+        context.scene.objects.active = obj
+        return {'FINISHED'}
+        
+class OBJECT_OT_revolt_bake_lighting(bpy.types.Operator):
+    bl_idname = "object.revolt_bake_lighting"
+    bl_label = "Bake Re-Volt vertex lighting"
+    bl_description = "Bakes the lamps in the scene with shadows and ambient occlusion into the vertex colors of the selected meshes"
+    bl_options = {'REGISTER', 'UNDO'}
+    
+    ambient = FloatVectorProperty(default = (0.2, 0.2, 0.2), name = "Ambient", subtype = "COLOR", min = 0, max = 1)
+    ao_samples = IntProperty(default = 16, name = "Occlusion samples", min = 0, max = 256, description = "Rays cast from each corner for ambient occlusion. 0 turns it off")
+    ao_distance = FloatProperty(default = 1.0, name = "Occlusion distance", min = 0)
+    shadow_distance = FloatProperty(default = 100.0, name = "Sun shadow distance", min = 0, description = "How far shadow rays towards sun lamps go")
+    occlusion_alpha = BoolProperty(default = False, name = "Occlusion to Alpha", description = "Writes the shadow of the ambient occlusion into the Alpha layer. It holds the transparency, so the corners become transparent where they're occluded")
+    
+    @classmethod
+    def poll(self, context):
+        return any(obj.type == "MESH" for obj in context.selected_objects)
+    
+    def execute(self, context):
+        from . import encode
+        if context.object != None and context.object.mode == "EDIT":
+            bpy.ops.object.mode_set(mode = "OBJECT")
+        start_time = time.time()
+        objects = [obj for obj in context.selected_objects if obj.type == "MESH"]
+        count = encode.bake_lighting(objects, context.scene, self.ambient, self.ao_samples, self.ao_distance, self.shadow_distance, self.occlusion_alpha)
+        self.report({'INFO'}, "Lit " + str(count) + " corners in " + str(round(time.time() - start_time, 1)) + " seconds")
+        return {'FINISHED'}
+        
+class VIEW3D_OT_revolt_overlay(bpy.types.Operator):
+    bl_idname = "view3d.revolt_overlay"
+    bl_label = "Toggle Re-Volt track overlay"
+    bl_description = "Draws the hitbox, its lookup grid and the mesh bounds of the exported track in the 3D view"
+    
+    def execute(self, context):
+        from . import overlay
+        overlay.toggle()
+        redraw_views(self, context)
+        return {'FINISHED'}
+
 def menu_func_import(self, context):
     self.layout.operator(IMPORT_MESH_OT_revolt_model.bl_idname, text="Re-Volt model (.prm/.m)")
     self.layout.operator(IMPORT_SCENE_OT_revolt_world.bl_idname, text="Re-Volt world (.w)")
     self.layout.operator(IMPORT_MESH_OT_revolt_hitbox.bl_idname, text="Re-Volt hitbox (.ncp)")
     self.layout.operator(IMPORT_SCENE_OT_revolt_car.bl_idname, text="Re-Volt car (Parameters.txt)")
+    self.layout.operator(IMPORT_SCENE_OT_revolt_nodes.bl_idname, text="Re-Volt nodes (.pan/.fan)")
+    self.layout.operator(IMPORT_SCENE_OT_revolt_zones.bl_idname, text="Re-Volt track zones (.taz)")
+    self.layout.operator(IMPORT_SCENE_OT_revolt_lights.bl_idname, text="Re-Volt lights (.lit)")
+    self.layout.operator(IMPORT_SCENE_OT_revolt_diff.bl_idname, text="Re-Volt diff (.w/.prm/.ncp)")
+    self.layout.operator(IMPORT_MESH_OT_revolt_collision_grid.bl_idname, text="Re-Volt collision grid simulation (.ncp)")
 
 def menu_func_export(self, context):
     self.layout.operator(EXPORT_MESH_OT_revolt_model.bl_idname, text="Re-Volt model (.prm/.m)")
     self.layout.operator(EXPORT_SCENE_OT_revolt_world.bl_idname, text="Re-Volt world (.w)")
     self.layout.operator(EXPORT_MESH_OT_revolt_hitbox.bl_idname, text="Re-Volt hitbox (.ncp)")
+    self.layout.operator(EXPORT_SCENE_OT_revolt_nodes.bl_idname, text="Re-Volt nodes (.pan/.fan)")
+    self.layout.operator(EXPORT_SCENE_OT_revolt_zones.bl_idname, text="Re-Volt track zones (.taz)")
+    self.layout.operator(EXPORT_SCENE_OT_revolt_lights.bl_idname, text="Re-Volt lights (.lit)")
     self.layout.operator(EXPORT_MESH_OT_revolt_convex_hull.bl_idname, text="Re-Volt convex hull (.hul)")
+    self.layout.operator(EXPORT_SCENE_OT_revolt_validate.bl_idname, text="Re-Volt validation report (.json)")
+    self.layout.operator(EXPORT_SCENE_OT_revolt_budget.bl_idname, text="Re-Volt budget report (.json)")
 
 def menu_func_add(self, context):
     self.layout.separator()
     self.layout.menu(INFO_MT_revolt_add.bl_idname, icon = "GAME")
 
+# There's no screen when the property is changed from a script in background mode.
+def redraw_views(self, context):
+    if context.screen == None:
+        return
+    for area in context.screen.areas:
+        if area.type == "VIEW_3D":
+            area.tag_redraw()
+
 def limit_farclip(self, context):
     if self.farclip < self.fogstart:
         self.farclip = self.fogstart
@@ -231,7 +713,22 @@ class RevoltWorldProperties(bpy.types.PropertyGroup):
     scale = FloatProperty(default=0.01, name = "Scale", min = 0.0005, max = 1, step = 0.01)
     up_axis = EnumProperty(default = "-Y", name = "Up axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
     forward_axis = EnumProperty(default = "Z", name = "Forward axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
-    position_node_start = StringProperty()
+    position_nodes = StringProperty(name = "Position nodes")
+    ai_nodes = StringProperty(name = "AI nodes")
+    lod_levels = IntProperty(default = 1, name = "Levels of detail", min = 1, max = 8)
+    lod_ratio = FloatProperty(default = 0.5, name = "Level ratio", min = 0.05, max = 0.95)
+    optimize_order = BoolProperty(default = False, name = "Optimize vertex cache")
+    raster_size = IntProperty(default = 1024, name = "Hitbox grid size", min = 16, max = 65536)
+    sort_faces = BoolProperty(default = False, name = "Sort faces by render state", description = "Sorts the faces by texture page and then by the translucent, additive and double sided flags")
+    deduplicate_models = BoolProperty(default = True, name = "Share duplicate models", description = "Writes meshes with the same geometry once and points all their instances at that model")
+    texture_atlas = BoolProperty(default = False, name = "Pack textures into atlas", description = "Packs the textures of the exported meshes into as few pages as possible and moves the UVs onto them")
+    atlas_size = IntProperty(default = 256, name = "Atlas page size", min = 16, max = 4096)
+    visiboxes = BoolProperty(default = False, name = "Generate visiboxes", description = "Casts rays from along the track to every mesh of the W-file and writes cube boxes around the meshes that can't be seen")
+    camera_height = FloatProperty(default = 1, name = "Camera height", min = 0, step = 10)
+    camera_spacing = FloatProperty(default = 2, name = "Camera spacing", min = 0.01, step = 10)
+    overlay_faces = BoolProperty(default = True, name = "Hitbox faces", description = "Colors the faces of the hitbox by material", update = redraw_views)
+    overlay_grid = BoolProperty(default = True, name = "Lookup grid", description = "Colors the cells of the collision lookup grid by the number of polyhedrons in them", update = redraw_views)
+    overlay_bounds = BoolProperty(default = False, name = "Mesh bounds", description = "Draws the bounding box of each mesh in the W-file", update = redraw_views)
 
 class RevoltWheelProperties(bpy.types.PropertyGroup):
     object = StringProperty(name = "Object")
@@ -252,6 +749,9 @@ class RevoltCarProperties(bpy.types.PropertyGroup):
     wheel2 = PointerProperty(type = RevoltWheelProperties)
     wheel3 = PointerProperty(type = RevoltWheelProperties)
     current_wheel = EnumProperty(items = [("0", "0", "0"), ("1", "1", "1"), ("2", "2", "2"), ("3", "3", "3")])
+    scale = FloatProperty(default=0.1, name = "Scale", min = 0.0005, max = 1, step = 0.01)
+    up_axis = EnumProperty(default = "-Y", name = "Up axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
+    forward_axis = EnumProperty(default = "Z", name = "Forward axis", items = (("X", "X", "X"), ("Y", "Y", "Y"), ("Z", "Z", "Z"), ("-X", "-X", "-X"), ("-Y", "-Y", "-Y"), ("-Z", "-Z", "-Z")))
 
 materials = [
     ("MATERIAL_NONE", "None", "None", "", -1),
@@ -316,6 +816,27 @@ def set_face_property(self, value, mask):
             for arg in args:
                 face[layer] = face[layer] | mask if value else face[layer] & ~mask
 
+def get_node_value(self, name, default):
+    bm = bmesh.from_edit_mesh(bpy.context.object.data)
+    layers = bm.verts.layers.float if isinstance(default, float) else bm.verts.layers.int
+    layer = layers.get(name) or layers.new(name)
+    selected_verts = [vert for vert in bm.verts if vert.select]
+    return selected_verts[0][layer] if len(selected_verts) > 0 else default
+
+def set_node_value(self, value, name):
+    bm = bmesh.from_edit_mesh(bpy.context.object.data)
+    layers = bm.verts.layers.float if isinstance(value, float) else bm.verts.layers.int
+    layer = layers.get(name) or layers.new(name)
+    for vert in bm.verts:
+        if vert.select:
+            vert[layer] = value
+
+def get_first_node(self):
+    return get_node_value(self, "revolt_start_node", 0) != 0
+
+def set_first_node(self, value):
+    set_node_value(self, 1 if value else 0, "revolt_start_node")
+
 class RevoltMeshProperties(bpy.types.PropertyGroup):
     face_material = EnumProperty(name = "Material", items = materials, get = get_face_material, set = set_face_material)
     face_double_sided = BoolProperty(name = "Double sided", get = lambda s: bool(get_face_property(s) & 2), set = lambda s,v: set_face_property(s, v, 2))
@@ -328,6 +849,10 @@ class RevoltMeshProperties(bpy.types.PropertyGroup):
     export_as_prm = BoolProperty(name = "Export as mesh (.PRM)")
     export_as_ncp = BoolProperty(name = "Export as hitbox (.NCP)")
     export_as_w = BoolProperty(name = "Export as world (.W)")
+    node_start = BoolProperty(name = "Start node", get = get_first_node, set = set_first_node)
+    node_priority = IntProperty(name = "Priority", min = 0, max = 255, get = lambda s: get_node_value(s, "revolt_priority", 0), set = lambda s,v: set_node_value(s, v, "revolt_priority"))
+    node_racing_line = FloatProperty(name = "Racing line", min = 0, max = 1, get = lambda s: get_node_value(s, "revolt_racing_line", 0.5), set = lambda s,v: set_node_value(s, v, "revolt_racing_line"))
+    node_speed = FloatProperty(name = "Speed", min = 0, get = lambda s: get_node_value(s, "revolt_speed", 1.0), set = lambda s,v: set_node_value(s, v, "revolt_speed"))
 
 object_types = [
     ("OBJECT_TYPE_CAR", "Car", "Car", "", -1),
@@ -377,14 +902,12 @@ def set_flag_long(self, value, start):
     for i,b in enumerate(struct.pack("=l", value), start):
         self.flags[i] = b
 
-def get_first_node(self):
-    return bpy.context.object.name == bpy.context.scene.revolt_world.position_node_start
-
-def set_first_node(self, value):
-    bpy.context.scene.revolt_world.position_node_start = bpy.context.object.name if value else ""
-
 class RevoltObjectProperties(bpy.types.PropertyGroup):
-    type = EnumProperty(name = "Type", items = (("NONE", "None", "None"), ("OBJECT", "Object", "Object"), ("TRIGGER", "Trigger", "Trigger")))
+    type = EnumProperty(name = "Type", items = (("NONE", "None", "None"), ("OBJECT", "Object", "Object"), ("TRIGGER", "Trigger", "Trigger"), ("ZONE", "Track zone", "Track zone"), ("LIGHT", "Light", "Light")))
+    zone_id = IntProperty(name = "Zone ID", min = 0, description = "Order in which the zones are passed during a lap")
+    light_normal = BoolProperty(name = "Only facing faces", description = "Only lights faces that are turned towards the light")
+    light_flag = IntProperty(name = "Light flags", min = 0, max = 255)
+    light_speed = IntProperty(name = "Flicker speed", min = 0, max = 255)
     object_type = EnumProperty(name = "Object type", items = object_types)
     flags = IntVectorProperty(name = "Flags", size = 16)
     flag1_long = IntProperty(get = lambda s: get_flag_long(s, 0), set = lambda s,v: set_flag_long(s, v, 0))
@@ -404,6 +927,8 @@ def register():
     bpy.types.Object.revolt = PointerProperty(type = RevoltObjectProperties)
 
 def unregister():
+    from . import overlay
+    overlay.disable()
     bpy.utils.unregister_module(__name__)
     bpy.types.INFO_MT_file_import.remove(menu_func_import)
     bpy.types.INFO_MT_file_export.remove(menu_func_export)
@@ -0,0 +1,75 @@
+# Packs textures into atlas pages and moves UVs into the atlas. Doesn't use bpy: images are numpy arrays of RGBA pixels with the bottom row first, like Blender stores them.
+
+import numpy
+
+# Returns the size an image is scaled to so it fits on a page together with the padding around it. Images are only made smaller.
+def fit_size(width, height, page_size, padding):
+    space = page_size - 2 * padding
+    scale = min(1.0, float(space) / max(width, height, 1))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+# Scales pixels (height, width, 4) to a new size by picking the nearest pixel.
+def resize(pixels, width, height):
+    rows = numpy.minimum((numpy.arange(height) + 0.5) * pixels.shape[0] / height, pixels.shape[0] - 1).astype(numpy.int64)
+    columns = numpy.minimum((numpy.arange(width) + 0.5) * pixels.shape[1] / width, pixels.shape[1] - 1).astype(numpy.int64)
+    return pixels[rows[:, None], columns[None, :]]
+
+# Packs rectangles into as few pages as possible. Rectangles are placed on shelves, tallest first, and each goes on the first shelf it fits on.
+# sizes is a list of (width, height). Returns an array of (page, x, y) for each rectangle and the number of pages.
+def pack(sizes, page_size):
+    placements = numpy.zeros((len(sizes), 3), dtype = numpy.int64)
+    pages = []  # Each page is [used height, shelves] and each shelf is [y, height, used width].
+    for i in sorted(range(len(sizes)), key = lambda i: (-sizes[i][1], -sizes[i][0])):
+        width, height = sizes[i]
+        if width > page_size or height > page_size:
+            raise ValueError("Rectangle of " + str(width) + "x" + str(height) + " doesn't fit on a page of " + str(page_size))
+        placed = False
+        for page_index, page in enumerate(pages):
+            for shelf in page[1]:
+                if height <= shelf[1] and shelf[2] + width <= page_size:
+                    placements[i] = (page_index, shelf[2], shelf[0])
+                    shelf[2] += width
+                    placed = True
+                    break
+            if not placed and page[0] + height <= page_size:
+                page[1].append([page[0], height, width])
+                placements[i] = (page_index, 0, page[0])
+                page[0] += height
+                placed = True
+            if placed:
+                break
+        if not placed:
+            pages.append([height, [[0, height, width]]])
+            placements[i] = (len(pages) - 1, 0, 0)
+    return placements, len(pages)
+
+# Draws the images onto the pages. Each image is surrounded by padding filled with its edge pixels so filtering doesn't bleed in colors of other images.
+# placements are the results of pack for the padded sizes. Returns a list of (page_size, page_size, 4) arrays.
+def compose(images, placements, page_count, page_size, padding):
+    pages = [numpy.zeros((page_size, page_size, 4), dtype = numpy.float32) for i in range(page_count)]
+    for pixels, (page, x, y) in zip(images, placements.tolist()):
+        padded = numpy.pad(pixels, ((padding, padding), (padding, padding), (0, 0)), mode = "edge") if padding > 0 else pixels
+        pages[page][y:y + padded.shape[0], x:x + padded.shape[1]] = padded
+    return pages
+
+# Moves the UVs of each loop into the area of its image on the atlas. loop_starts are the first loops of each face, face_images the image of each face or -1.
+# areas are (x, y, width, height) of each image on its page in pixels. UVs are first moved by whole tiles so each face starts in the 0 to 1 range.
+# Faces whose UVs cover more than one tile can't repeat on the atlas, they're clamped to the image. Returns the new UVs and the number of clamped faces.
+def remap_uvs(uvs, loop_starts, face_images, areas, page_size):
+    uvs = numpy.asarray(uvs, dtype = numpy.float64).reshape(-1, 2)
+    if len(uvs) == 0 or len(loop_starts) == 0:
+        return uvs, 0
+    loop_totals = numpy.diff(numpy.append(loop_starts, len(uvs)))
+    loop_faces = numpy.repeat(numpy.arange(len(loop_starts)), loop_totals)
+    shifts = numpy.floor(numpy.minimum.reduceat(uvs, loop_starts, axis = 0))
+    local = uvs - shifts[loop_faces]
+    clamped = numpy.any(numpy.maximum.reduceat(local, loop_starts, axis = 0) > 1 + 1e-6, axis = 1) & (face_images >= 0)
+    local = numpy.clip(local, 0, 1)
+
+    areas = numpy.asarray(areas, dtype = numpy.float64).reshape(-1, 4)
+    loop_images = face_images[loop_faces]
+    mapped = loop_images >= 0
+    area = areas[loop_images[mapped]]
+    result = uvs.copy()
+    result[mapped] = (area[:, :2] + local[mapped] * area[:, 2:]) / page_size
+    return result, int(numpy.sum(clamped))
@@ -0,0 +1,102 @@
+# Bakes lighting into vertex colors. Shadows and ambient occlusion are found by casting rays against the triangles of the track (see raycast.TriangleTree).
+# Nothing in here may import bpy, so chunks of corners can be lit in worker processes.
+
+import os
+import numpy
+from . import workers, raycast
+
+# Number of jobs for each worker process. More jobs than processes even out chunks that take longer than others.
+jobs_per_process = 4
+
+# Returns directions spread evenly over the hemisphere around +Z. They're denser towards the pole so each direction counts the same for cosine weighted occlusion.
+def hemisphere_directions(count):
+    i = numpy.arange(count) + 0.5
+    radius = numpy.sqrt(i / count)
+    angle = i * numpy.pi * (3 - numpy.sqrt(5))
+    return numpy.column_stack([radius * numpy.cos(angle), radius * numpy.sin(angle), numpy.sqrt(1 - radius ** 2)])
+
+# Turns the hemisphere directions around each normal. Returns (directions, points, 3).
+def orient_directions(directions, normals):
+    helper = numpy.where((numpy.abs(normals[:, 0]) < 0.9)[:, None], [1.0, 0, 0], [0, 1.0, 0])
+    tangents = numpy.cross(helper, normals)
+    tangents /= numpy.sqrt(numpy.sum(tangents ** 2, axis = 1))[:, None]
+    bitangents = numpy.cross(normals, tangents)
+    return directions[:, 0, None, None] * tangents + directions[:, 1, None, None] * bitangents + directions[:, 2, None, None] * normals
+
+# Lights points with the given normals. The rays are cast against tree. lights is a list of (kind, vector, color, energy, distance) where kind is "POINT" with a position or "SUN" with a direction.
+# Returns a color for each point between 0 and 1 and the share of the hemisphere around each point that isn't blocked.
+def light_points(points, normals, tree, lights, ambient, ao_samples, ao_distance, shadow_distance, bias):
+    origins = points + normals * bias
+    colors = numpy.zeros((len(points), 3))
+
+    # The ambient light is reduced by the share of the hemisphere that is blocked within ao_distance.
+    occlusion = numpy.ones(len(points))
+    if ao_samples > 0 and len(points) > 0:
+        directions = orient_directions(hemisphere_directions(ao_samples), normals).reshape(-1, 3)
+        blocked = tree.blocked(numpy.tile(origins, (ao_samples, 1)), directions, numpy.full(len(directions), float(ao_distance)))
+        occlusion = 1 - numpy.mean(blocked.reshape(ao_samples, -1), axis = 0)
+    colors += numpy.asarray(ambient, dtype = numpy.float64)[None, :] * occlusion[:, None]
+
+    for kind, vector, color, energy, distance in lights:
+        vector = numpy.asarray(vector, dtype = numpy.float64)
+        if kind == "SUN":
+            directions = numpy.tile(-vector / numpy.sqrt(numpy.sum(vector ** 2)), (len(points), 1))
+            lengths = numpy.full(len(points), float(shadow_distance))
+            falloff = numpy.full(len(points), float(energy))
+        else:
+            offsets = vector[None, :] - origins
+            lengths = numpy.sqrt(numpy.sum(offsets ** 2, axis = 1))
+            directions = offsets / numpy.maximum(lengths, 1e-12)[:, None]
+
+            # Inverse square falloff that has half the energy at the distance of the lamp.
+            falloff = energy * distance ** 2 / (distance ** 2 + lengths ** 2)
+
+        # Only corners facing the light need a shadow ray.
+        facing = numpy.sum(normals * directions, axis = 1)
+        lit = numpy.nonzero(facing > 0)[0]
+        visible = numpy.zeros(len(points), dtype = bool)
+        visible[lit] = ~tree.blocked(origins[lit], directions[lit], lengths[lit])
+        colors += numpy.asarray(color, dtype = numpy.float64)[None, :] * (numpy.where(visible, facing, 0) * falloff)[:, None]
+    return numpy.clip(colors, 0, 1), occlusion
+
+# Used with workers.parallel_map which only passes one argument. Each job is a list of chunks of points, which are lit one after another so the arrays of rays stay small.
+def light_chunks_job(job):
+    chunks, tree, lights, ambient, ao_samples, ao_distance, shadow_distance, bias = job
+    return [light_points(points, normals, tree, lights, ambient, ao_samples, ao_distance, shadow_distance, bias) for points, normals in chunks]
+
+# Bakes the lighting for points on the surfaces of triangles. normals have to be normalized. Equal points with equal normals are only lit once.
+# Returns the color of each point and the share of its hemisphere that isn't blocked within ao_distance (1 if ao_samples is 0).
+# The points are sorted into chunks of nearby points so the rays of a chunk visit the same parts of the tree. The chunks are lit in worker processes, which all get the same tree.
+def bake(triangles, points, normals, lights, ambient = (0.2, 0.2, 0.2), ao_samples = 16, ao_distance = 1.0, shadow_distance = 100.0, chunk_size = 256):
+    triangles = numpy.asarray(triangles, dtype = numpy.float64).reshape(-1, 3, 3)
+    points = numpy.asarray(points, dtype = numpy.float64).reshape(-1, 3)
+    normals = numpy.asarray(normals, dtype = numpy.float64).reshape(-1, 3)
+    if len(points) == 0:
+        return numpy.zeros((0, 3)), numpy.zeros(0)
+
+    # Rays start a bit above the surface so they don't hit the triangle they start on.
+    extent = float(numpy.max(points.max(axis = 0) - points.min(axis = 0))) if len(points) > 1 else 1.0
+    bias = max(extent, 1e-6) * 1e-5
+
+    # Removes duplicate points. Corners of neighbouring faces often share the position and normal.
+    keys = numpy.ascontiguousarray(numpy.concatenate([numpy.round(points / bias), numpy.round(normals * 1000)], axis = 1).astype(numpy.int64))
+    unique_keys, first, inverse = numpy.unique(keys.view(numpy.dtype((numpy.void, keys.itemsize * 6))).ravel(), return_index = True, return_inverse = True)
+    unique_points, unique_normals = points[first], normals[first]
+
+    # Sorts the points along a coarse grid so each chunk covers a small area.
+    low = unique_points.min(axis = 0)
+    cells = numpy.floor((unique_points - low) / max(extent / 32, 1e-6)).astype(numpy.int64)
+    order = numpy.lexsort((cells[:, 2], cells[:, 1], cells[:, 0]))
+    chunks = [order[start:start + chunk_size] for start in range(0, len(order), chunk_size)]
+
+    # The tree is sent once with each job, so the chunks are grouped into a few jobs for each process.
+    tree = raycast.TriangleTree(triangles)
+    job_count = min(len(chunks), (os.cpu_count() or 1) * jobs_per_process)
+    groups = [chunks[i * len(chunks) // job_count:(i + 1) * len(chunks) // job_count] for i in range(job_count)]
+    jobs = [([(unique_points[chunk], unique_normals[chunk]) for chunk in group], tree, lights, ambient, ao_samples, ao_distance, shadow_distance, bias) for group in groups]
+
+    colors, occlusion = numpy.zeros((len(unique_points), 3)), numpy.ones(len(unique_points))
+    for group, group_results in zip(groups, workers.parallel_map(light_chunks_job, jobs)):
+        for chunk, (chunk_colors, chunk_occlusion) in zip(group, group_results):
+            colors[chunk], occlusion[chunk] = chunk_colors, chunk_occlusion
+    return colors[inverse.ravel()], occlusion[inverse.ravel()]
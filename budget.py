@@ -0,0 +1,217 @@
+# Estimates what an exported track costs the game: triangles per mesh and texture page, translucent fill, collision tests, instances and memory.
+# Everything is read from the files of the track, and nothing in here may import bpy, so whole folders of tracks can be measured in worker processes.
+
+import os, json, struct, time
+import numpy
+from . import formats, workers, collision, validate
+
+# Limits a track is compared against. Values above a limit are reported as issues.
+default_budgets = {
+    "world_triangles": 40000,
+    "mesh_triangles": 2000,
+    "page_triangles": 20000,
+    "instance_triangles": 20000,
+    "instances": 500,
+    "objects": 100,
+    "translucent_ratio": 0.25,
+    "texture_pages": 10,
+    "average_tests": 64,
+    "largest_cell": 256,
+    "video_bytes": 4 * 1024 * 1024,
+    "memory_bytes": 16 * 1024 * 1024,
+    }
+
+# Bytes per texel of the textures in video memory. The game converts its bitmaps to 16 bits.
+texture_bytes_per_texel = 2
+
+# Spacing of the sampled positions used to measure the collision tests (in file units).
+sample_spacing = 64.0
+
+# Returns the width and height of a BMP-file or None if it can't be read.
+def bitmap_size(filepath):
+    fh = open(filepath, "rb")
+    header = fh.read(26)
+    fh.close()
+    if len(header) < 26 or header[:2] != b"BM":
+        return None
+    width, height = struct.unpack("<ll", header[18:26])
+    return abs(width), abs(height)
+
+# Returns the number of triangles each polygon is drawn with. A quad counts as two.
+def polygon_triangles(polygons):
+    return 1 + (polygons["type"] & 1)
+
+# Returns the area of each polygon.
+def polygon_areas(polygons, positions, indices):
+    corners = positions[numpy.clip(indices, 0, max(len(positions) - 1, 0))].astype(numpy.float64)
+    area = numpy.sqrt(numpy.sum(numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]) ** 2, axis = 1))
+    area += numpy.where(polygons["type"] & 1, numpy.sqrt(numpy.sum(numpy.cross(corners[:, 2] - corners[:, 0], corners[:, 3] - corners[:, 0]) ** 2, axis = 1)), 0)
+    return area / 2
+
+# Adds the triangles of polygons to the count of each texture page. Untextured polygons are counted under -1.
+def add_page_triangles(pages, polygons, repeat = 1):
+    triangles = polygon_triangles(polygons)
+    for page in numpy.unique(polygons["texture"]).tolist():
+        pages[page] = pages.get(page, 0) + int(numpy.sum(triangles[polygons["texture"] == page])) * repeat
+
+# Measures the meshes of a W-file. Translucent and additive polygons are drawn on top of what's behind them,
+# so their share of the total area is how much extra fill they cost when everything is in view.
+def world_budget(filepath, pages):
+    world = formats.load(filepath)
+    polygons = world.mesh.polygons
+    indices = world.global_indices()
+    triangles = polygon_triangles(polygons)
+    summed = numpy.concatenate([[0], numpy.cumsum(triangles)])
+    mesh_triangles = summed[world.polygon_offsets[1:]] - summed[world.polygon_offsets[:-1]]
+    areas = polygon_areas(polygons, world.mesh.vertices["position"], indices)
+    blended = (polygons["type"] & (4 | 256)) != 0
+    add_page_triangles(pages, polygons)
+    return {
+        "meshes": len(world),
+        "triangles": int(numpy.sum(triangles)),
+        "vertices": len(world.mesh.vertices),
+        "mesh_triangles": mesh_triangles.astype(numpy.int64).tolist(),
+        "translucent_triangles": int(numpy.sum(triangles[blended])),
+        "translucent_ratio": round(float(numpy.sum(areas[blended]) / max(numpy.sum(areas), 1e-12)), 4),
+        "double_sided_triangles": int(numpy.sum(triangles[(polygons["type"] & 2) != 0])),
+        "bytes": world.nbytes(),
+        }
+
+# Measures the instances of a FIN-file. Every instance draws all triangles of its model, but each model is only loaded once.
+def instance_budget(filepath, pages):
+    path = os.path.dirname(filepath) + os.sep
+    names = formats.load_records(filepath, formats.instance_dtype)["name"]
+    unique_names, counts = numpy.unique(names, return_counts = True)
+    triangles, model_bytes, missing = 0, 0, 0
+    models = {}
+    for name, count in zip(unique_names.tolist(), counts.tolist()):
+        mesh_path = formats.find_model_path(path, name.split(b"\x00")[0].decode("ASCII", "ignore").lower())
+        if mesh_path == None:
+            missing += count
+            continue
+        mesh = formats.load(mesh_path)
+        models[os.path.basename(mesh_path)] = mesh.triangle_count()
+        triangles += mesh.triangle_count() * count
+        model_bytes += mesh.nbytes()
+        add_page_triangles(pages, mesh.polygons, count)
+    return {"instances": len(names), "models": len(models), "missing_models": missing, "triangles": triangles, "model_triangles": models, "bytes": model_bytes + os.path.getsize(filepath)}
+
+# Counts the objects of a FOB-file by type.
+def object_budget(filepath):
+    types = formats.load_records(filepath, formats.object_dtype)["type"]
+    unique_types, counts = numpy.unique(types, return_counts = True)
+    return {"objects": len(types), "types": {str(t): c for t, c in zip(unique_types.tolist(), counts.tolist())}, "bytes": os.path.getsize(filepath)}
+
+# Measures the hitbox and its lookup grid. The tests are counted for positions spread evenly over the track.
+def hitbox_budget(filepath):
+    polyhedra = formats.load_hitbox(filepath)
+    result = {"polyhedra": len(polyhedra), "bytes": os.path.getsize(filepath)}
+    grid = formats.load_hitbox_grid(filepath)
+    if grid == None:
+        return result
+    header, counts, indices = grid
+    tests = collision.replay(grid, collision.sample_area(polyhedra["bbox"], sample_spacing))[0]
+    used = counts[counts > 0]
+    result.update({
+        "raster_size": header[4],
+        "cells": [int(header[2]), int(header[3])],
+        "empty_cells": int(numpy.sum(counts == 0)),
+        "average_cell": round(float(used.mean()), 2) if len(used) > 0 else 0.0,
+        "largest_cell": int(counts.max()) if len(counts) > 0 else 0,
+        "average_tests": round(float(tests.mean()), 2) if len(tests) > 0 else 0.0,
+        "worst_tests": int(tests.max()) if len(tests) > 0 else 0,
+        })
+    return result
+
+# Measures the texture pages next to the W-file.
+def texture_budget(filepath):
+    pages = {}
+    for page in validate.find_texture_pages(filepath).tolist():
+        name = os.path.basename(os.path.dirname(filepath)).lower() + chr(97 + page) + ".bmp"
+        found = [f for f in os.listdir(os.path.dirname(filepath)) if f.lower() == name]
+        size = bitmap_size(os.path.join(os.path.dirname(filepath), found[0])) if len(found) > 0 else None
+        if size != None:
+            pages[chr(97 + page)] = list(size)
+    return {"pages": pages, "video_bytes": sum([width * height * texture_bytes_per_texel for width, height in pages.values()])}
+
+# Measures a track and compares it to the budgets. Returns the numbers and an issue for each budget that is exceeded.
+def analyze_track(filepath, budgets = None):
+    start_time = time.time()
+    budgets = dict(default_budgets, **(budgets or {}))
+    base = os.path.splitext(filepath)[0]
+    pages = {}
+    result = {"track": filepath}
+    issues = []
+
+    # Files that can't be read at all are reported instead of stopping the whole run.
+    def run(key, measure, *args):
+        try:
+            result[key] = measure(*args)
+        except Exception as error:
+            issues.append(validate.issue("unreadable-file", "error", args[0], str(error)))
+
+    run("world", world_budget, filepath, pages)
+    if os.path.isfile(base + ".fin"):
+        run("instances", instance_budget, base + ".fin", pages)
+    if os.path.isfile(base + ".fob"):
+        run("objects", object_budget, base + ".fob")
+    if os.path.isfile(base + ".ncp"):
+        run("hitbox", hitbox_budget, base + ".ncp")
+    run("textures", texture_budget, filepath)
+    result["page_triangles"] = {(chr(97 + page) if page >= 0 else "none"): count for page, count in sorted(pages.items())}
+
+    # Video memory holds the textures. The rest of the data is estimated from its size in the files.
+    world, instances, objects, hitbox, textures = [result.get(key, {}) for key in ("world", "instances", "objects", "hitbox", "textures")]
+    result["video_bytes"] = textures.get("video_bytes", 0)
+    result["memory_bytes"] = sum([part.get("bytes", 0) for part in (world, instances, objects, hitbox)])
+
+    def over(rule, value, message, items = None, filepath = filepath):
+        if value > budgets[rule]:
+            issues.append(validate.issue("over-budget-" + rule.replace("_", "-"), "warning", filepath, message + " (" + str(value) + " > " + str(budgets[rule]) + ")", items))
+
+    if len(world) > 0:
+        over("world_triangles", world["triangles"], "Too many triangles in the W-file")
+        heavy = numpy.nonzero(numpy.array(world["mesh_triangles"], dtype = numpy.int64) > budgets["mesh_triangles"])[0]
+        if len(heavy) > 0:
+            issues.append(validate.issue("over-budget-mesh-triangles", "warning", filepath, "Meshes with more than " + str(budgets["mesh_triangles"]) + " triangles", heavy))
+        over("translucent_ratio", world["translucent_ratio"], "Too much translucent area")
+    for page, count in result["page_triangles"].items():
+        over("page_triangles", count, "Too many triangles on texture page " + page)
+    if len(instances) > 0:
+        over("instances", instances["instances"], "Too many instances", filepath = base + ".fin")
+        over("instance_triangles", instances["triangles"], "Too many triangles in instances", filepath = base + ".fin")
+    if len(objects) > 0:
+        over("objects", objects["objects"], "Too many objects", filepath = base + ".fob")
+    if "average_tests" in hitbox:
+        over("average_tests", hitbox["average_tests"], "Too many collision tests per position", filepath = base + ".ncp")
+        over("largest_cell", hitbox["largest_cell"], "Too many polyhedrons in one grid cell", filepath = base + ".ncp")
+    over("texture_pages", len(textures.get("pages", {})), "Too many texture pages")
+    over("video_bytes", result["video_bytes"], "Textures need too much video memory")
+    over("memory_bytes", result["memory_bytes"], "Track data needs too much memory")
+
+    result["issues"] = issues
+    result["seconds"] = round(time.time() - start_time, 3)
+    return result
+
+# Used with workers.parallel_map which only passes one argument.
+def analyze_track_job(job):
+    return analyze_track(*job)
+
+# Measures all tracks found in the paths with one worker process per track. The report is written as JSON if report_path is supplied.
+def analyze_tracks(paths, report_path = None, budgets = None):
+    start_time = time.time()
+    tracks = [track for path in paths for track in validate.find_tracks(path)]
+    results = workers.parallel_map(analyze_track_job, [(track, budgets) for track in tracks])
+
+    # Number of tracks over each budget.
+    summary = {}
+    for result in results:
+        for rule in set([found["rule"] for found in result["issues"]]):
+            summary[rule] = summary.get(rule, 0) + 1
+    report = {"version": 1, "seconds": round(time.time() - start_time, 3), "budgets": dict(default_budgets, **(budgets or {})), "summary": summary, "tracks": results}
+
+    if report_path != None:
+        fh = open(report_path, "w")
+        json.dump(report, fh, indent = 2, sort_keys = True)
+        fh.close()
+    return report
@@ -0,0 +1,158 @@
+# Collision lookup grids of NCP-files. The game only tests the polyhedrons in the grid cell a car is in, so the cell size decides how many polyhedrons are tested per query.
+# The simulator replays positions through a grid to measure that cost without running the game. Nothing in here may import bpy.
+
+import struct, json
+from math import ceil
+import numpy
+from . import formats
+
+# Returns the first and last cell (exclusive) covered by each range along one axis. Ranges lying exactly on a cell border still get one cell.
+def cell_ranges(low, high, origin, raster_size, size):
+    first = numpy.clip(numpy.floor((low - origin) / raster_size).astype(numpy.int64), 0, size - 1)
+    last = numpy.clip(numpy.ceil((high - origin) / raster_size).astype(numpy.int64), first + 1, size)
+    return first, last
+
+# Lists the cells covered by each box. Returns the index of the box and the cell for every pair.
+def covered_cells(from_x, to_x, from_z, to_z, x_size):
+    widths = to_x - from_x
+    cell_counts = widths * (to_z - from_z)
+    boxes = numpy.repeat(numpy.arange(len(cell_counts)), cell_counts)
+    local = numpy.arange(int(numpy.sum(cell_counts))) - numpy.repeat(numpy.cumsum(cell_counts) - cell_counts, cell_counts)
+    x = from_x[boxes] + local % widths[boxes]
+    z = from_z[boxes] + local // widths[boxes]
+    return boxes, x + z * x_size
+
+# Builds the lookup grid for polyhedrons with bounding boxes stored like in NCP-files (min x, max x, min y, max y, min z, max z).
+# Returns the grid header, the number of polyhedrons in each cell and the polyhedron indices one cell after another, like formats.load_hitbox_grid.
+def build_grid(bounds, raster_size = 1024):
+    bounds = numpy.asarray(bounds, dtype = numpy.float64).reshape(-1, 6)
+    if len(bounds) == 0:
+        return (0.0, 0.0, 0, 0, float(raster_size)), numpy.zeros(0, dtype = numpy.int64), numpy.zeros(0, dtype = numpy.int64)
+    min_x, max_x = bounds[:, 0].min(), bounds[:, 1].max()
+    min_z, max_z = bounds[:, 4].min(), bounds[:, 5].max()
+    x_size = max(int(ceil((max_x - min_x) / raster_size)), 1)
+    z_size = max(int(ceil((max_z - min_z) / raster_size)), 1)
+
+    from_x, to_x = cell_ranges(bounds[:, 0], bounds[:, 1], min_x, raster_size, x_size)
+    from_z, to_z = cell_ranges(bounds[:, 4], bounds[:, 5], min_z, raster_size, z_size)
+    polyhedra, cells = covered_cells(from_x, to_x, from_z, to_z, x_size)
+
+    # Each cell lists its polyhedrons in ascending order.
+    order = numpy.argsort(cells, kind = "mergesort")
+    counts = numpy.bincount(cells, minlength = x_size * z_size)
+    return (float(min_x), float(min_z), x_size, z_size, float(raster_size)), counts, polyhedra[order]
+
+# Returns sample positions (x and z) spread evenly over the area covered by polyhedrons, one in the middle of every spacing sized cell that has a polyhedron.
+def sample_area(bounds, spacing):
+    header, counts, indices = build_grid(bounds, spacing)
+    cells = numpy.nonzero(counts)[0]
+    x = header[0] + (cells % header[2] + 0.5) * spacing
+    z = header[1] + (cells // header[2] + 0.5) * spacing
+    return numpy.array([x, z]).T
+
+# Reads positions from a text file with one "x y z" position per line, e.g. a recorded car path. Lines starting with ";" or "#" are skipped. Returns x and z.
+def load_path(filepath):
+    points = []
+    fh = open(filepath, "r")
+    for line in fh:
+        words = line.split(";")[0].split("#")[0].replace(",", " ").split()
+        if len(words) >= 3:
+            points.append((float(words[0]), float(words[2])))
+    fh.close()
+    return numpy.array(points, dtype = numpy.float64).reshape(-1, 2)
+
+# Replays positions (x and z) through a grid. A query tests all polyhedrons in each cell covered by a square of radius around the position.
+# Returns the number of polyhedrons tested by each query and the total number tested in each cell.
+def replay(grid, points, radius = 0.0):
+    header, counts, indices = grid
+    origin_x, origin_z, x_size, z_size, raster_size = header
+    x_size, z_size = int(x_size), int(z_size)
+    points = numpy.asarray(points, dtype = numpy.float64).reshape(-1, 2)
+
+    # Positions outside of the grid don't test anything.
+    inside = (points[:, 0] + radius >= origin_x) & (points[:, 0] - radius <= origin_x + x_size * raster_size)
+    inside &= (points[:, 1] + radius >= origin_z) & (points[:, 1] - radius <= origin_z + z_size * raster_size)
+    tests = numpy.zeros(len(points), dtype = numpy.int64)
+    heat = numpy.zeros(x_size * z_size, dtype = numpy.int64)
+    if x_size * z_size == 0 or not numpy.any(inside):
+        return tests, heat.reshape(z_size, x_size)
+
+    queries = numpy.nonzero(inside)[0]
+    from_x, to_x = cell_ranges(points[queries, 0] - radius, points[queries, 0] + radius, origin_x, raster_size, x_size)
+    from_z, to_z = cell_ranges(points[queries, 1] - radius, points[queries, 1] + radius, origin_z, raster_size, z_size)
+    if radius == 0:
+        to_x, to_z = from_x + 1, from_z + 1
+    boxes, cells = covered_cells(from_x, to_x, from_z, to_z, x_size)
+    tests[queries] = numpy.bincount(boxes, counts[cells], minlength = len(queries)).astype(numpy.int64)
+    heat += numpy.bincount(cells, counts[cells], minlength = len(heat)).astype(numpy.int64)
+    return tests, heat.reshape(z_size, x_size)
+
+# Number of bytes the grid takes up in the file and in memory.
+def grid_size(grid):
+    header, counts, indices = grid
+    return 20 + 4 * (len(counts) + len(indices))
+
+# Simulates queries with each raster size. Returns a list with the statistics of each size and the heat map of each size.
+def simulate(polyhedra, points, raster_sizes, radius = 0.0):
+    results = []
+    heat_maps = []
+    for raster_size in raster_sizes:
+        grid = build_grid(polyhedra["bbox"], raster_size)
+        tests, heat = replay(grid, points, radius)
+        header, counts, indices = grid
+        results.append({
+            "raster_size": raster_size,
+            "cells": [int(header[2]), int(header[3])],
+            "queries": len(tests),
+            "average_tests": float(numpy.mean(tests)) if len(tests) > 0 else 0.0,
+            "worst_tests": int(numpy.max(tests)) if len(tests) > 0 else 0,
+            "percentile_95": float(numpy.percentile(tests, 95)) if len(tests) > 0 else 0.0,
+            "largest_cell": int(numpy.max(counts)) if len(counts) > 0 else 0,
+            "grid_bytes": grid_size(grid),
+            "polyhedra_bytes": 2 + polyhedra.nbytes,
+            })
+        heat_maps.append(heat)
+    return results, heat_maps
+
+# Writes a heat map as a 24 bit BMP-file. Cells go from black over red to yellow with the number of tests. The first row of the grid ends up at the bottom.
+def write_heatmap(heat, filepath):
+    heat = numpy.asarray(heat, dtype = numpy.float64)
+    height, width = heat.shape if heat.size > 0 else (1, 1)
+    values = heat / heat.max() if heat.size > 0 and heat.max() > 0 else numpy.zeros((height, width))
+    pixels = numpy.zeros((height, width, 3), dtype = numpy.uint8)
+    pixels[:, :, 2] = numpy.clip(values * 2, 0, 1) * 255
+    pixels[:, :, 1] = numpy.clip(values * 2 - 1, 0, 1) * 255
+
+    # Rows are padded to 4 bytes.
+    row_size = (width * 3 + 3) // 4 * 4
+    rows = numpy.zeros((height, row_size), dtype = numpy.uint8)
+    rows[:, :width * 3] = pixels.reshape(height, -1)
+    fh = open(filepath, "wb")
+    fh.write(b"BM" + struct.pack("<lhhl", 54 + rows.nbytes, 0, 0, 54))
+    fh.write(struct.pack("<lllhhllllll", 40, width, height, 1, 24, 0, rows.nbytes, 2835, 2835, 0, 0))
+    fh.write(rows.tobytes())
+    fh.close()
+
+# Simulates an NCP-file with each raster size and writes a JSON report. A heat map of the tests per cell is written to heatmap_path if supplied.
+# Uses the positions in path_file if supplied, otherwise positions spread evenly over the track with spacing.
+def analyze(filepath, report_path, heatmap_path = None, raster_sizes = (256, 512, 1024, 2048), spacing = 64.0, radius = 0.0, path_file = None):
+    polyhedra = formats.load_hitbox(filepath)
+    points = load_path(path_file) if path_file else sample_area(polyhedra["bbox"], spacing)
+    results, heat_maps = simulate(polyhedra, points, raster_sizes, radius)
+
+    # The grid stored in the file is measured as well.
+    stored = formats.load_hitbox_grid(filepath)
+    report = {"file": filepath, "polyhedra": len(polyhedra), "queries": len(points), "radius": radius, "raster_sizes": results}
+    if stored != None:
+        tests, heat = replay(stored, points, radius)
+        report["stored_grid"] = {"raster_size": stored[0][4], "average_tests": float(numpy.mean(tests)) if len(tests) > 0 else 0.0, "worst_tests": int(numpy.max(tests)) if len(tests) > 0 else 0, "grid_bytes": grid_size(stored)}
+
+    # The heat map shows the grid stored in the file, or the first raster size if there's none.
+    if len(results) > 0:
+        report["fewest_tests_raster_size"] = min(results, key = lambda result: result["average_tests"])["raster_size"]
+    if heatmap_path != None and (stored != None or len(heat_maps) > 0):
+        write_heatmap(heat if stored != None else heat_maps[0], heatmap_path)
+    fh = open(report_path, "w")
+    json.dump(report, fh, indent = 2, sort_keys = True)
+    fh.close()
+    return report
@@ -1,15 +1,22 @@
 # File specifications can be found here: http://www.perror.de/rv/rvstruct.html
 # Re-Volt source code can be found here: http://revenant1.net/rvsource.rar
 
-import bpy, struct, bmesh, mathutils, re, os, glob
+import bpy, struct, bmesh, mathutils, re, os, glob, io, numpy
 from mathutils import Vector, Matrix, Color, Euler
-from math import atan, pi
+from math import atan, pi, ceil, sqrt
+from concurrent.futures import ThreadPoolExecutor
+from . import formats, snapshot, diff, spatial, nodes
+from .formats import transform_points
 
 # Decodes a mesh and add decoded faces and vertices to supplied bmesh.
 def decode_mesh(fh, bm, matrix, texture = None):
-    # Split up path.
-    path = fh.name.split(os.sep)
-    is_world = os.path.splitext(fh.name)[1].upper() == ".W"
+    data_to_bmesh(bm, formats.read_mesh(fh), matrix, fh.name, texture)
+
+# Adds the faces and vertices of formats.MeshData to supplied bmesh. Textures are looked up next to filepath unless a texture is supplied.
+# Found textures are stored in the textures dict which can be shared between several meshes.
+def data_to_bmesh(bm, mesh, matrix, filepath, texture = None, textures = None):
+    if textures == None:
+        textures = {}
     
     # Gets/creates texture-, uv- and color layers.
     tex_lay = bm.faces.layers.tex.active or bm.faces.layers.tex.new("Texture")
@@ -18,37 +25,121 @@ def decode_mesh(fh, bm, matrix, texture = None):
     alpha_lay = bm.loops.layers.color.get("Alpha") or bm.loops.layers.color.new("Alpha")
     type_lay = bm.faces.layers.int.get("revolt_face_type") or bm.faces.layers.int.new("revolt_face_type")
     
-    # Read some data from the file
-    polygon_count, vertex_count = struct.unpack("<hh", fh.read(4))
-    polygons = [struct.unpack("<hhhhhhBBBBBBBBBBBBBBBBffffffff", fh.read(60)) for x in range(polygon_count)]
-    vertices = [bm.verts.new(Vector(struct.unpack("<ffffff", fh.read(24))[:3]) * matrix) for x in range(vertex_count)]
+    # Transforms all vertices at once and converts the arrays to lists since that's a lot faster to loop through.
+    vertices = [bm.verts.new(co) for co in transform_points(mesh.vertices["position"], matrix).tolist()]
+    polygons = mesh.polygons
+    types, pages, indices = polygons["type"].tolist(), polygons["texture"].tolist(), polygons["vertices"].tolist()
+    colors, uvs = polygons["colors"].tolist(), polygons["uvs"].tolist()
     
     # Loops through each polygon
-    for data in polygons:
-        vertex_indices = data[2:(5 if data[0] % 2 == 0 else 6)]
+    for i, count in enumerate(mesh.corner_counts().tolist()):
+        vertex_indices = indices[i][:count]
         if len(vertex_indices) == len(set(vertex_indices)) and bm.faces.get([vertices[i] for i in vertex_indices]) == None:
             polygon = bm.faces.new([vertices[i] for i in vertex_indices])
-            polygon[type_lay] = data[0]
+            polygon[type_lay] = types[i]
             
-            if texture == None and data[1] >= 0:
-                texture_name = path[-2].lower() + chr(97 + data[1]) + ".bmp"
-                texture_path = os.sep.join(path[:-1]) + os.sep + texture_name
-                
-                image = bpy.data.images.get(texture_name)
-                if image == None and os.path.isfile(texture_path):
-                    image = bpy.data.images.load(texture_path)
-                polygon[tex_lay].image = image
+            if texture == None and pages[i] >= 0:
+                polygon[tex_lay].image = get_texture(filepath, pages[i], textures)
             else:
                 polygon[tex_lay].image = texture
             
-            for i in range(len(polygon.loops)):
-                polygon.loops[i][uv_lay].uv = [data[22 + i * 2], 1 - data[23 + i * 2]]
-                polygon.loops[i][color_lay] = Color(reversed([x / 255 for x in data[6 + i * 4:9 + i * 4]]))
-                polygon.loops[i][alpha_lay] = Color([1 - (data[9 + i * 4]  / 255)] * 3)
+            for n in range(len(polygon.loops)):
+                polygon.loops[n][uv_lay].uv = [uvs[i][n][0], 1 - uvs[i][n][1]]
+                polygon.loops[n][color_lay] = Color(reversed([x / 255 for x in colors[i][n][:3]]))
+                polygon.loops[n][alpha_lay] = Color([1 - (colors[i][n][3] / 255)] * 3)
             
             # The faces face the wrong way so the normal has to be flipped.
             polygon.normal_flip()
 
+# Returns the image of a texture page. Textures are named after the folder of the model, e.g. toys/toysa.bmp. Found images are stored in the textures dict.
+def get_texture(filepath, page, textures):
+    path = filepath.split(os.sep)
+    texture_name = path[-2].lower() + chr(97 + page) + ".bmp"
+    texture_path = os.sep.join(path[:-1]) + os.sep + texture_name
+    if texture_path not in textures:
+        image = bpy.data.images.get(texture_name)
+        if image == None and os.path.isfile(texture_path):
+            image = bpy.data.images.load(texture_path)
+        textures[texture_path] = image
+    return textures[texture_path]
+
+# Creates a mesh from formats.MeshData with bulk foreach_set calls. Gives the same result as data_to_bmesh but is a lot faster for big meshes.
+# indices can be supplied if the vertex indices don't fit in the polygons, e.g. for all meshes of a world at once.
+def data_to_mesh(name, data, matrix, filepath, indices = None, textures = None):
+    if textures == None:
+        textures = {}
+    polygons = data.polygons
+    if indices is None:
+        indices = polygons["vertices"].astype(numpy.int64)
+    is_quad = (polygons["type"] & 1) == 1
+    
+    # The faces face the wrong way so the corners are used in reverse.
+    order = numpy.where(is_quad[:, None], [[3, 2, 1, 0]], [[2, 1, 0, 3]])
+    used = numpy.arange(4)[None, :] < (3 + is_quad)[:, None]
+    rows = numpy.arange(len(polygons))[:, None]
+    corners = numpy.where(used, indices[rows, order], -1)
+    
+    # Skips polygons using a vertex twice and polygons using the same vertices as an earlier one, just like bmesh does.
+    corner_sets = numpy.sort(corners, axis = 1)
+    keep = numpy.all((corner_sets[:, 1:] != corner_sets[:, :-1]) | (corner_sets[:, 1:] < 0) | (corner_sets[:, :-1] < 0), axis = 1)
+    sorted_order = numpy.lexsort(corner_sets.T[::-1])
+    duplicate = numpy.zeros(len(polygons), dtype = bool)
+    duplicate[1:] = numpy.all(corner_sets[sorted_order][1:] == corner_sets[sorted_order][:-1], axis = 1)
+    keep[sorted_order[duplicate]] = False
+    polygons, order, used, corners = polygons[keep], order[keep], used[keep], corners[keep]
+    rows = numpy.arange(len(polygons))[:, None]
+    
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(data.vertices))
+    mesh.vertices.foreach_set("co", transform_points(data.vertices["position"], matrix).ravel())
+    loop_totals = numpy.sum(used, axis = 1)
+    mesh.loops.add(int(numpy.sum(loop_totals)))
+    mesh.loops.foreach_set("vertex_index", corners[used])
+    mesh.polygons.add(len(polygons))
+    mesh.polygons.foreach_set("loop_start", numpy.cumsum(loop_totals) - loop_totals)
+    mesh.polygons.foreach_set("loop_total", loop_totals)
+    
+    # Uvs, colors and alpha of each corner.
+    mesh.uv_textures.new("Uv")
+    uvs = polygons["uvs"][rows, order][used]
+    uvs[:, 1] = 1 - uvs[:, 1]
+    mesh.uv_layers["Uv"].data.foreach_set("uv", uvs.ravel())
+    colors = polygons["colors"][rows, order][used]
+    mesh.vertex_colors.new("Color").data.foreach_set("color", (colors[:, 2::-1] / 255).ravel())
+    mesh.vertex_colors.new("Alpha").data.foreach_set("color", numpy.repeat(1 - colors[:, 3] / 255, 3))
+    mesh.polygon_layers_int.new("revolt_face_type").data.foreach_set("value", polygons["type"].astype(numpy.int32))
+    
+    # Images have to be set one by one.
+    texture_data = mesh.uv_textures["Uv"].data
+    for i, page in enumerate(polygons["texture"].tolist()):
+        if page >= 0:
+            texture_data[i].image = get_texture(filepath, page, textures)
+    
+    mesh.update(calc_edges = True)
+    set_file_normals(mesh, data.vertices["normal"], matrix)
+    return mesh
+
+# Sets the vertex normals stored in a file as custom split normals with one call, so the shading looks like in the game and survives export.
+# The normals are in the order of the vertices of the mesh. Zero normals make Blender use the normal it calculates.
+def set_file_normals(mesh, normals, matrix):
+    if len(normals) != len(mesh.vertices) or len(mesh.polygons) == 0:
+        return
+    normals = transform_points(normals, matrix.to_3x3())
+    lengths = numpy.sqrt(numpy.sum(normals ** 2, axis = 1))
+    normals = numpy.where(lengths[:, None] > 0, normals / numpy.maximum(lengths, 1e-12)[:, None], 0)
+    
+    # Custom normals are only used by smooth faces and only if auto smooth is turned on. The angle is maxed so no edges get split.
+    mesh.polygons.foreach_set("use_smooth", numpy.ones(len(mesh.polygons), dtype = bool))
+    mesh.use_auto_smooth = True
+    mesh.auto_smooth_angle = pi
+    mesh.normals_split_custom_set_from_vertices(normals.tolist())
+
+# Reads a PRM-, M- or W-file into arrays. Returns None if the file doesn't exist or if its filesize is 0 byte.
+def read_file(filepath, quantize = False):
+    if not os.path.isfile(filepath) or os.path.getsize(filepath) == 0:
+        return None
+    return formats.load(filepath, quantize)
+
 # Imports a mesh. (PRM-/M-file)
 def get_mesh(filepath, matrix, texture_path = None):
 
@@ -64,101 +155,303 @@ def get_mesh(filepath, matrix, texture_path = None):
     
     # Creates mesh and decodes file.
     mesh = bpy.data.meshes.new(name)
-    fh = open(filepath, "rb")
+    data = formats.load(filepath)
     bm = bmesh.new()
-    decode_mesh(fh, bm, matrix, texture_path)
-    fh.close()
+    data_to_bmesh(bm, data, matrix, filepath, texture_path)
     bm.to_mesh(mesh)
+    set_file_normals(mesh, data.vertices["normal"], matrix)
     return mesh
 
-# Imports a model. (PRM-/M-file)
-def import_model(filepath, matrix, texture_path = None):
-    # Returns None if the file doesn't exist or if its filesize is 0 byte.
-    if not os.path.isfile(filepath) or os.path.getsize(filepath) == 0:
-        return None
+# Imports a model. (PRM-/M-file) The file is only read if no decoded data is supplied.
+def import_model(filepath, matrix, texture_path = None, data = None, textures = None):
+    if data == None:
+        # Returns None if the file doesn't exist or if its filesize is 0 byte.
+        if not os.path.isfile(filepath) or os.path.getsize(filepath) == 0:
+            return None
+        data = formats.load(filepath)
         
-    fh = open(filepath, "rb")
     bm = bmesh.new()
-    decode_mesh(fh, bm, matrix, texture_path)
-    fh.close()
+    data_to_bmesh(bm, data, matrix, filepath, texture_path, textures)
     obj = bmesh_to_object(bm, os.path.basename(filepath))
+    set_file_normals(obj.data, data.vertices["normal"], matrix)
     obj.data.revolt.export_as_prm = True
     return obj
 
-# Imports a level/world. (W-file)
-def import_world(filepath, matrix, include_models, include_objects, include_hitboxes, hide_hitboxes):
+# Reads several PRM-/M-files at the same time. Returns a list with formats.MeshData or None for each file.
+def read_files(filepaths):
+    with ThreadPoolExecutor(os.cpu_count() or 1) as pool:
+        return list(pool.map(read_file, filepaths))
+
+# Imports several models and yields the progress (0 to 1) after each one. The matrix and found textures are shared by all models.
+# If placement is "GRID" the models are placed next to each other, otherwise they keep their original positions.
+def iter_import_models(filepaths, matrix, placement = "ORIGINAL", models = None):
+    if models == None:
+        models = read_files(filepaths)
+    textures = {}
+    objects = []
+    for i, (filepath, data) in enumerate(zip(filepaths, models)):
+        if data != None:
+            objects.append(import_model(filepath, matrix, None, data, textures))
+        yield (i + 1) / len(filepaths)
+    
+    # Places the models in a square grid. Each cell fits the largest model.
+    if placement == "GRID" and len(objects) > 0:
+        columns = ceil(sqrt(len(objects)))
+        cell_size = max([max(obj.dimensions) for obj in objects]) * 1.2
+        for i, obj in enumerate(objects):
+            obj.location = Vector(((i % columns) * cell_size, -(i // columns) * cell_size, 0))
+    return objects
+
+# Imports a level/world. (W-file) If compact is True the geometry is only kept as arrays until the user wants to edit it.
+def import_world(filepath, matrix, include_models, include_objects, include_hitboxes, hide_hitboxes, compact = False, quantize = False):
+    run_steps(iter_import_world(filepath, matrix, include_models, include_objects, include_hitboxes, hide_hitboxes, compact, quantize))
+
+# Imports a level/world step by step and yields the progress (0 to 1) after each step. world_data can be supplied if the W-file has already been read, e.g. in a background thread.
+# If split_chunks is True each mesh in the file gets its own object.
+def iter_import_world(filepath, matrix, include_models, include_objects, include_hitboxes, hide_hitboxes, compact = False, quantize = False, world_data = None, split_chunks = False, include_lights = False):
     # Exits if the file doesn't exist or if its filesize is 0 byte.
     if os.path.isfile(filepath) == False or os.path.getsize(filepath) == 0:
         return
     
-    # Creates bmesh, opens the file and reads the number of meshes in the file
-    bm = bmesh.new()
-    fh = open(filepath, "rb")
-    mesh_count = struct.unpack("<l", fh.read(4))[0]
-    bpy.context.scene.revolt_world.path = os.path.dirname(fh.name)
-    bpy.context.scene.revolt_world.matrix = matrix
-    
-    # Loops through each mesh.
-    for i in range(mesh_count):
-        fh.read(40)
-        decode_mesh(fh, bm, matrix)
-    
-    # Reads FunnyBalls and unknown list.
-    funnyball_count = struct.unpack("<l", fh.read(4))[0]
-    for i in range(funnyball_count):
-        fh.read(16)
-        fh.read(4 * struct.unpack("<l", fh.read(4))[0])
-    fh.read(4 * struct.unpack("<l", fh.read(4))[0])
+    # Reads all meshes in the file.
+    bpy.context.scene.revolt_world.path = os.path.dirname(filepath)
+    if world_data == None:
+        world_data = formats.load(filepath, quantize)
     
-    # Reads the EnvList. This is where the color for each face with EnvMapping is stored.
-    envmapping_lay = bm.faces.layers.int.get("revolt_envmapping") or bm.faces.layers.int.new("revolt_envmapping")
-    envmapping_color_lay = bm.faces.layers.int.get("revolt_envmapping_color") or bm.faces.layers.int.new("revolt_envmapping_color")
-    
-    # Closes file and create object form the bmesh.
-    fh.close()
-    world = bmesh_to_object(bm, os.path.basename(filepath))
-    if world != None:
-        world.data.revolt.export_as_w = True
+    if compact:
+        add_compact_object(filepath, world_data, matrix)
+    elif split_chunks:
+        for progress in iter_world_to_chunks(filepath, world_data, matrix):
+            yield progress * 0.7
+    else:
+        for progress in iter_world_to_object(filepath, world_data, matrix):
+            yield progress * 0.7
+    yield 0.7
     
     # Import objects if include_objects is True.
     if include_objects:
-        import_world_objects(os.path.splitext(filepath)[0] + ".fob", matrix)
+        for progress in iter_import_world_objects(os.path.splitext(filepath)[0] + ".fob", matrix):
+            yield 0.7 + progress * 0.05
         
     # Import models if include_models is True.
     if include_models:
-        import_world_models(os.path.splitext(filepath)[0] + ".fin", matrix, include_hitboxes)
+        for progress in iter_import_world_models(os.path.splitext(filepath)[0] + ".fin", matrix, include_hitboxes):
+            yield 0.75 + progress * 0.15
         
     # Import hitbox if include_hitboxes is True.
     if include_hitboxes:
         hitbox = import_hitbox(os.path.splitext(filepath)[0] + ".ncp", matrix)
         if hitbox != None:
             hitbox.hide = hide_hitboxes
+        yield 0.95
+    
+    # Imports the lights if include_lights is True.
+    if include_lights:
+        import_lights(os.path.splitext(filepath)[0] + ".lit", matrix)
     
     # Imports startpos and some other stuff.
     inf_path = os.path.splitext(filepath)[0] + ".inf"
     if os.path.isfile(inf_path):
         fh = open(inf_path, "r")
-        data = ParameterBlock(fh)
-        bpy.context.scene.revolt_world.name = (data.get_parameter("NAME") or "  ")[1:-1]
-        bpy.context.scene.revolt_world.farclip = float(data.get_parameter("FARCLIP") or "0") * min(matrix.to_scale())
-        bpy.context.scene.revolt_world.fogstart = float(data.get_parameter("FOGSTART") or "0") * min(matrix.to_scale())
-        fogcolor = [float(x) / 255 for x in data.get_parameters("FOGCOLOR") or []]
-        if len(fogcolor) == 3:
-            bpy.context.scene.revolt_world.fogcolor = Color(fogcolor)
+        import_inf(fh, matrix)
+        fh.close()
+
+# Reads the world settings and the start position from an INF-file.
+def import_inf(fh, matrix):
+    data = ParameterBlock(fh)
+    bpy.context.scene.revolt_world.name = (data.get_parameter("NAME") or "  ")[1:-1]
+    bpy.context.scene.revolt_world.farclip = float(data.get_parameter("FARCLIP") or "0") * min(matrix.to_scale())
+    bpy.context.scene.revolt_world.fogstart = float(data.get_parameter("FOGSTART") or "0") * min(matrix.to_scale())
+    fogcolor = [float(x) / 255 for x in data.get_parameters("FOGCOLOR") or []]
+    if len(fogcolor) == 3:
+        bpy.context.scene.revolt_world.fogcolor = Color(fogcolor)
+    
+    # Gets startpos and startrot.
+    startpos = [float(x) for x in data.get_parameters("STARTPOS") or []]
+    startrot = float(data.get_parameter("STARTROT") or "0")
+    if len(startpos) == 3:
+        obj = add_revolt_startpos(matrix)
+        obj.location = Vector(startpos) * matrix
+        obj.rotation_euler = Euler((0, 0, -startrot * pi * 2), "XYZ")
+        bpy.context.scene.revolt_world.startpos_object = obj.name
+
+# Reads a W-file and every other file the world import needs (FIN, FOB, NCP, INF and the models) into a snapshot, so only textures are read while the objects are created.
+# Returns the snapshot and the W-file as read (it's kept quantized for compact imports), or None if the W-file doesn't exist. If snapshot_path is supplied the snapshot is saved there as well.
+# Files that won't be imported are only read if the snapshot is saved. (see snapshot.create)
+def read_world(filepath, quantize = False, snapshot_path = None, include_models = True, include_objects = True, include_hitboxes = True):
+    world = read_file(filepath, quantize)
+    if world == None:
+        return None
+    if snapshot_path != None:
+        include_models, include_objects, include_hitboxes = True, True, True
+    snap = snapshot.create(filepath, world, include_models, include_objects, include_hitboxes)
+    if snapshot_path != None:
+        snapshot.save(snap, snapshot_path)
+    return snap, world
+
+# Imports a track from a snapshot (RVS-file) and yields the progress (0 to 1) after each step. Does the same as iter_import_world but without reading any other files than textures, object models and lights.
+# world_data can be supplied to use the W-file as it was read instead of the arrays in the snapshot.
+def iter_import_snapshot(snap, matrix, include_models, include_objects, include_hitboxes, hide_hitboxes, compact = False, split_chunks = False, include_lights = False, world_data = None):
+    filepath = snap.source()
+    path = os.path.splitext(filepath)[0]
+    bpy.context.scene.revolt_world.path = os.path.dirname(filepath)
+    if world_data == None:
+        world_data = snap.world()
+    
+    if compact:
+        add_compact_object(filepath, world_data, matrix)
+    elif split_chunks:
+        for progress in iter_world_to_chunks(filepath, world_data, matrix):
+            yield progress * 0.5
+    elif len(world_data) > 0:
+        # All meshes are created at once. The vertex indices of each mesh are moved to where its vertices are in the big array.
+        world = bpy.data.objects.new(os.path.basename(filepath), data_to_mesh(os.path.basename(filepath), world_data.mesh, matrix, filepath, world_data.global_indices()))
+        world.data.polygon_layers_int.new("revolt_envmapping")
+        world.data.polygon_layers_int.new("revolt_envmapping_color")
+        world.data.revolt.export_as_w = True
+        bpy.context.scene.objects.link(world)
+    yield 0.5
+    
+    if include_objects:
+        for progress in iter_import_world_objects(path + ".fob", matrix, records = snap.objects()):
+            yield 0.5 + progress * 0.1
+    
+    if include_models:
+        for progress in iter_import_world_models(path + ".fin", matrix, include_hitboxes, instances = snap.instances(), models = snap.models()):
+            yield 0.6 + progress * 0.3
+    
+    if include_hitboxes and len(snap.hitbox()) > 0:
+        hitbox = bpy.data.objects.new(os.path.basename(path) + ".ncp", hitbox_to_mesh(os.path.basename(path) + ".ncp", snap.hitbox(), matrix))
+        hitbox.hide = hide_hitboxes
+        bpy.context.scene.objects.link(hitbox)
+        yield 0.95
+    
+    if include_lights:
+        import_lights(path + ".lit", matrix)
+    
+    if snap.inf() != None:
+        import_inf(io.StringIO(snap.inf()), matrix)
+
+# Creates a world object from formats.WorldData. All meshes in the file are merged into one object.
+def world_to_object(filepath, world_data, matrix):
+    return run_steps(iter_world_to_object(filepath, world_data, matrix))
+
+# Same as world_to_object but yields the progress after each mesh.
+def iter_world_to_object(filepath, world_data, matrix):
+    bm = bmesh.new()
+    textures = {}
+    for i in range(len(world_data)):
+        data_to_bmesh(bm, world_data.chunk(i), matrix, filepath, None, textures)
+        yield (i + 1) / len(world_data)
+    
+    # Reads the EnvList. This is where the color for each face with EnvMapping is stored.
+    envmapping_lay = bm.faces.layers.int.get("revolt_envmapping") or bm.faces.layers.int.new("revolt_envmapping")
+    envmapping_color_lay = bm.faces.layers.int.get("revolt_envmapping_color") or bm.faces.layers.int.new("revolt_envmapping_color")
+    
+    world = bmesh_to_object(bm, os.path.basename(filepath))
+    set_file_normals(world.data, world_data.mesh.vertices["normal"], matrix)
+    world.data.revolt.export_as_w = True
+    return world
+
+# Creates an object for each mesh in a W-file and yields the progress after each mesh. The objects are put in a group named after the file.
+# Each mesh keeps its bounding header, where it came from and a fingerprint, so the export can write meshes that weren't edited exactly as they were.
+def iter_world_to_chunks(filepath, world_data, matrix):
+    from . import encode
+    name = os.path.basename(filepath)
+    group = bpy.data.groups.new(name)
+    textures = {}
+    for i in range(len(world_data)):
+        mesh = data_to_mesh(os.path.splitext(name)[0] + "_" + str(i), world_data.chunk(i), matrix, filepath, None, textures)
+        mesh.polygon_layers_int.new("revolt_envmapping")
+        mesh.polygon_layers_int.new("revolt_envmapping_color")
+        mesh.revolt.export_as_w = True
         
-        # Gets startpos and startrot.
-        startpos = [float(x) for x in data.get_parameters("STARTPOS") or []]
-        startrot = float(data.get_parameter("STARTROT") or "0")
-        if len(startpos) == 3:
-            obj = add_revolt_startpos(matrix)
-            obj.location = Vector(startpos) * matrix
-            obj.rotation_euler = Euler((0, 0, -startrot * pi * 2), "XYZ")
-            bpy.context.scene.revolt_world.startpos_object = obj.name
+        # The header is kept as it is in the file. The export writes a new one if the mesh changes.
+        header = world_data.headers[i]
+        mesh["revolt_world_file"] = name
+        mesh["revolt_chunk"] = i
+        mesh["revolt_chunk_source"] = filepath
+        mesh["revolt_matrix"] = [x for row in matrix for x in row]
+        mesh["revolt_center"] = header["center"].tolist()
+        mesh["revolt_radius"] = float(header["radius"])
+        mesh["revolt_bounds"] = header["bounds"].ravel().tolist()
+        mesh["revolt_chunk_hash"] = encode.mesh_fingerprint(mesh, Matrix())
         
-        fh.close()
+        obj = bpy.data.objects.new(mesh.name, mesh)
+        bpy.context.scene.objects.link(obj)
+        group.objects.link(obj)
+        yield (i + 1) / len(world_data)
+
+# Geometry of compact objects. Maps filepath to decoded arrays and the import matrix.
+compact_data = {}
+
+# Adds an empty in place of a mesh object. The geometry is kept in compact_data and only turned into a mesh by expand_compact_object.
+def add_compact_object(filepath, data, matrix):
+    compact_data[filepath] = (data, matrix)
+    mesh = data.mesh if type(data) is formats.WorldData else data
+    obj = bpy.data.objects.new(os.path.basename(filepath), None)
+    obj.empty_draw_type = "CUBE"
+    obj["revolt_source"] = filepath
+    obj["revolt_matrix"] = [x for row in matrix for x in row]
+    
+    # The empty is drawn as the bounding box of the geometry.
+    if len(mesh.stored_vertices) > 0:
+        points = transform_points(mesh.vertices["position"], matrix)
+        low, high = points.min(axis = 0), points.max(axis = 0)
+        obj.location = Vector((low + high) / 2)
+        obj.scale = Vector(numpy.maximum((high - low) / 2, 1e-4))
+    
+    bpy.context.scene.objects.link(obj)
+    return obj
+
+# Replaces a compact object with a mesh object that can be edited. Reads the file again if the arrays are gone, e.g. after reopening the .blend file.
+def expand_compact_object(obj):
+    filepath = obj["revolt_source"]
+    data, matrix = compact_data.pop(filepath, (None, None))
+    if data == None:
+        if not os.path.isfile(filepath):
+            return None
+        values = list(obj["revolt_matrix"])
+        data, matrix = formats.load(filepath), Matrix([values[i:i + 4] for i in range(0, 16, 4)])
+    
+    if type(data) is formats.WorldData:
+        new_obj = world_to_object(filepath, data, matrix)
+    else:
+        bm = bmesh.new()
+        data_to_bmesh(bm, data, matrix, filepath)
+        new_obj = bmesh_to_object(bm, os.path.basename(filepath))
+        set_file_normals(new_obj.data, data.vertices["normal"], matrix)
+        new_obj.data.revolt.export_as_prm = True
+    
+    bpy.context.scene.objects.unlink(obj)
+    bpy.data.objects.remove(obj)
+    return new_obj
 
 # Imports a hitbox. (NCP-file)
 def import_hitbox(filepath, matrix):
+    bm = decode_hitbox(filepath, matrix)
+    if bm == None:
+        return None
+    obj = bmesh_to_object(bm, os.path.basename(filepath))
+    obj.data.revolt.export_as_ncp = True
+    return obj
+
+# Imports the mesh of a hitbox. (NCP-file) Just like get_mesh the mesh is only created once for each file.
+def get_hitbox_mesh(filepath, matrix):
+    name = os.path.basename(filepath)
+    if bpy.data.meshes.get(name):
+        return bpy.data.meshes[name]
+    bm = decode_hitbox(filepath, matrix)
+    if bm == None:
+        return None
+    mesh = bpy.data.meshes.new(name)
+    bm.to_mesh(mesh)
+    bm.free()
+    mesh.revolt.export_as_ncp = True
+    return mesh
+
+# Decodes a hitbox into a new bmesh.
+def decode_hitbox(filepath, matrix):
     # Returns None if the file doesn't exist or if its filesize is 0 byte.
     if not os.path.isfile(filepath) or os.path.getsize(filepath) == 0:
         return None
@@ -201,86 +494,203 @@ def import_hitbox(filepath, matrix):
             face[material_layer] = surface
             
     fh.close();
+    return bm
+
+# Creates a hitbox mesh from the polyhedrons of an NCP-file with bulk foreach_set calls. Each face gets its own vertices just like decode_hitbox.
+def hitbox_to_mesh(name, polyhedra, matrix):
+    corners, valid = formats.polyhedron_corners(polyhedra)
+    keep = numpy.sum(valid, axis = 1) >= 3
+    corners, valid, polyhedra = corners[keep], valid[keep], polyhedra[keep]
+    loop_totals = numpy.sum(valid, axis = 1)
     
-    obj = bmesh_to_object(bm, os.path.basename(filepath))
-    obj.data.revolt.export_as_ncp = True
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(int(numpy.sum(loop_totals)))
+    mesh.vertices.foreach_set("co", transform_points(corners[valid], matrix).ravel())
+    mesh.loops.add(int(numpy.sum(loop_totals)))
+    mesh.loops.foreach_set("vertex_index", numpy.arange(len(mesh.loops)))
+    mesh.polygons.add(len(polyhedra))
+    mesh.polygons.foreach_set("loop_start", numpy.cumsum(loop_totals) - loop_totals)
+    mesh.polygons.foreach_set("loop_total", loop_totals)
+    mesh.polygon_layers_int.new("revolt_material").data.foreach_set("value", polyhedra["surface"].astype(numpy.int32))
+    mesh.update(calc_edges = True)
+    mesh.revolt.export_as_ncp = True
+    return mesh
+
+# Imports position nodes (PAN-file) as one object. Each node is a vertex and each link an edge from its first to its second vertex.
+# The node at the finish line has 1 in the revolt_start_node layer.
+def import_position_nodes(filepath, matrix):
+    records, start = formats.load_position_nodes(filepath)
+    edges = nodes.clean_edges(len(records), nodes.slots_to_edges(records["next"]))
+    mesh = nodes_to_mesh(os.path.basename(filepath), transform_points(records["position"], matrix), edges)
+    start_flags = numpy.zeros(len(records), dtype = numpy.int32)
+    if 0 <= start < len(records):
+        start_flags[start] = 1
+    mesh.vertex_layers_int.new("revolt_start_node").data.foreach_set("value", start_flags)
+    mesh["revolt_nodes"] = "POSITION"
+    obj = bpy.data.objects.new(mesh.name, mesh)
+    bpy.context.scene.objects.link(obj)
     return obj
 
+# Imports AI nodes (FAN-file) as one object. Each node is an edge across the track from its red vertex to its green vertex.
+# Links are edges between the red vertices. The green vertices are joined the same way so the route looks like a ladder, but those edges are ignored on export.
+def import_ai_nodes(filepath, matrix):
+    records = formats.load_ai_nodes(filepath)
+    count = len(records)
+    links = nodes.clean_edges(count, nodes.slots_to_edges(records["next"])) * 2
+    rungs = numpy.arange(count * 2).reshape(-1, 2)
+    mesh = nodes_to_mesh(os.path.basename(filepath), transform_points(records["positions"].reshape(-1, 3), matrix), numpy.concatenate([rungs, links, links + 1]))
+    
+    # The values of each node are stored on both of its vertices.
+    mesh.vertex_layers_int.new("revolt_side").data.foreach_set("value", numpy.tile(numpy.int32([0, 1]), count))
+    mesh.vertex_layers_int.new("revolt_priority").data.foreach_set("value", numpy.repeat(records["priority"].astype(numpy.int32), 2))
+    mesh.vertex_layers_int.new("revolt_start_node").data.foreach_set("value", numpy.repeat(records["start_node"].astype(numpy.int32), 2))
+    mesh.vertex_layers_float.new("revolt_racing_line").data.foreach_set("value", numpy.repeat(records["racing_line"], 2))
+    mesh.vertex_layers_float.new("revolt_speed").data.foreach_set("value", records["speeds"].ravel())
+    mesh["revolt_nodes"] = "AI"
+    obj = bpy.data.objects.new(mesh.name, mesh)
+    bpy.context.scene.objects.link(obj)
+    return obj
+
+# Creates a mesh of vertices and edges only. The vertices of each edge are kept in the given order.
+def nodes_to_mesh(name, positions, edges):
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(positions))
+    mesh.vertices.foreach_set("co", numpy.asarray(positions, dtype = numpy.float64).ravel())
+    mesh.edges.add(len(edges))
+    mesh.edges.foreach_set("vertices", numpy.asarray(edges, dtype = numpy.int32).ravel())
+    mesh.update()
+    return mesh
+
+# Colors of the objects created by import_diff.
+diff_colors = {"added": (0.1, 0.8, 0.1), "removed": (0.8, 0.1, 0.1), "moved": (0.9, 0.7, 0.1), "changed": (0.1, 0.4, 0.9)}
+
+# Imports the result of diff.compare as one highlighted object for each of added, removed, moved and changed faces. Removed faces are taken from the old file, the rest from the new one.
+def import_diff(result, matrix, tolerance = 0.01):
+    old, new = diff.load_faces(result["old"], tolerance), diff.load_faces(result["new"], tolerance)
+    groups = [
+        ("added", new, result["added"]),
+        ("removed", old, result["removed"]),
+        ("moved", new, [i for j, i, offset in result["moved"]]),
+        ("changed", new, sorted(set([i for pairs in result["changed"].values() for j, i in pairs]))),
+        ]
+    objects = []
+    for name, faces, indices in groups:
+        indices = numpy.array(indices, dtype = numpy.int64)
+        indices = indices[faces.counts[indices] >= 3] if len(indices) > 0 else indices
+        if len(indices) == 0:
+            continue
+        
+        # Each face gets its own vertices.
+        counts = faces.counts[indices]
+        used = numpy.arange(4)[None, :] < counts[:, None]
+        mesh = bpy.data.meshes.new("diff_" + name)
+        mesh.vertices.add(int(numpy.sum(counts)))
+        mesh.vertices.foreach_set("co", transform_points(faces.outlines[indices][used], matrix).ravel())
+        mesh.loops.add(int(numpy.sum(counts)))
+        mesh.loops.foreach_set("vertex_index", numpy.arange(len(mesh.loops)))
+        mesh.polygons.add(len(indices))
+        mesh.polygons.foreach_set("loop_start", numpy.cumsum(counts) - counts)
+        mesh.polygons.foreach_set("loop_total", counts)
+        mesh.update(calc_edges = True)
+        
+        material = bpy.data.materials.new("diff_" + name)
+        material.diffuse_color = diff_colors[name]
+        mesh.materials.append(material)
+        obj = bpy.data.objects.new("diff_" + name, mesh)
+        obj.show_wire = True
+        bpy.context.scene.objects.link(obj)
+        objects.append(obj)
+    return objects
+
 # Imports world models. (FIN-file)
 def import_world_models(filepath, matrix, include_hitboxes):
-    if os.path.isfile(filepath) == False or os.path.getsize(filepath) == 0:
-        return
-    
-    # Opens file, splits the path and reads the number of objects.
-    fh = open(filepath, "rb")
-    path = os.sep.join(fh.name.split(os.sep)[:-1]) + os.sep
-    object_count = struct.unpack("<l", fh.read(4))[0]
+    run_steps(iter_import_world_models(filepath, matrix, include_hitboxes))
+
+# Imports world models and yields the progress (0 to 1) after each batch of objects. All records are decoded and all matrices are calculated at once before any object is created.
+# The instances and the models can be supplied from a snapshot. models maps each name to the model path, formats.MeshData and the polyhedrons of its hitbox.
+def iter_import_world_models(filepath, matrix, include_hitboxes, batch_size = 250, instances = None, models = None):
+    if instances is None:
+        instances = formats.load_records(filepath, formats.instance_dtype)
+    path = os.path.dirname(filepath) + os.sep
+    names = instances["name"].tolist()
+    matrices = instance_matrices(instances, matrix)
     
-    # Loops through each object.
-    for i in range(object_count):
+    # Loads each model (and hitbox) only once no matter how many instances there are. Half of the progress is used for the models.
+    meshes = {}
+    hitboxes = {}
+    unique_names = set(names)
+    for step, name in enumerate(unique_names):
+        yield step / len(unique_names) * 0.5
+        if models != None:
+            meshes[name], hitboxes[name] = None, None
+            if name in models:
+                mesh_path, data, polyhedra = models[name]
+                mesh_name = os.path.basename(mesh_path)
+                meshes[name] = bpy.data.meshes.get(mesh_name) or data_to_mesh(mesh_name, data, matrix, mesh_path)
+                meshes[name].revolt.export_as_prm = True
+                if include_hitboxes and len(polyhedra) > 0:
+                    hitbox_name = os.path.splitext(mesh_name)[0] + ".ncp"
+                    hitboxes[name] = bpy.data.meshes.get(hitbox_name) or hitbox_to_mesh(hitbox_name, polyhedra, matrix)
+            continue
         
-        # Reads some data.
-        data = struct.unpack("<ccccccccccccLccccfffffffffffff", fh.read(72))
-
         # Decode the mesh name. For now expecing lowercase since it's the std for RVGL on Linux
-        mesh_name = "".join([x.decode("ASCII").lower() for x in data[:9]]).split("\x00")[0]
-        
-        # The path is incomplete sometimes due to limitations in the FIN-file format. Let's fix this!
-        if os.path.isfile(path + mesh_name + ".prm"):
-            mesh_path = path + mesh_name + ".prm"
-        else:
-            found_paths = glob.glob(path + mesh_name + "*.prm")
-            mesh_path = found_paths[0] if len(found_paths) == 1 else None
-        
-        # If exactly one mesh matched the pattern.
-        if mesh_path != None:
-            mesh_name = bpy.path.basename(mesh_path)
-            
-            # If the mesh hasn't been loaded, load it or else make an object using the existing mesh.
-            mesh = bpy.data.meshes.get(mesh_name)
+        mesh_path = formats.find_model_path(path, name.split(b"\x00")[0].decode("ASCII", "ignore").lower())
+        meshes[name] = get_mesh(mesh_path, matrix) if mesh_path != None else None
+        hitboxes[name] = None
+        if meshes[name] != None:
+            meshes[name].revolt.export_as_prm = True
+            if include_hitboxes:
+                hitboxes[name] = get_hitbox_mesh(os.path.splitext(mesh_path)[0] + ".ncp", matrix)
+    
+    # Creates and links the objects in batches. Each object gets its complete matrix at once.
+    for start in range(0, len(names), batch_size):
+        for i in range(start, min(start + batch_size, len(names))):
+            mesh = meshes[names[i]]
             if mesh == None:
-                obj = import_model(mesh_path, matrix)
-            else:
-                obj = bpy.data.objects.new(mesh_name, mesh)
-                bpy.context.scene.objects.link(obj)
+                continue
+            obj = bpy.data.objects.new(mesh.name, mesh)
+            obj.matrix_local = matrices[i]
+            bpy.context.scene.objects.link(obj)
             
-            # If the object was created sucessfully. Set its matrix and location.
-            if obj != None:
-                v1 = Vector((data[21], data[24], data[27])) * matrix
-                v2 = Vector((data[22], data[25], data[28])) * matrix
-                v3 = Vector((data[23], data[26], data[29])) * matrix
-                obj.matrix_local = Matrix((v1, v3, -v2)).to_4x4()
-                obj.location = Vector(data[18:21]) * matrix
-                obj.scale = Vector((1,1,1))
-                
-            # If we want to unclude hitboxes.
-            if include_hitboxes:
-                hitbox_name = os.path.splitext(mesh_name)[0] + ".ncp"
-                hitbox = bpy.data.meshes.get(hitbox_name)
-                
-                # If the hitbox mesh hasn't been loaded, load it or else make an object using the existing hitbox mesh.
-                if hitbox == None:
-                    hitbox_obj = import_hitbox(path + hitbox_name, matrix)
-                else:
-                    hitbox_obj = bpy.data.objects.new(hitbox_name, hitbox)
-                    bpy.context.scene.objects.link(hitbox_obj)
-                
-            # If the hitbox was created sucessfully. Hide it (because it's ugly!) and set its matrix + location.
-            if hitbox_obj != None:
+            # Hides the hitbox (because it's ugly!).
+            hitbox = hitboxes[names[i]]
+            if hitbox != None:
+                hitbox_obj = bpy.data.objects.new(hitbox.name, hitbox)
                 hitbox_obj.hide = True
-                hitbox_obj.matrix_local = obj.matrix_local
-                hitbox_obj.location = Vector(data[18:21]) * matrix
-            
-    fh.close()
+                hitbox_obj.matrix_local = matrices[i]
+                bpy.context.scene.objects.link(hitbox_obj)
+        yield 0.5 + min(start + batch_size, len(names)) / len(names) * 0.5
+
+# Calculates the matrix of each instance in a FIN-file. The rotation is converted to Blender's axes but the scale of the import matrix isn't applied.
+def instance_matrices(instances, matrix):
+    axes = numpy.array(matrix, dtype = numpy.float64)[:3, :3]
+    
+    # Columns of the stored rotation converted to Blender's axes.
+    columns = numpy.einsum("njk,jl->nkl", instances["matrix"].astype(numpy.float64), axes)
+    rotations = numpy.concatenate([columns[:, 0:1], columns[:, 2:3], -columns[:, 1:2]], axis = 1)
+    
+    # Removes the scale the same way Blender does when the object scale is set to 1.
+    lengths = numpy.sqrt(numpy.sum(rotations ** 2, axis = 1))
+    lengths *= numpy.where(numpy.linalg.det(rotations) < 0, -1, 1)[:, None]
+    rotations /= numpy.where(lengths != 0, lengths, 1)[:, None, :]
+    return to_matrices(rotations, transform_points(instances["position"], matrix))
+
+# Builds a list of 4x4 matrices from arrays of 3x3 rotations and locations.
+def to_matrices(rotations, locations):
+    matrices = numpy.zeros((len(rotations), 4, 4))
+    matrices[:, :3, :3] = rotations
+    matrices[:, :3, 3] = locations
+    matrices[:, 3, 3] = 1
+    return [Matrix(m) for m in matrices.tolist()]
 
 # Imports a car. (Parameters.txt)
 def import_car(filepath, matrix):
-    car_properties = bpy.context.scene.revolt_car
+    run_steps(iter_import_car(filepath, matrix))
+
+# Reads the parameter block of a car and all models it uses. This doesn't touch bpy so it can run in a background thread. Returns the parameters and a dict with formats.MeshData for each model path.
+def read_car(filepath):
     fh = open(filepath, "r")
-    
-    # Split up path.
-    path = fh.name.split(os.sep)
-    revolt_path = os.sep.join(path[:-3]) + os.sep
+    revolt_path = os.sep.join(filepath.split(os.sep)[:-3]) + os.sep
     
     # Loops through each line until the first "{" is found.
     for line in fh:
@@ -289,6 +699,25 @@ def import_car(filepath, matrix):
     
     # Reads the paramater block.
     data = ParameterBlock(fh)
+    fh.close()
+    
+    # Reads each model that exists.
+    models = {}
+    for params in data.params:
+        if len(params) > 2 and params[0].upper() == "MODEL":
+            model_path = revolt_path + params[2][1:-1]
+            if os.path.isfile(model_path) and os.path.getsize(model_path) > 0:
+                models[model_path] = formats.load(model_path)
+    return data, models
+
+# Imports a car step by step and yields the progress (0 to 1) after each wheel. The car can be supplied if it already has been read by read_car.
+def iter_import_car(filepath, matrix, car = None):
+    car_properties = bpy.context.scene.revolt_car
+    data, models = car or read_car(filepath)
+    
+    # Split up path.
+    path = filepath.split(os.sep)
+    revolt_path = os.sep.join(path[:-3]) + os.sep
     
     # Sets some parameters.
     car_properties.path = os.sep.join(path[:-1]) + os.sep
@@ -305,6 +734,7 @@ def import_car(filepath, matrix):
         # Gets the wheel info. Continue with the next one if it wasn't found.
         wheel = data.blocks.get("WHEEL " + str(i))
         if wheel == None:
+            yield (i + 1) / 5
             continue
             
         model_path = data.get_parameter("MODEL", wheel.get_parameter("ModelNum"))
@@ -319,7 +749,7 @@ def import_car(filepath, matrix):
                 wheel_obj = bpy.data.objects.new(model_name, bpy.data.meshes[model_name])
                 bpy.context.scene.objects.link(wheel_obj)
             else:
-                wheel_obj = import_model(model_path, matrix, texture)
+                wheel_obj = import_model(model_path, matrix, texture, models.get(model_path))
             
             # If wheel was loaded successfully.
             if wheel_obj != None:
@@ -353,7 +783,7 @@ def import_car(filepath, matrix):
                     axle_obj = bpy.data.objects.new(model_name, bpy.data.meshes[model_name])
                     bpy.context.scene.objects.link(axle_obj)
                 else:
-                    axle_obj = import_model(model_path, matrix, texture)
+                    axle_obj = import_model(model_path, matrix, texture, models.get(model_path))
                 
                 # If axle was loaded successfully.
                 if axle_obj != None:
@@ -388,7 +818,7 @@ def import_car(filepath, matrix):
                     spring_obj = bpy.data.objects.new(model_name, bpy.data.meshes[model_name])
                     bpy.context.scene.objects.link(spring_obj)
                 else:
-                    spring_obj = import_model(model_path, matrix, texture)
+                    spring_obj = import_model(model_path, matrix, texture, models.get(model_path))
                 
                 # If spring was loaded successfully.
                 if spring_obj != None:
@@ -403,13 +833,14 @@ def import_car(filepath, matrix):
                     track_constraint.target = wheel_obj
                     track_constraint.track_axis = "TRACK_NEGATIVE_Z"
                     track_constraint.up_axis = "UP_Y"
-            
+        
+        yield (i + 1) / 5
                 
     # Gets the body
     body = data.blocks.get("BODY")
     model_path = data.get_parameter("MODEL", body.get_parameter("ModelNum"))
     if body != None and model_path != None:
-        obj = import_model(revolt_path + model_path[1:-1], matrix, texture)
+        obj = import_model(revolt_path + model_path[1:-1], matrix, texture, models.get(revolt_path + model_path[1:-1]))
         
         # If the body was loaded sucessfully.
         if obj != None:
@@ -419,8 +850,6 @@ def import_car(filepath, matrix):
             location = body.get_parameters("Offset")
             if location != None and len(location) == 3:
                 obj.location = Vector([float(re.sub("[^0-9\.]", "", x)) for x in location]) * matrix
-    
-    fh.close()
 
 # Class used for reading a block from car parameters.
 class ParameterBlock:
@@ -461,114 +890,155 @@ class ParameterBlock:
         matches = [p for p in self.params if len(p) > len(keys) and all([p[i].upper() == k.upper() for i, k in enumerate(keys)])]
         return matches[0][len(keys)] if len(matches) > 0 else None
 
+# Model used for each object type in FOB-files.
+object_models = {
+    "OBJECT_TYPE_BARREL": "barrel.m",
+    "OBJECT_TYPE_FOOTBALL": "football.m",
+    "OBJECT_TYPE_BEACHBALL": "beachball.m",
+    "OBJECT_TYPE_PLANE": "plane.m",
+    "OBJECT_TYPE_COPTER": "copter.m",
+    "OBJECT_TYPE_DRAGON": "dragon1.m",
+    "OBJECT_TYPE_WATER": "water.m",
+    "OBJECT_TYPE_TROLLEY": "trolley.m",
+    "OBJECT_TYPE_BOAT": "boat1.m",
+    "OBJECT_TYPE_RADAR": "radar.m",
+    "OBJECT_TYPE_SPEEDUP": "speedup.m",
+    "OBJECT_TYPE_BALLOON": "baloon.m",
+    "OBJECT_TYPE_HORSE": "horse.m",
+    "OBJECT_TYPE_TRAIN": "train.m",
+    "OBJECT_TYPE_STROBE": "light1.m",
+    "OBJECT_TYPE_SPACEMAN": "spaceman.m",
+    "OBJECT_TYPE_PICKUP": "pickup.m",
+    "OBJECT_TYPE_FLAP": "flap.m",
+    }
+
+# Model paths for planets. The first flag tells which planet it is, 11 is the sun which has no model.
+planet_models = ["mercury.m", "venus.m", "earth.m", "mars.m", "jupiter.m", "saturn.m", "uranus.m", "neptune.m", "pluto.m", "moon.m", "rings.m"]
+
 # Imports world objects. (FOB-file)
 def import_world_objects(filepath, matrix):
-    
-    # Returns None if the file doesn't exist or if its filesize is 0 byte.
-    if not os.path.isfile(filepath) or os.path.getsize(filepath) == 0:
-        return None
-    
-    # Model paths for planets.
-    planet_models = [
-        "models" + os.sep + "mercury.m",
-        "models" + os.sep + "venus.m",
-        "models" + os.sep + "earth.m",
-        "models" + os.sep + "mars.m",
-        "models" + os.sep + "jupiter.m",
-        "models" + os.sep + "saturn.m",
-        "models" + os.sep + "uranus.m",
-        "models" + os.sep + "neptune.m",
-        "models" + os.sep + "pluto.m",
-        "models" + os.sep + "moon.m",
-        "models" + os.sep + "rings.m"
-        ]
-        
+    run_steps(iter_import_world_objects(filepath, matrix))
+
+# Imports world objects and yields the progress (0 to 1) after each batch of objects. All records are decoded and all matrices are calculated at once before any object is created.
+# The records can be supplied from a snapshot.
+def iter_import_world_objects(filepath, matrix, batch_size = 250, records = None):
+    if records is None:
+        records = formats.load_records(filepath, formats.object_dtype)
     revolt_path = os.sep.join(filepath.split(os.sep)[:-3]) + os.sep
     object_types = [item[0] for item in bpy.types.RevoltObjectProperties.object_type[1]["items"]]
     
-    fh = open(filepath, "rb")
-    object_count = struct.unpack("<l", fh.read(4))[0]
-    for i in range(object_count):
-        data = struct.unpack("<lllllfffffffff", fh.read(56))
-        if data[0] + 1 < len(object_types):
-            up = (-Vector(data[8:11]) * matrix).normalized()
-            forward = (Vector((data[11:14])) * matrix).normalized()
-            right = forward.cross(up)
-            obj_matrix = Matrix(((right.x, forward.x, up.x), (right.y, forward.y, up.y), (right.z, forward.z, up.z))).to_4x4()
-            object_type = object_types[data[0] + 1]
-            
-            mesh = None
-            
-            if object_type == "OBJECT_TYPE_BARREL":
-                mesh = get_mesh(revolt_path + "models" + os.sep + "barrel.m", matrix)
-            
-            elif object_type == "OBJECT_TYPE_FOOTBALL":
-                mesh = get_mesh(revolt_path + "models" + os.sep + "football.m", matrix)
-                
-            elif object_type == "OBJECT_TYPE_BEACHBALL":
-                mesh = get_mesh(revolt_path + "models" + os.sep + "beachball.m", matrix)
-            
-            elif object_type == "OBJECT_TYPE_PLANET" and data[1] != 11:
-                mesh = get_mesh(revolt_path + planet_models[data[1]], matrix)
-
-            elif object_type == "OBJECT_TYPE_PLANE":
-                mesh = get_mesh(revolt_path + "models" + os.sep + "plane.m", matrix)
-                
-            elif object_type == "OBJECT_TYPE_COPTER":
-                mesh = get_mesh(revolt_path + "models" + os.sep + "copter.m", matrix)
-                
-            elif object_type == "OBJECT_TYPE_DRAGON":
-                mesh = get_mesh(revolt_path + "models" + os.sep + "dragon1.m", matrix)
-                
-            elif object_type == "OBJECT_TYPE_WATER":
-                mesh = get_mesh(revolt_path + "models" + os.sep + "water.m", matrix)
-                
-            elif object_type == "OBJECT_TYPE_TROLLEY":
-                mesh = get_mesh(revolt_path + "models" + os.sep + "trolley.m", matrix)
-                
-            elif object_type == "OBJECT_TYPE_BOAT":
-                mesh = get_mesh(revolt_path + "models" + os.sep + "boat1.m", matrix)
-                
-            elif object_type == "OBJECT_TYPE_RADAR":
-                mesh = get_mesh(revolt_path + "models" + os.sep + "radar.m", matrix)
-                
-            elif object_type == "OBJECT_TYPE_SPEEDUP":
-                mesh = get_mesh(revolt_path + "models" + os.sep + "speedup.m", matrix)
-                
-            elif object_type == "OBJECT_TYPE_BALOON":
-                mesh = get_mesh(revolt_path + "models" + os.sep + "baloon.m", matrix)
-                
-            elif object_type == "OBJECT_TYPE_HORSE":
-                mesh = get_mesh(revolt_path + "models" + os.sep + "horse.m", matrix)
-                
-            elif object_type == "OBJECT_TYPE_TRAIN":
-                mesh = get_mesh(revolt_path + "models" + os.sep + "train.m", matrix)
-                
-            elif object_type == "OBJECT_TYPE_STROBE":
-                mesh = get_mesh(revolt_path + "models" + os.sep + "light1.m", matrix)
-                
-            elif object_type == "OBJECT_TYPE_SPACEMAN":
-                mesh = get_mesh(revolt_path + "models" + os.sep + "spaceman.m", matrix)
-                
-            elif object_type == "OBJECT_TYPE_PICKUP":
-                mesh = get_mesh(revolt_path + "models" + os.sep + "pickup.m", matrix)
-                
-            elif object_type == "OBJECT_TYPE_FLAP":
-                mesh = get_mesh(revolt_path + "models" + os.sep + "flap.m", matrix)
-                
-            obj = bpy.data.objects.new(object_type, mesh)
+    # Skips unknown object types.
+    records = records[records["type"] + 1 < len(object_types)]
+    matrices = object_matrices(records, matrix)
+    types = [object_types[i + 1] for i in records["type"].tolist()]
+    flags = records["flags"].tolist()
+    flag_bytes = records["flags"].astype("<i4").view(numpy.uint8).reshape(-1, 16).tolist()
+    
+    # Looks up each model once.
+    meshes = {}
+    for object_type, flag in set(zip(types, [f[0] for f in flags])):
+        model = object_models.get(object_type)
+        if object_type == "OBJECT_TYPE_PLANET" and 0 <= flag < len(planet_models):
+            model = planet_models[flag]
+        meshes[(object_type, flag)] = get_mesh(revolt_path + "models" + os.sep + model, matrix) if model != None else None
+    
+    # Creates and links the objects in batches.
+    for start in range(0, len(types), batch_size):
+        for i in range(start, min(start + batch_size, len(types))):
+            obj = bpy.data.objects.new(types[i], meshes[(types[i], flags[i][0])])
             obj.empty_draw_type = "ARROWS"
-            obj.matrix_local = obj_matrix
-            obj.location = Vector(data[5:8]) * matrix
+            obj.matrix_local = matrices[i]
             obj.revolt.type = "OBJECT"
-            obj.revolt.object_type = object_type
-            obj.revolt.flag1_long = data[1]
-            obj.revolt.flag2_long = data[2]
-            obj.revolt.flag3_long = data[3]
-            obj.revolt.flag4_long = data[4]
+            obj.revolt.object_type = types[i]
+            obj.revolt.flags = flag_bytes[i]
             bpy.context.scene.objects.link(obj)
-            
-    fh.close()
+        yield min(start + batch_size, len(types)) / len(types)
+
+# Calculates the matrix of each object in a FOB-file from its up and forward vectors.
+def object_matrices(records, matrix):
+    axes = numpy.array(matrix, dtype = numpy.float64)[:3, :3]
+    up = normalize(numpy.dot(-records["up"].astype(numpy.float64), axes))
+    forward = normalize(numpy.dot(records["forward"].astype(numpy.float64), axes))
+    right = numpy.cross(forward, up)
+    rotations = numpy.concatenate([right[:, :, None], forward[:, :, None], up[:, :, None]], axis = 2)
+    return to_matrices(rotations, transform_points(records["position"], matrix))
+
+# Imports track zones (TAZ-file) as cube empties. A cube empty reaches from -1 to 1, so the matrix of each empty holds the size of its zone.
+def import_zones(filepath, matrix):
+    records = formats.load_records(filepath, formats.zone_dtype)
+    objects = []
+    for zone_id, zone_matrix in zip(records["id"].tolist(), zone_matrices(records, matrix)):
+        obj = bpy.data.objects.new("Zone " + str(zone_id), None)
+        obj.empty_draw_type = "CUBE"
+        obj.matrix_local = zone_matrix
+        obj.revolt.type = "ZONE"
+        obj.revolt.zone_id = zone_id
+        bpy.context.scene.objects.link(obj)
+        objects.append(obj)
+    return objects
+
+# Calculates the matrix of each zone in a TAZ-file. The columns are the axes of the zone converted to Blender's axes and scaled by the size of the zone.
+def zone_matrices(records, matrix):
+    axes = numpy.array(matrix, dtype = numpy.float64)[:3, :3]
+    columns = numpy.einsum("nij,jk->nki", records["matrix"].astype(numpy.float64) * records["size"][:, :, None], axes)
+    
+    # Zones are the same when an axis is flipped, so left handed matrices are flipped to avoid negative scales.
+    columns[:, :, 0] *= numpy.where(numpy.linalg.det(columns) < 0, -1, 1)[:, None]
+    return to_matrices(columns, transform_points(records["position"], matrix))
+
+# Imports the lights of a track. (LIT-file) Omni lights become point lamps and spot lights spot lamps.
+# All values are calculated from the records at once before any lamp is created.
+def import_lights(filepath, matrix):
+    records = formats.load_records(filepath, formats.light_dtype)
+    scale = min(matrix.to_scale())
+
+    # The brightest channel sets the energy, so the color stays between 0 and 1. Lights that darken get a negative lamp.
+    colors = records["color"].astype(numpy.float64)
+    peaks = numpy.max(numpy.abs(colors), axis = 1)
+    colors = (numpy.abs(colors) / numpy.where(peaks > 0, peaks, 1)[:, None]).tolist()
+    energies = (peaks / 255).tolist()
+    negative = (numpy.sum(records["color"], axis = 1) < 0).tolist()
+    distances = (records["reach"] * scale).tolist()
+    spot_sizes = numpy.radians(numpy.clip(records["cone"], 1, 180)).tolist()
+    types = records["type"].tolist()
+    flags = records["flag"].tolist()
+    speeds = records["speed"].tolist()
+
+    objects = []
+    for i, light_matrix in enumerate(light_matrices(records, matrix)):
+        lamp = bpy.data.lamps.new("Light", "SPOT" if types[i] & 2 else "POINT")
+        lamp.color = colors[i]
+        lamp.energy = energies[i]
+        lamp.use_negative = negative[i]
+        lamp.distance = distances[i]
+        if types[i] & 2:
+            lamp.spot_size = spot_sizes[i]
+        obj = bpy.data.objects.new(lamp.name, lamp)
+        obj.matrix_local = light_matrix
+        obj.revolt.type = "LIGHT"
+        obj.revolt.light_normal = bool(types[i] & 1)
+        obj.revolt.light_flag = flags[i]
+        obj.revolt.light_speed = speeds[i]
+        bpy.context.scene.objects.link(obj)
+        objects.append(obj)
+    return objects
+
+# Calculates the matrix of each light in a LIT-file. Lamps shine along their -z axis and have y pointing up, so the look and up axes are turned around.
+# Omni lights are often stored without a matrix and get the identity.
+def light_matrices(records, matrix):
+    axes = numpy.array(matrix, dtype = numpy.float64)[:3, :3]
+    rows = records["matrix"].astype(numpy.float64)
+    rows[numpy.all(rows == 0, axis = (1, 2))] = numpy.identity(3)
+    columns = numpy.einsum("nij,jk->nki", rows, axes)
+    columns[:, :, 1:] *= -1
+    columns = columns / numpy.maximum(numpy.sqrt(numpy.sum(columns ** 2, axis = 1)), 1e-12)[:, None, :]
+    columns[:, :, 0] *= numpy.where(numpy.linalg.det(columns) < 0, -1, 1)[:, None]
+    return to_matrices(columns, transform_points(records["position"], matrix))
+
+# Normalizes each row of an array of vectors. Zero vectors are left as they are.
+def normalize(vectors):
+    lengths = numpy.sqrt(numpy.sum(vectors ** 2, axis = 1))
+    return vectors / numpy.where(lengths != 0, lengths, 1)[:, None]
 
 # Creates a Re-Volt start position used in levels.
 def add_revolt_startpos(matrix):
@@ -580,6 +1050,27 @@ def add_revolt_startpos(matrix):
         bmesh.ops.create_cube(bm, matrix = Matrix(((60, 0, 0, pos[0]), (0, 0, 110, pos[1]), (0, -30, 0, 15), (0, 0, 0, 1))) * matrix)
     return bmesh_to_object(bm, "Startpos")
 
+# Returns the spatial index of the imported track in Blender's space. The hitbox is used if there is one, otherwise the world. Returns None if no track has been imported.
+def get_track_index():
+    from bpy_extras.io_utils import axis_conversion
+    world = bpy.context.scene.revolt_world
+    path = bpy.path.abspath(world.path)
+    name = os.path.basename(os.path.normpath(path))
+    matrix = axis_conversion(to_up = world.up_axis, to_forward = world.forward_axis).to_4x4() * world.scale
+    for extension in (".ncp", ".w"):
+        index = spatial.get_index(os.path.join(path, name + extension), matrix)
+        if index != None:
+            return index
+    return None
+
+# Runs all steps of a generator and returns its return value.
+def run_steps(steps):
+    try:
+        while True:
+            next(steps)
+    except StopIteration as stop:
+        return stop.value
+
 # Creates a new object from supplied bmesh and links it to the current scene.
 def bmesh_to_object(bm, name):
     mesh = bpy.data.meshes.new(name)
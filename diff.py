@@ -0,0 +1,159 @@
+# Compares two versions of a PRM-, M-, W- or NCP-file face by face. Faces are matched by their corners and attributes are compared between matched faces.
+# Faces that moved are found with a grid over the face centers. Uses neither bpy nor mathutils, so it can run outside of Blender.
+
+import json
+import numpy
+from . import formats
+
+# Attributes compared between matched faces for each kind of file.
+mesh_attributes = ["uvs", "colors", "type", "texture"]
+hitbox_attributes = ["type", "surface"]
+
+# Class holding the faces of a file. The corners of each face are sorted so two faces with the same corners in a different order are equal.
+# Corner attributes (uvs and colors) are sorted the same way. Unused corners are at the end. The corners in their original order are kept in outlines for drawing.
+class Faces:
+    __slots__ = ("filepath", "corners", "outlines", "counts", "attributes")
+
+    def __init__(self, filepath, corners, counts, attributes, tolerance):
+        self.filepath = filepath
+        self.outlines = corners
+        used = numpy.arange(4)[None, :] < counts[:, None]
+
+        # Sorts the corners of each face by their rounded positions.
+        rounded = numpy.round(corners / tolerance)
+        rounded[~used] = numpy.inf
+        faces = numpy.repeat(numpy.arange(len(counts)), 4)
+        flat = rounded.reshape(-1, 3)
+        order = numpy.lexsort((flat[:, 2], flat[:, 1], flat[:, 0], faces)).reshape(-1, 4) % 4
+        rows = numpy.arange(len(counts))[:, None]
+        self.corners = numpy.where(used[:, :, None], corners[rows, order], 0)
+        self.counts = counts
+        self.attributes = {}
+        for name, values in attributes.items():
+            self.attributes[name] = values[rows, order] if values.ndim > 1 and values.shape[1] == 4 else values
+
+    def __len__(self):
+        return len(self.counts)
+
+    def centers(self):
+        return numpy.sum(self.corners, axis = 1) / numpy.maximum(self.counts, 1)[:, None]
+
+    # Corners relative to the center. Equal for faces that only moved.
+    def shapes(self):
+        used = numpy.arange(4)[None, :] < self.counts[:, None]
+        return numpy.where(used[:, :, None], self.corners - self.centers()[:, None, :], 0)
+
+# Reads the faces of a PRM-, M-, W- or NCP-file. Corners closer than tolerance are treated as equal.
+def load_faces(filepath, tolerance = 0.01):
+    if filepath.lower().endswith(".ncp"):
+        polyhedra = formats.load_hitbox(filepath)
+        corners, counts = formats.polyhedron_outlines(polyhedra)
+        attributes = {"type": polyhedra["type"], "surface": polyhedra["surface"]}
+        return Faces(filepath, corners, counts, attributes, tolerance)
+
+    data = formats.load(filepath)
+    mesh = data.mesh if type(data) is formats.WorldData else data
+    indices = data.global_indices() if type(data) is formats.WorldData else mesh.polygons["vertices"].astype(numpy.int64)
+    positions = mesh.vertices["position"].astype(numpy.float64)
+    corners = positions[numpy.clip(indices, 0, max(len(positions) - 1, 0))] if len(positions) > 0 else numpy.zeros((len(indices), 4, 3))
+    attributes = {"uvs": mesh.polygons["uvs"], "colors": mesh.polygons["colors"], "type": mesh.polygons["type"], "texture": mesh.polygons["texture"]}
+    return Faces(filepath, corners, mesh.corner_counts().astype(numpy.int64), attributes, tolerance)
+
+# Returns a key for each face that is equal for faces with the same rounded corners.
+def face_keys(faces, corners, tolerance):
+    rounded = numpy.round(corners / tolerance).astype(numpy.int64)
+    return [row.tobytes() + bytes([count]) for row, count in zip(rounded.reshape(len(faces), -1), faces.counts.tolist())]
+
+# Sorts points into cells of a grid. Returns a dict mapping each cell to the indices of its points.
+def grid_cells(points, indices, cell_size):
+    cells = {}
+    for i, cell in zip(indices.tolist(), numpy.floor(points[indices] / cell_size).astype(numpy.int64).tolist()):
+        cells.setdefault(tuple(cell), []).append(i)
+    return cells
+
+# Returns the indices of the points in cells (see grid_cells) closer to point than radius, sorted by their distance. The cells have to be at least radius wide.
+def find_range(cells, cell_size, points, point, radius):
+    cell = numpy.floor(point / cell_size).astype(numpy.int64).tolist()
+    found = [i for x in (-1, 0, 1) for y in (-1, 0, 1) for z in (-1, 0, 1) for i in cells.get((cell[0] + x, cell[1] + y, cell[2] + z), [])]
+    if len(found) == 0:
+        return []
+    found = numpy.array(found, dtype = numpy.int64)
+    distances = numpy.sqrt(numpy.sum((points[found] - point) ** 2, axis = 1))
+    order = numpy.argsort(distances, kind = "mergesort")
+    order = order[distances[order] <= radius]
+    return list(zip(found[order].tolist(), distances[order].tolist()))
+
+# Compares two files. Returns a dict with the indices of added (new file), removed (old file), moved and changed faces.
+# Faces with the same corners are matched first. The rest is matched by shape if they moved less than move_radius. Faces that moved are compared as well, so a face can be both moved and changed.
+def compare(old_path, new_path, tolerance = 0.01, move_radius = 100.0):
+    old, new = load_faces(old_path, tolerance), load_faces(new_path, tolerance)
+    old_matches = numpy.full(len(old), -1, dtype = numpy.int64)
+    new_matches = numpy.full(len(new), -1, dtype = numpy.int64)
+
+    # Faces with exactly the same rounded corners.
+    old_keys = {}
+    for i, key in enumerate(face_keys(old, old.corners, tolerance)):
+        old_keys.setdefault(key, []).append(i)
+    for i, key in enumerate(face_keys(new, new.corners, tolerance)):
+        candidates = old_keys.get(key)
+        if candidates:
+            j = candidates.pop()
+            old_matches[j], new_matches[i] = i, j
+
+    # The remaining faces are matched with the closest unmatched face that has the same shape.
+    # Faces whose corners were just rounded differently are found like this as well, they count as unchanged if they're closer than tolerance.
+    moved = []
+    old_left = numpy.nonzero(old_matches < 0)[0]
+    new_left = numpy.nonzero(new_matches < 0)[0]
+    if len(old_left) > 0 and len(new_left) > 0:
+        old_centers, new_centers = old.centers(), new.centers()
+        old_shapes, new_shapes = old.shapes(), new.shapes()
+        cell_size = max(move_radius, tolerance)
+        cells = grid_cells(old_centers, old_left, cell_size)
+        for i in new_left.tolist():
+            for j, distance in find_range(cells, cell_size, old_centers, new_centers[i], move_radius):
+                if old_matches[j] >= 0 or old.counts[j] != new.counts[i] or numpy.max(numpy.abs(old_shapes[j] - new_shapes[i])) > tolerance:
+                    continue
+                old_matches[j], new_matches[i] = i, j
+                if distance > tolerance:
+                    moved.append((j, i, (new_centers[i] - old_centers[j]).tolist()))
+                break
+
+    # Compares the attributes of all matched faces, the ones that moved included.
+    pairs_new = numpy.nonzero(new_matches >= 0)[0]
+    pairs_old = new_matches[pairs_new]
+    changed = {}
+    for name in (hitbox_attributes if old_path.lower().endswith(".ncp") else mesh_attributes):
+        if len(pairs_new) == 0:
+            changed[name] = []
+            continue
+        old_values = old.attributes[name][pairs_old].reshape(len(pairs_new), -1)
+        new_values = new.attributes[name][pairs_new].reshape(len(pairs_new), -1)
+        if name == "uvs":
+            difference = numpy.any(numpy.abs(old_values.astype(numpy.float64) - new_values) > 1e-4, axis = 1)
+        else:
+            difference = numpy.any(old_values != new_values, axis = 1)
+        changed[name] = [(j, i) for j, i in zip(pairs_old[difference].tolist(), pairs_new[difference].tolist())]
+
+    return {
+        "old": old_path,
+        "new": new_path,
+        "added": numpy.nonzero(new_matches < 0)[0].tolist(),
+        "removed": numpy.nonzero(old_matches < 0)[0].tolist(),
+        "moved": moved,
+        "changed": changed,
+        "unchanged": len(pairs_new) - len(set([i for j, i, offset in moved] + [i for pairs in changed.values() for j, i in pairs])),
+        }
+
+# Returns the number of faces in each category of a diff.
+def summary(result):
+    counts = {"added": len(result["added"]), "removed": len(result["removed"]), "moved": len(result["moved"]), "unchanged": result["unchanged"]}
+    for name, pairs in result["changed"].items():
+        counts["changed " + name] = len(pairs)
+    return counts
+
+# Writes a diff as JSON.
+def write_report(result, filepath):
+    fh = open(filepath, "w")
+    json.dump(dict(result, summary = summary(result)), fh, indent = 2, sort_keys = True)
+    fh.close()
@@ -1,19 +1,19 @@
 # File specifications can be found here: http://www.perror.de/rv/rvstruct.html
 # Re-Volt source code can be found here: http://revenant1.net/rvsource.rar
 
-import bpy, bmesh, struct, os, re
+import bpy, bmesh, struct, os, re, numpy, hashlib, time
 from mathutils import Color, Vector, Matrix
-from math import sqrt, pow, ceil, floor, pi
+from math import sqrt, pow, pi
 from bpy_extras.io_utils import axis_conversion
+from . import formats, lod, optimize, workers, collision, nodes, validate, visibility
 
-# This method is used to encode a bmesh. If you want to you can define which faces and verts to use. We do this when encoding W-files for example.
-def encode_mesh(fh, bm, matrix, include_textures, faces = None, verts = None):
+# Converts a bmesh to formats.MeshData. If you want to you can define which faces and verts to use. We do this when encoding W-files for example.
+# normals can be supplied as an array indexed like the vertices of the mesh the bmesh was made from (see mesh_vertex_normals). Otherwise the normals of the bmesh are used.
+def mesh_to_data(bm, matrix, include_textures, faces = None, verts = None, normals = None):
     if faces == None or verts == None:
         faces = list(bm.faces)
         verts = list(bm.verts)
-    
-    # Writes number of polygons and vertices.
-    fh.write(struct.pack("hh", len(faces), len(verts)))
+    vertex_indices = {vertex: i for i, vertex in enumerate(verts)}
     
     # Gets active texture-, uv- and color layers.
     tex_lay = bm.faces.layers.tex.active
@@ -22,86 +22,163 @@ def encode_mesh(fh, bm, matrix, include_textures, faces = None, verts = None):
     alpha_lay = bm.loops.layers.color.get("Alpha")
     type_lay = bm.faces.layers.int.get("revolt_face_type")
     
+    polygons = numpy.zeros(len(faces), formats.polygon_dtype)
+    vertices = numpy.zeros(len(verts), formats.vertex_dtype)
+    
     # Loops through each polygon.
-    for face in faces:
+    for polygon, face in zip(polygons, faces):
         
         # The texture is stored as an integer where 0 means ...a.bmp, 1 means ...b.bmp etc. Let's figure out what number to write!
         if include_textures and tex_lay != None and face[tex_lay].image != None:
-            texture = ord(os.path.splitext(face[tex_lay].image.name)[0][-1:].lower()) - 97
-        else:
-            texture = 0
+            polygon["texture"] = ord(os.path.splitext(face[tex_lay].image.name)[0][-1:].lower()) - 97
         
-
-        # Sets the polygon's bit-field
-        is_quad = 1 if len(face.verts) > 3 else 1
-        type = face[type_lay] & ~1 + is_quad
-
-
-        # Writes type and texture.
-        fh.write(struct.pack("hh", type, texture))
+        # Sets the polygon's bit-field. The first bit tells if it's a quad.
+        is_quad = 1 if len(face.verts) > 3 else 0
+        polygon["type"] = ((face[type_lay] if type_lay != None else 0) & ~1) | is_quad
         looping = [2, 1, 0, 3] if len(face.verts) < 4 else [3, 2, 1, 0]
         
-        # Writes vertex indices.
-        vertex_indices = [verts.index(face.verts[i]) if i < len(face.verts) else 0 for i in looping]
-        fh.write(struct.pack("hhhh", vertex_indices[0], vertex_indices[1], vertex_indices[2], vertex_indices[3]))
-        
-        # Writes color and alpha.
-        for i in looping:
-            color = face.loops[i][color_lay] if i < len(face.loops) and color_lay != None else Color((1, 1, 1))
-            alpha = face.loops[i][alpha_lay] if i < len(face.loops) and alpha_lay != None else Color((1, 1, 1))
-            fh.write(struct.pack("BBBB", int(color.r * 255), int(color.g * 255), int(color.b * 255), int(alpha.v * 255)))
+        # Sets vertex indices, color, alpha and uv. Colors are stored as BGRA and the alpha layer is inverted just like when importing.
+        for corner, i in enumerate(looping):
+            if i < len(face.loops):
+                loop = face.loops[i]
+                polygon["vertices"][corner] = vertex_indices[loop.vert]
+                color = loop[color_lay] if color_lay != None else Color((1, 1, 1))
+                alpha = loop[alpha_lay].v if alpha_lay != None else 0
+                polygon["colors"][corner] = [int(color.b * 255), int(color.g * 255), int(color.r * 255), int((1 - alpha) * 255)]
+                uv = loop[uv_lay].uv if uv_lay != None else [0, 0]
+                polygon["uvs"][corner] = [uv[0], 1 - uv[1]]
+    
+    # Transforms all positions and normals at once. The normals are only rotated.
+    vertices["position"] = formats.transform_points([tuple(vertex.co) for vertex in verts], matrix).reshape(-1, 3)
+    if normals is None:
+        normals = numpy.array([tuple(vertex.normal) for vertex in verts], dtype = numpy.float64).reshape(-1, 3)
+    else:
+        normals = normals[numpy.array([vertex.index for vertex in verts], dtype = numpy.int64)]
+    normals = formats.transform_points(normals, matrix.to_3x3())
+    vertices["normal"] = normals / numpy.maximum(numpy.sqrt(numpy.sum(normals ** 2, axis = 1)), 1e-12)[:, None]
+    
+    return formats.MeshData(polygons, vertices)
+
+# Returns the vertex normals of a mesh as an array. Custom split normals are averaged for each vertex, so normals imported from a file are written back as they were.
+def mesh_vertex_normals(mesh):
+    normals = numpy.zeros(len(mesh.vertices) * 3, dtype = numpy.float32)
+    mesh.vertices.foreach_get("normal", normals)
+    normals = normals.reshape(-1, 3).astype(numpy.float64)
+    if mesh.has_custom_normals:
+        mesh.calc_normals_split()
+        loop_normals = numpy.zeros(len(mesh.loops) * 3, dtype = numpy.float32)
+        mesh.loops.foreach_get("normal", loop_normals)
+        loop_vertices = numpy.zeros(len(mesh.loops), dtype = numpy.int32)
+        mesh.loops.foreach_get("vertex_index", loop_vertices)
+        mesh.free_normals_split()
         
-        # Writes UV.
-        for i in looping:
-            uv = face.loops[i][uv_lay].uv if i < len(face.loops) and uv_lay != None else [0, 0]
-            fh.write(struct.pack("ff", uv[0], 1 - uv[1]))
-    
-    # Loops through each vertex
-    for vertex in verts:
-        co = Vector(vertex.co) * matrix
-        normal = revolt_fix(vertex.normal, 1)
-        fh.write(struct.pack("fff", co[0], co[1], co[2]))
-        fh.write(struct.pack("fff", normal[0], normal[1], normal[2]))
+        # Vertices without loops keep their own normal.
+        summed = numpy.zeros((len(mesh.vertices), 3))
+        numpy.add.at(summed, loop_vertices, loop_normals.reshape(-1, 3))
+        used = numpy.any(summed != 0, axis = 1)
+        normals[used] = summed[used]
+    return normals / numpy.maximum(numpy.sqrt(numpy.sum(normals ** 2, axis = 1)), 1e-12)[:, None]
+
+# This method is used to encode a bmesh. If you want to you can define which faces and verts to use. We do this when encoding W-files for example.
+def encode_mesh(fh, bm, matrix, include_textures, faces = None, verts = None):
+    formats.write_mesh(fh, mesh_to_data(bm, matrix, include_textures, faces, verts))
         
-# Exports a model. (PRM-/M-file)
-def export_model(filepath, matrix, include_textures, mesh = None):
+# Exports a model. (PRM-/M-file) If lod_levels is higher than 1, progressively decimated versions of the mesh are written after the original one. Returns the number of triangles in each level.
+def export_model(filepath, matrix, include_textures, mesh = None, lod_levels = 1, lod_ratio = 0.5, optimize_order = False, sort_faces = False):
+    return export_models([(filepath, mesh or bpy.context.object.data)], matrix, include_textures, lod_levels, lod_ratio, optimize_order, sort_faces)[0]
+
+# Exports several models at once. Each job is a tuple with a filepath and a mesh. The meshes are converted here, everything after that (decimating the levels of detail, sorting and encoding)
+# is done in worker processes with one model per worker, e.g. the body and the wheels of a car at the same time.
+# If optimize_order is True the polygons are sorted for the vertex cache and the vertices by first use.
+# If sort_faces is True the polygons are sorted into runs with the same texture page and render state afterwards.
+def export_models(jobs, matrix, include_textures, lod_levels = 1, lod_ratio = 0.5, optimize_order = False, sort_faces = False):
+    
+    # Converts the meshes here since bmesh can't be used outside of Blender's main thread.
+    meshes = []
+    for filepath, mesh in jobs:
+        bm = bmesh.new()
+        bm.from_mesh(mesh)
+        meshes.append(mesh_to_data(bm, matrix, include_textures, normals = mesh_vertex_normals(mesh)))
+        bm.free()
+    
+    encoded = workers.parallel_map(lod.encode_levels_job, [(data, lod_levels, lod_ratio, optimize_order, sort_faces) for data in meshes])
+    
+    # Writes the files and reports the triangle budget of each level and what the sorting changed.
+    budgets = []
+    for (filepath, mesh), (content, triangles, notes) in zip(jobs, encoded):
+        fh = open(filepath, "wb")
+        fh.write(content)
+        fh.close()
+        budgets.append(triangles)
+        for note in notes:
+            print(os.path.basename(filepath) + ": " + note)
+        print(os.path.basename(filepath) + ": " + ", ".join(["LOD " + str(i) + ": " + str(count) + " triangles" for i, count in enumerate(triangles)]))
+    return budgets
+
+# Exports a level/world. (W-file) If sort_faces is True the faces are sorted into runs with the same texture page and render state.
+# Returns the number of runs in the written file.
+def export_world(filepath, matrix, mesh = None, sort_faces = False):
+    mesh = mesh or bpy.context.object.data
+    normals = mesh_vertex_normals(mesh)
     bm = bmesh.new()
-    bm.from_mesh(mesh or bpy.context.object.data)
+    bm.from_mesh(mesh)
+    
+    # Each face is written as its own mesh. The bounding headers and a "FunnyBall" surrounding the whole level are calculated from the arrays.
+    chunks = [mesh_to_data(bm, matrix, True, [face], list(face.verts), normals) for face in bm.faces]
+    if sort_faces:
+        chunks = optimize.sort_chunks_by_state(chunks)
+    world = formats.WorldData.from_chunks(chunks)
     fh = open(filepath, "wb")
-    encode_mesh(fh, bm, matrix, include_textures)
+    formats.write_world(fh, world)
     fh.close()
     bm.free()
+    return optimize.count_runs(world.mesh.polygons)
 
-# Exports a level/world. (W-file)
-def export_world(filepath, matrix, mesh = None):
-    bm = bmesh.new()
-    bm.from_mesh(mesh or bpy.context.object.data)
-    fh = open(filepath, "wb")
-    fh.write(struct.pack("l", len(bm.faces)))
-    
-    # Loops through each face.
-    for face in bm.faces:
-        c = Vector(face.calc_center_bounds()) * matrix
-        r = max([get_distance(Vector(v.co) * matrix, c) for v in face.verts])
-        fh.write(struct.pack("ffff", c[0], c[1], c[2], r))
-        p1 = Vector([min([v.co.x for v in face.verts]), min([v.co.y for v in face.verts]), min([v.co.z for v in face.verts])]) * matrix
-        p2 = Vector([max([v.co.x for v in face.verts]), max([v.co.y for v in face.verts]), max([v.co.z for v in face.verts])]) * matrix
-        fh.write(struct.pack("ffffff", p1[0], p1[1], p1[2], p2[0], p2[1], p2[2]))
-        encode_mesh(fh, bm, matrix, True, [face], list(face.verts))
-    
-    # Writes a "FunnyBall" surrounding the whole level
-    p1 = Vector([min([v.co.x for v in bm.verts]), min([v.co.y for v in bm.verts]), min([v.co.z for v in bm.verts])]) * matrix
-    p2 = Vector([max([v.co.x for v in bm.verts]), max([v.co.y for v in bm.verts]), max([v.co.z for v in bm.verts])]) * matrix
-    fh.write(struct.pack("lffff", 1, (p1.x + p2.x) / 2, (p1.y + p2.y) / 2, (p1.z + p2.z) / 2, get_distance(p1, p2) / 2))
-    fh.write(struct.pack("l", len(bm.faces)))
-    for i in range(len(bm.faces)):
-        fh.write(struct.pack("l", i))
-    
-    # Writes an "UnknownList" with length 0.
-    fh.write(struct.pack("l", 0))
+# Exports meshes that were imported as separate chunks (see decode.iter_world_to_chunks) to one W-file with one chunk per mesh.
+# Chunks that haven't been edited since the import are copied from the file they came from together with their bounding headers. The other chunks are sorted for the vertex cache if optimize_order is True.
+# Returns the number of runs in the written file.
+def export_world_chunks(filepath, matrix, meshes, sort_faces = False, optimize_order = False):
+    meshes = sorted(meshes, key = lambda mesh: mesh.get("revolt_chunk", 0))
+    sources = {}
+    chunks, headers, reused = [], [], 0
+    for mesh in meshes:
+        source = mesh.get("revolt_chunk_source", "")
+        values = list(mesh.get("revolt_matrix", []))
+        
+        # A chunk can only be copied if the export matrix undoes the import matrix.
+        unchanged = len(values) == 16 and os.path.isfile(source) and mesh_fingerprint(mesh, Matrix()) == mesh.get("revolt_chunk_hash")
+        if unchanged and numpy.allclose(numpy.dot(numpy.array(values).reshape(4, 4), numpy.array(matrix)), numpy.identity(4), atol = 1e-5):
+            if source not in sources:
+                sources[source] = formats.load(source)
+            if mesh["revolt_chunk"] < len(sources[source]):
+                chunks.append(sources[source].chunk(mesh["revolt_chunk"]))
+                headers.append(sources[source].headers[mesh["revolt_chunk"]])
+                reused += 1
+                continue
+        
+        bm = bmesh.new()
+        bm.from_mesh(mesh)
+        data = mesh_to_data(bm, matrix, True, normals = mesh_vertex_normals(mesh))
+        bm.free()
+        if optimize_order:
+            data = optimize.optimize_mesh(data)[0]
+        if sort_faces:
+            data = optimize.sort_by_state(data)
+        chunks.append(data)
+        headers.append(formats.WorldData.calculate_header(data))
+    world = formats.WorldData.from_chunks(chunks, numpy.array(headers, formats.chunk_header_dtype))
+    
+    # The file is written exactly as it was read when none of its chunks changed.
+    if reused == len(meshes) and len(sources) == 1:
+        source = list(sources.values())[0]
+        if [mesh["revolt_chunk"] for mesh in meshes] == list(range(len(source))):
+            world.funnyballs, world.tail = source.funnyballs, source.tail
     
+    fh = open(filepath, "wb")
+    formats.write_world(fh, world)
     fh.close()
-    bm.free()
+    print(os.path.basename(filepath) + ": " + str(reused) + " of " + str(len(meshes)) + " chunks copied unchanged")
+    return optimize.count_runs(world.mesh.polygons)
 
 # Exports a level/world according to the settings in the "Re-Volt world export" panel.
 def export_world_full():
@@ -113,36 +190,73 @@ def export_world_full():
     # Exits if the directory doesn't exist.
     if not os.path.isdir(full_path):
         return
-    
-    # Loops through each mesh.
-    for mesh in bpy.data.meshes:
-    
-        # Exports to a W-file.
-        if mesh.revolt.export_as_w:
-            export_world(full_path + bpy.path.ensure_ext(mesh.name, ".w"), matrix, mesh)
-            
-        # Exports to a PRM-file.
-        if mesh.revolt.export_as_prm:
-            export_model(full_path + bpy.path.ensure_ext(mesh.name, ".prm"), matrix, True, mesh)
-            
-        # Exports to a NCP-file.
-        if mesh.revolt.export_as_ncp:
-            export_hitbox(full_path + bpy.path.ensure_ext(mesh.name, ".ncp"), matrix, mesh)
-            
-    # Exports each texture.
-    bpy.context.scene.render.image_settings.file_format = "BMP"
-    for image in bpy.data.images:
-        temp_image = image.copy()
-        temp_image.scale(256, 256)
-        temp_image.save_render("\\".join(path) + "\\" + path[-1] + os.path.splitext(image.name)[0][-1] + ".bmp")
-        bpy.data.images.remove(temp_image)
+    report = {}
+
+    # The meshes use the atlas pages while they're exported and get their own textures back afterwards.
+    atlas_state = None
+    if world_parameters.texture_atlas:
+        atlas_state, report["texture pages"], report["clamped faces"] = build_texture_atlas([mesh for mesh in bpy.data.meshes if mesh.revolt.export_as_w or mesh.revolt.export_as_prm], full_path, path[-1], world_parameters.atlas_size)
+
+    # Meshes with the same geometry are written once and all their instances use that model.
+    instances = [obj for obj in bpy.context.scene.objects if obj.type == "MESH" and obj.data.revolt.export_as_prm]
+    models = [mesh for mesh in bpy.data.meshes if mesh.revolt.export_as_prm]
+    replacements = None
+    if world_parameters.deduplicate_models:
+        replacements = deduplicate_meshes(models)
+        models = [mesh for mesh in models if replacements[mesh] == mesh]
+    report["models"] = len(models)
+    report["instances"] = len(instances)
+    print(str(len(instances)) + " instances of " + str(len(models)) + " unique models")
+
+    try:
+        runs = export_world_meshes(full_path, path, matrix, world_parameters, atlas_state == None, models)
+        if world_parameters.sort_faces:
+            report["face runs"] = runs
+    finally:
+        if atlas_state != None:
+            restore_texture_atlas(atlas_state)
     
     # Exports world models. (FIN-file)
-    export_world_models("\\".join(path) + "\\" + path[-1] + ".fin", matrix, [obj for obj in bpy.context.scene.objects if obj.type == "MESH" and obj.data.revolt.export_as_prm])
+    export_world_models("\\".join(path) + "\\" + path[-1] + ".fin", matrix, instances, replacements)
     
     # Exports world objects. (FOB-file)
     export_world_objects("\\".join(path) + "\\" + path[-1] + ".fob", matrix, [obj for obj in bpy.data.objects if obj.revolt.type == "OBJECT"])
-    
+
+    # Exports the position nodes and the AI nodes. (PAN- and FAN-file)
+    for object_name, extension, export in ((world_parameters.position_nodes, ".pan", export_position_nodes), (world_parameters.ai_nodes, ".fan", export_ai_nodes)):
+        obj = bpy.context.scene.objects.get(object_name)
+        if obj != None and obj.type == "MESH":
+            problems = export("\\".join(path) + "\\" + path[-1] + extension, matrix, obj)
+            for rule, message, items in problems:
+                print(path[-1] + extension + ": " + message + " (" + str(len(items)) + ")")
+            report[extension[1:] + " problems"] = len(problems)
+
+    # Exports the track zones (TAZ-file) and checks that the floors of the hitbox and the AI nodes are inside them.
+    zone_objects = [obj for obj in bpy.context.scene.objects if obj.revolt.type == "ZONE"]
+    if len(zone_objects) > 0:
+        base = "\\".join(path) + "\\" + path[-1]
+        export_zones(base + ".taz", matrix, zone_objects)
+        start_time = time.time()
+        issues = validate.check_zone_coverage(base + ".taz", base + ".ncp", base + ".fan")
+        for issue in issues:
+            print(os.path.basename(issue["file"]) + ": " + issue["message"] + " (" + str(issue["count"]) + ")")
+        print("Zone coverage checked in " + str(int((time.time() - start_time) * 1000)) + " ms")
+        report["zone gaps"] = sum([issue["count"] for issue in issues])
+
+    # Exports the lights. (LIT-file)
+    light_objects = [obj for obj in bpy.context.scene.objects if obj.revolt.type == "LIGHT"]
+    if len(light_objects) > 0:
+        report["lights"] = export_lights("\\".join(path) + "\\" + path[-1] + ".lit", matrix, light_objects)
+
+    # Generates the visiboxes (VIS-file) from the exported W-file and the nodes or hitbox next to it.
+    base = "\\".join(path) + "\\" + path[-1]
+    if world_parameters.visiboxes and os.path.isfile(base + ".w"):
+        scale = min(matrix.to_scale())
+        result = visibility.generate(base + ".w", base + ".vis", world_parameters.camera_height * scale, world_parameters.camera_spacing * scale)
+        if result != None:
+            print(str(result["visiboxes"]) + " visiboxes in " + str(len(result["regions"])) + " regions, " + str(result["average drawn"]) + " of " + str(result["meshes"]) + " meshes drawn on average (" + str(result["seconds"]) + " s)")
+            report["visibox savings"] = str(int(result["average savings"] * 100)) + "%"
+
     # Exports the INF-file.
     fh = open("\\".join(path) + "\\" + path[-1] + ".inf", "w")
     startpos_object = bpy.context.scene.objects.get(world_parameters.startpos_object)
@@ -160,28 +274,297 @@ def export_world_full():
     char_count = max([len(x) for x in params]) + 5
     fh.writelines([p.ljust(char_count) + params[p] + "\n" for p in params])
     fh.close()
+    return report
+
+# Exports the meshes of a world, the models and the textures. The textures aren't exported when they've already been written as atlas pages.
+# Returns the number of texture and render state runs in all W-files.
+def export_world_meshes(full_path, path, matrix, world_parameters, include_textures, models):
+    runs = 0
+    chunk_meshes = {}
+
+    # Loops through each mesh.
+    for mesh in bpy.data.meshes:
+    
+        # Exports to a W-file. Meshes that were imported as separate chunks are collected and written to their W-file together.
+        if mesh.revolt.export_as_w and "revolt_world_file" in mesh:
+            chunk_meshes.setdefault(mesh["revolt_world_file"], []).append(mesh)
+        elif mesh.revolt.export_as_w:
+            runs += export_world(full_path + bpy.path.ensure_ext(mesh.name, ".w"), matrix, mesh, world_parameters.sort_faces)
+            
+        # Exports to a NCP-file.
+        if mesh.revolt.export_as_ncp:
+            export_hitbox(full_path + bpy.path.ensure_ext(mesh.name, ".ncp"), matrix, mesh, world_parameters.raster_size)
+    
+    for world_file, meshes in sorted(chunk_meshes.items()):
+        runs += export_world_chunks(full_path + world_file, matrix, meshes, world_parameters.sort_faces, world_parameters.optimize_order)
+    
+    # Exports PRM-files all at once so the levels of detail can be generated in parallel.
+    export_models([(full_path + bpy.path.ensure_ext(mesh.name, ".prm"), mesh) for mesh in models], matrix, True, world_parameters.lod_levels, world_parameters.lod_ratio, world_parameters.optimize_order, world_parameters.sort_faces)
+            
+    # Exports each texture.
+    if include_textures:
+        bpy.context.scene.render.image_settings.file_format = "BMP"
+        for image in bpy.data.images:
+            temp_image = image.copy()
+            temp_image.scale(256, 256)
+            temp_image.save_render("\\".join(path) + "\\" + path[-1] + os.path.splitext(image.name)[0][-1] + ".bmp")
+            bpy.data.images.remove(temp_image)
+    return runs
+
+# Packs the images used by the meshes into atlas pages and saves them as <name>a.bmp, <name>b.bmp etc. in the folder.
+# The UVs and images of the meshes are changed to use the pages. Returns the state needed by restore_texture_atlas, the number of pages and the number of clamped faces.
+def build_texture_atlas(meshes, folder, name, page_size = 256, padding = 2):
+    from . import atlas
+    meshes = [mesh for mesh in meshes if mesh.uv_textures.active != None and mesh.uv_layers.active != None]
+    images = []
+    for mesh in meshes:
+        for face in mesh.uv_textures.active.data:
+            if face.image != None and face.image not in images:
+                images.append(face.image)
+
+    # Reads the pixels and scales images that don't fit on a page.
+    pixels, sizes = [], []
+    for image in images:
+        width, height = image.size
+        data = numpy.array(image.pixels[:], dtype = numpy.float32).reshape(height, width, 4) if width * height > 0 else numpy.ones((1, 1, 4), dtype = numpy.float32)
+        width, height = atlas.fit_size(data.shape[1], data.shape[0], page_size, padding)
+        pixels.append(atlas.resize(data, width, height))
+        sizes.append((width + 2 * padding, height + 2 * padding))
+    placements, page_count = atlas.pack(sizes, page_size)
+    if page_count > 26:
+        raise ValueError("The textures need " + str(page_count) + " pages but only 26 are possible")
+
+    # Saves the pages. The files are named after the folder and the last letter of the image names gives the texture index, like for any other texture.
+    bpy.context.scene.render.image_settings.file_format = "BMP"
+    page_images = []
+    for i, page in enumerate(atlas.compose(pixels, placements, page_count, page_size, padding)):
+        page_image = bpy.data.images.new("atlas_" + chr(97 + i), page_size, page_size, alpha = True)
+        page_image.pixels = page.ravel()
+        page_image.save_render(os.path.join(folder, name + chr(97 + i) + ".bmp"))
+        page_images.append(page_image)
+
+    areas = [(x + padding, y + padding, size[0] - 2 * padding, size[1] - 2 * padding) for (page, x, y), size in zip(placements.tolist(), sizes)]
+    image_indices = {image: i for i, image in enumerate(images)}
+    state, clamped = [], 0
+    for mesh in meshes:
+        uvs = numpy.zeros(len(mesh.loops) * 2, dtype = numpy.float32)
+        mesh.uv_layers.active.data.foreach_get("uv", uvs)
+        loop_starts = numpy.zeros(len(mesh.polygons), dtype = numpy.int32)
+        mesh.polygons.foreach_get("loop_start", loop_starts)
+        texture_data = mesh.uv_textures.active.data
+        old_images = [face.image for face in texture_data]
+        face_images = numpy.array([image_indices.get(image, -1) for image in old_images], dtype = numpy.int64)
+        state.append((mesh, uvs, old_images))
+
+        new_uvs, mesh_clamped = atlas.remap_uvs(uvs, loop_starts.astype(numpy.int64), face_images, areas, page_size)
+        clamped += mesh_clamped
+        mesh.uv_layers.active.data.foreach_set("uv", new_uvs.astype(numpy.float32).ravel())
+        for face, index in zip(texture_data, face_images.tolist()):
+            if index >= 0:
+                face.image = page_images[placements[index, 0]]
+    return (state, page_images), page_count, clamped
+
+# Gives the meshes back their UVs and images and removes the atlas pages from the file.
+def restore_texture_atlas(state):
+    meshes, page_images = state
+    for mesh, uvs, old_images in meshes:
+        mesh.uv_layers.active.data.foreach_set("uv", uvs)
+        for face, image in zip(mesh.uv_textures.active.data, old_images):
+            face.image = image
+    for image in page_images:
+        bpy.data.images.remove(image)
+
+# Model file names used for new cars. Re-Volt numbers the wheels front left, front right, back left, back right.
+car_model_names = ["body.prm", "wheelfl.prm", "wheelfr.prm", "wheelbl.prm", "wheelbr.prm"]
+
+# Exports a car according to the settings in the "Re-Volt car export" panel. (PRM-files, HUL-file and parameters.txt)
+# Parts that haven't changed since they were last exported to the same file are skipped. Returns a list of the written files or None if the car path doesn't exist.
+def export_car():
+    car = bpy.context.scene.revolt_car
+    full_path = bpy.path.abspath(car.path)
+    matrix = axis_conversion(from_up = car.up_axis, from_forward = car.forward_axis).to_4x4() * (1 / car.scale)
+    
+    # Exits if the directory doesn't exist.
+    if not os.path.isdir(full_path):
+        return None
+    
+    # Paths in parameters.txt are relative to the Re-Volt directory. (cars\name\body.prm)
+    path = [x for x in re.split("[/\\\\]", full_path) if x != ""]
+    revolt_path = full_path + os.sep + ".." + os.sep + ".." + os.sep
+    car_folder = "\\".join(path[-2:]) + "\\"
+    
+    # Reads the current parameters.txt so that unknown parameters are kept.
+    params_path = os.path.join(full_path, "parameters.txt")
+    lines = ["{\n", "}\n"]
+    models = {}
+    if os.path.isfile(params_path):
+        fh = open(params_path, "r")
+        lines = fh.readlines()
+        fh.close()
+        models = read_parameter_paths(lines)
+    
+    # Collects the parts. The body is model 0 and the wheels are model 1 to 4.
+    wheels = [car.wheel0, car.wheel1, car.wheel2, car.wheel3]
+    parts = [(0, bpy.context.scene.objects.get(car.body_object))] + [(i + 1, bpy.context.scene.objects.get(wheel.object)) for i, wheel in enumerate(wheels)]
+    parts = [(num, obj) for num, obj in parts if obj != None and obj.type == "MESH"]
+    
+    # Only exports parts that have changed.
+    jobs = []
+    fingerprints = []
+    written = []
+    values = {"": {}, "BODY": {}}
+    for num, obj in parts:
+        model = models.get("MODEL " + str(num)) or car_folder + car_model_names[num]
+        filepath = revolt_path + model.replace("\\", os.sep)
+        values[""]["MODEL " + str(num)] = '"' + model + '"'
+        fingerprint = mesh_fingerprint(obj.data, matrix)
+        if get_export_hash(obj.data, filepath) != fingerprint or not os.path.isfile(filepath):
+            jobs.append((filepath, obj.data))
+            fingerprints.append(fingerprint)
+    export_models(jobs, matrix, True)
+    for (filepath, mesh), fingerprint in zip(jobs, fingerprints):
+        set_export_hash(mesh, filepath, fingerprint)
+        written.append(filepath)
+    
+    # Exports the convex hull of the body if it has changed.
+    body = bpy.context.scene.objects.get(car.body_object)
+    if body != None and body.type == "MESH":
+        hull = models.get("COLL") or car_folder + "hull.hul"
+        hull_path = revolt_path + hull.replace("\\", os.sep)
+        values[""]["COLL"] = '"' + hull + '"'
+        fingerprint = mesh_fingerprint(body.data, matrix)
+        if get_export_hash(body.data, hull_path) != fingerprint or not os.path.isfile(hull_path):
+            export_convex_hull(hull_path, car.scale, body.data)
+            set_export_hash(body.data, hull_path, fingerprint)
+            written.append(hull_path)
+        values["BODY"]["ModelNum"] = "0"
+        values["BODY"]["Offset"] = " ".join([str(round(x, 6)) for x in body.location * matrix])
+    
+    # Sets the car parameters and the parameters of each wheel.
+    values[""]["Name"] = '"' + car.name + '"'
+    values[""]["Class"] = car.engine_class
+    values[""]["SteerRate"] = str(round(car.steer_rate, 6))
+    for i, wheel in enumerate(wheels):
+        obj = bpy.context.scene.objects.get(wheel.object)
+        block = values["WHEEL " + str(i)] = {}
+        block["ModelNum"] = str(i + 1) if obj != None and obj.type == "MESH" else "-1"
+        if obj != None:
+            block["Offset1"] = " ".join([str(round(x, 6)) for x in obj.location * matrix])
+        block["IsPresent"] = "TRUE" if wheel.is_present else "FALSE"
+        block["IsPowered"] = "TRUE" if wheel.is_powered else "FALSE"
+        block["IsTurnable"] = "TRUE" if wheel.is_turnable else "FALSE"
+        block["SteerRatio"] = str(round(wheel.steer_ratio, 6))
+        block["EngineRatio"] = str(round(wheel.engine_ratio, 6))
+    
+    fh = open(params_path, "w")
+    fh.writelines(update_parameters(lines, values))
+    fh.close()
+    written.append(params_path)
+    return written
+
+# Returns a hash of everything that ends up in an exported mesh. Used to skip exporting meshes that haven't changed.
+# The file the mesh is written to isn't part of the hash. The hashes are stored for each file instead (see get_export_hash), since one mesh can be used by several models.
+def mesh_fingerprint(mesh, matrix):
+    md5 = hashlib.md5(numpy.array(matrix, dtype = numpy.float32).tobytes())
+    
+    # Reads the arrays in bulk.
+    coordinates = numpy.zeros(len(mesh.vertices) * 3, dtype = numpy.float32)
+    mesh.vertices.foreach_get("co", coordinates)
+    loop_vertices = numpy.zeros(len(mesh.loops), dtype = numpy.int32)
+    mesh.loops.foreach_get("vertex_index", loop_vertices)
+    loop_totals = numpy.zeros(len(mesh.polygons), dtype = numpy.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    for array in (coordinates, loop_vertices, loop_totals, mesh_vertex_normals(mesh).astype(numpy.float32)):
+        md5.update(array.tobytes())
+    for layers, attribute, size in ((mesh.uv_layers, "uv", 2), (mesh.vertex_colors, "color", 3), (mesh.polygon_layers_int, "value", 1)):
+        for layer in layers:
+            values = numpy.zeros(len(layer.data) * size, dtype = numpy.float32)
+            layer.data.foreach_get(attribute, values)
+            md5.update(layer.name.encode("utf-8") + values.tobytes())
+    
+    # Textures are stored per polygon.
+    if mesh.uv_textures.active != None:
+        md5.update("".join([face.image.name if face.image != None else "" for face in mesh.uv_textures.active.data]).encode("utf-8"))
+    return md5.hexdigest()
+
+# Returns the hash of a mesh from when it was last exported to a file, or None if it never was.
+# The hashes are kept in a dict on the mesh. Its keys are hashes of the paths since the names of ID properties are limited to 63 characters.
+def get_export_hash(mesh, filepath):
+    hashes = mesh.get("revolt_export_hashes")
+    return hashes.get(hashlib.md5(os.path.normpath(filepath).encode("utf-8")).hexdigest()) if hashes != None else None
+
+def set_export_hash(mesh, filepath, fingerprint):
+    if mesh.get("revolt_export_hashes") == None:
+        mesh["revolt_export_hashes"] = {}
+    mesh["revolt_export_hashes"][hashlib.md5(os.path.normpath(filepath).encode("utf-8")).hexdigest()] = fingerprint
+
+# Reads the model and hull paths from the lines of a parameters.txt. Returns a dict mapping keys like "MODEL 0" and "COLL" to the paths without quotes.
+def read_parameter_paths(lines):
+    paths = {}
+    for line in lines:
+        params = re.findall("(['\\\"].+['\\\"]|[^\s]+)", line.split(";")[0])
+        if len(params) > 2 and params[0].upper() == "MODEL":
+            paths["MODEL " + params[1]] = params[2][1:-1]
+        elif len(params) > 1 and params[0].upper() == "COLL":
+            paths["COLL"] = params[1][1:-1]
+    return paths
+
+# Updates the values in the lines of a parameters.txt and returns the new lines. values maps a block name ("" for the main block) to a dict of keys and values.
+# Keys can be several words like "MODEL 0". Missing keys are added at the end of their block and missing blocks at the end of the main block.
+def update_parameters(lines, values):
+    remaining = {block.upper(): dict(params) for block, params in values.items()}
+    output = []
+    stack = []
+    for line in lines:
+        content = line.split(";")[0].strip()
+        
+        # A "{" starts a block. The first one is the main block.
+        if "{" in content:
+            stack.append(content[:content.index("{")].strip().upper())
+            output.append(line)
+            continue
+        
+        # A "}" ends a block so the parameters missing in it are added.
+        if "}" in content:
+            block = stack.pop() if len(stack) > 0 else None
+            output += ["    " + key + " " + value + "\n" for key, value in remaining.pop(block, {}).items()]
+            if block == "":
+                for name in sorted(remaining):
+                    output += ["    " + name + " {\n"] + ["        " + key + " " + value + "\n" for key, value in remaining[name].items()] + ["    }\n"]
+                remaining = {}
+            output.append(line)
+            continue
+        
+        # Replaces the value but keeps the indentation.
+        params = remaining.get(stack[-1] if len(stack) > 0 else None, {})
+        words = [word.upper() for word in content.split()]
+        for key in list(params):
+            if words[:len(key.split())] == key.upper().split():
+                line = line[:len(line) - len(line.lstrip())] + key + " " + params.pop(key) + "\n"
+                break
+        output.append(line)
+    return output
 
 # Exports a hitbox. (NCP-file)
-def export_hitbox(filepath, matrix, mesh = None):
+def export_hitbox(filepath, matrix, mesh = None, raster_size = 1024):
     bm = bmesh.new()
     bm.from_mesh(mesh or bpy.context.object.data)
     fh = open(filepath, "wb")
-    fh.write(struct.pack("h", len(bm.faces)))
+    fh.write(struct.pack("<h", len(bm.faces)))
     material_layer = bm.faces.layers.int.get("revolt_material") or bm.faces.layers.int.new("revolt_material")
     
-    print(fh.name)
-    
     # Loops through each face.
+    bounds = []
     for face in bm.faces:
         # Writes face type (tris / quad) and material. (see panels/face_properties_panel.py for available material types)
-        fh.write(struct.pack("ll", 0 if len(face.verts) < 4 else 1, face[material_layer]))
+        fh.write(struct.pack("<ll", 0 if len(face.verts) < 4 else 1, face[material_layer]))
         
         # Writes the floor plane
         normal = face.normal * matrix
         normal.length = 1
         point = face.verts[0].co * matrix
         distance = -point.x * normal.x - point.y * normal.y - point.z * normal.z
-        fh.write(struct.pack("ffff", normal[0], normal[1], normal[2], distance))
+        fh.write(struct.pack("<ffff", normal[0], normal[1], normal[2], distance))
         
         # Writes each cutting plane.
         vertex_count = len(face.verts[:4])
@@ -191,67 +574,71 @@ def export_hitbox(filepath, matrix, mesh = None):
             normal2 = normal.cross(a - b)
             normal2.length = 1
             distance = -a.x * normal2.x - a.y * normal2.y - a.z * normal2.z
-            fh.write(struct.pack("ffff", normal2[0], normal2[1], normal2[2], distance))
+            fh.write(struct.pack("<ffff", normal2[0], normal2[1], normal2[2], distance))
             
         # Writes the rest of the cutting planes if the number of edges is lower than four.
         for i in range(4 - vertex_count):
-            fh.write(struct.pack("ffff", 0, 0, 0, 0))
+            fh.write(struct.pack("<ffff", 0, 0, 0, 0))
         
         # Writes bounding box.
         verts = [v.co * matrix for v in face.verts]
         min_point = [min([v.x for v in verts]), min([v.y for v in verts]), min([v.z for v in verts])]
         max_point = [max([v.x for v in verts]), max([v.y for v in verts]), max([v.z for v in verts])]
-        fh.write(struct.pack("ffffff", min_point[0], max_point[0], min_point[1], max_point[1], min_point[2], max_point[2]))
+        bounds.append((min_point[0], max_point[0], min_point[1], max_point[1], min_point[2], max_point[2]))
+        fh.write(struct.pack("<ffffff", *bounds[-1]))
         
     # Writes the lookup grid.
-    raster_size = 1024
-    x_coords = [(v.co * matrix).x for v in bm.verts]
-    z_coords = [(v.co * matrix).z for v in bm.verts]
-    min_x = min(x_coords)
-    max_x = max(x_coords)
-    min_z = min(z_coords)
-    max_z = max(z_coords)
-    x_size = ceil((max_x - min_x) / raster_size)
-    z_size = ceil((max_z - min_z) / raster_size)
-    lookup_table = [[] for n in range(x_size * z_size)]
-    
-    for face in bm.faces:
-        verts = [v.co * matrix for v in face.verts]
-        from_x = floor((min([v.x for v in verts]) - min_x) / raster_size)
-        to_x = ceil((max([v.x for v in verts]) - min_x) / raster_size)
-        from_z = floor((min([v.z for v in verts]) - min_z) / raster_size)
-        to_z = ceil((max([v.z for v in verts]) - min_z) / raster_size)
-        for x in range(from_x, to_x):
-            for z in range(from_z, to_z):
-                lookup_table[x + z * x_size].append(face.index)
-    
-    fh.write(struct.pack("fffff", min_x, min_z, x_size, z_size, raster_size))
-    for list in lookup_table:
-        fh.write(struct.pack("l", len(list)))
-        for index in list:
-            fh.write(struct.pack("l", index))
-        
+    formats.write_hitbox_grid(fh, collision.build_grid(bounds, raster_size))
     fh.close()
     bm.free()
 
 # Exports world objects. (FIN-file)
-def export_world_models(filepath, matrix, objects):
-    fh = open(filepath, "wb")
+def export_world_models(filepath, matrix, objects, replacements = None):
+    records = numpy.zeros(len(objects), formats.instance_dtype)
     
-    # Writes the number of objects.
-    fh.write(struct.pack("l", len(objects)))
-    
-    # Loops through each object.
-    for obj in objects:
-        mesh_name = bpy.path.ensure_ext(obj.data.name, ".PRM").upper().replace(".", "\x00")[:8].ljust(8, "\x00")
-        fh.write(bytes(mesh_name, "ASCII"))
+    # Loops through each object. Objects whose mesh has a replacement use the model of the replacement.
+    for record, obj in zip(records, objects):
+        mesh = replacements.get(obj.data, obj.data) if replacements != None else obj.data
+        record["name"] = bytes(bpy.path.ensure_ext(mesh.name, ".PRM").upper().replace(".", "\x00")[:8], "ASCII")
         v1 = Vector((obj.matrix_local[0].x, obj.matrix_local[1].x, obj.matrix_local[2].x)) * matrix.normalized()
         v2 = -Vector((obj.matrix_local[0].z, obj.matrix_local[1].z, obj.matrix_local[2].z)) * matrix.normalized()
         v3 = Vector((obj.matrix_local[0].y, obj.matrix_local[1].y, obj.matrix_local[2].y)) * matrix.normalized()
-        location = obj.location * matrix
-        fh.write(struct.pack("BBBLBBBBfffffffffffff", 0, 0, 0, 0, 0, 0, 0, 0, 0, location.x, location.y, location.z, v1.x, v1.y, v1.z, v2.x, v2.y, v2.z, v3.x, v3.y, v3.z))
+        record["position"] = obj.location * matrix
+        record["matrix"] = [v1, v2, v3]
         
+    fh = open(filepath, "wb")
+    formats.write_records(fh, records, formats.instance_dtype)
     fh.close()
+
+# Returns a hash of the geometry, UVs, colors, face types and textures of a mesh. Positions and layers are rounded to decimals so meshes that only differ by float noise are equal.
+# The name and the transform of the object aren't included, so the hash is equal for copies of a mesh.
+def geometry_hash(mesh, decimals = 4):
+    md5 = hashlib.md5()
+    coordinates = numpy.zeros(len(mesh.vertices) * 3, dtype = numpy.float32)
+    mesh.vertices.foreach_get("co", coordinates)
+    loop_vertices = numpy.zeros(len(mesh.loops), dtype = numpy.int32)
+    mesh.loops.foreach_get("vertex_index", loop_vertices)
+    loop_totals = numpy.zeros(len(mesh.polygons), dtype = numpy.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    
+    # Adding 0 turns -0.0 into 0.0 which would hash differently.
+    for array in (numpy.round(coordinates, decimals) + 0, loop_vertices, loop_totals):
+        md5.update(array.tobytes())
+    for layer, attribute, size in ((mesh.uv_layers.active, "uv", 2), (mesh.vertex_colors.active, "color", 3), (mesh.vertex_colors.get("Alpha"), "color", 3), (mesh.polygon_layers_int.get("revolt_face_type"), "value", 1)):
+        values = numpy.zeros(len(layer.data) * size if layer != None else 0, dtype = numpy.float32)
+        if layer != None:
+            layer.data.foreach_get(attribute, values)
+        md5.update(bytes([layer != None]) + (numpy.round(values, decimals) + 0).tobytes())
+    if mesh.uv_textures.active != None:
+        md5.update("".join([face.image.name if face.image != None else "" for face in mesh.uv_textures.active.data]).encode("utf-8"))
+    return md5.hexdigest()
+
+# Finds meshes with the same geometry. Returns a dict mapping each mesh to the mesh that's exported in its place: the first mesh by name with the same hash.
+def deduplicate_meshes(meshes, decimals = 4):
+    groups = {}
+    for mesh in sorted(meshes, key = lambda mesh: mesh.name):
+        groups.setdefault(geometry_hash(mesh, decimals), []).append(mesh)
+    return {mesh: group[0] for group in groups.values() for mesh in group}
     
 # Exports a convex hull. (HUL-file)
 def export_convex_hull(filepath, scale, mesh = None):
@@ -338,6 +725,180 @@ def export_world_objects(filepath, matrix, objects):
         fh.write(struct.pack("lllllfffffffff", object_type, obj.revolt.flag1_long, obj.revolt.flag2_long, obj.revolt.flag3_long, obj.revolt.flag4_long, location.x, location.y, location.z, up.x, up.y, up.z, forward.x, forward.y, forward.z))
     fh.close()
 
+# Exports the position nodes of an object. (PAN-file) Each vertex is a node and each edge a link from its first to its second vertex.
+# The start node is the first vertex with 1 in the revolt_start_node layer or the first vertex. Returns the problems found in the links.
+def export_position_nodes(filepath, matrix, obj):
+    positions, edges = node_object_arrays(obj, matrix)
+    marked = numpy.nonzero(vertex_layer_values(obj.data, "revolt_start_node", 0))[0]
+    start = int(marked[0]) if len(marked) > 0 else 0
+    records, problems = nodes.build_position_nodes(positions, edges, start)
+    fh = open(filepath, "wb")
+    formats.write_position_nodes(fh, records, start)
+    fh.close()
+    if len(records) > 0:
+        print("Lap length: " + str(round(float(records["distance"][start]), 1)))
+    return problems
+
+# Exports the AI nodes of an object. (FAN-file) Each edge between a red and a green vertex (see the revolt_side layer) is a node and the edges between red vertices are the links.
+# Meshes without a revolt_side layer are exported with a node of no width at each vertex. Returns the problems found in the links.
+def export_ai_nodes(filepath, matrix, obj):
+    mesh = obj.data
+    positions, edges = node_object_arrays(obj, matrix)
+    if "revolt_side" in mesh.vertex_layers_int:
+        sides = vertex_layer_values(mesh, "revolt_side", 0)
+        rungs = edges[sides[edges[:, 0]] != sides[edges[:, 1]]]
+        red = numpy.where(sides[rungs[:, 0]] == 0, rungs[:, 0], rungs[:, 1])
+        green = numpy.where(sides[rungs[:, 0]] == 0, rungs[:, 1], rungs[:, 0])
+        links = edges[(sides[edges[:, 0]] == 0) & (sides[edges[:, 1]] == 0)]
+    else:
+        red = green = numpy.arange(len(positions))
+        links = edges
+    node_indices = numpy.full(len(positions), -1, dtype = numpy.int64)
+    node_indices[red] = numpy.arange(len(red))
+    links = node_indices[links]
+    
+    speeds = vertex_layer_values(mesh, "revolt_speed", 1.0)
+    records, problems = nodes.build_ai_nodes(positions[red], positions[green], numpy.column_stack([speeds[red], speeds[green]]), vertex_layer_values(mesh, "revolt_racing_line", 0.5)[red],
+        vertex_layer_values(mesh, "revolt_priority", 0)[red], vertex_layer_values(mesh, "revolt_start_node", 0)[red] != 0, links[numpy.all(links >= 0, axis = 1)])
+    fh = open(filepath, "wb")
+    formats.write_ai_nodes(fh, records)
+    fh.close()
+    return problems
+
+# Returns the vertex positions of an object in file space and its edges as (E, 2).
+def node_object_arrays(obj, matrix):
+    if obj.mode == "EDIT":
+        obj.update_from_editmode()
+    mesh = obj.data
+    coordinates = numpy.zeros(len(mesh.vertices) * 3, dtype = numpy.float32)
+    mesh.vertices.foreach_get("co", coordinates)
+    positions = formats.transform_points(formats.transform_points(coordinates, obj.matrix_world.transposed()), matrix)
+    edges = numpy.zeros(len(mesh.edges) * 2, dtype = numpy.int32)
+    mesh.edges.foreach_get("vertices", edges)
+    return positions, edges.reshape(-1, 2).astype(numpy.int64)
+
+# Returns the values of an int or float vertex layer. The type of default decides which. Meshes without the layer get default for every vertex.
+def vertex_layer_values(mesh, name, default):
+    layers = mesh.vertex_layers_float if isinstance(default, float) else mesh.vertex_layers_int
+    values = numpy.full(len(mesh.vertices), default, dtype = numpy.float32 if isinstance(default, float) else numpy.int32)
+    if name in layers:
+        layers[name].data.foreach_get("value", values)
+    return values
+
+# Exports track zones. (TAZ-file) Each object is a zone reaching from -1 to 1 along its axes like a cube empty. The zones are written in the order of their ids.
+def export_zones(filepath, matrix, objects):
+    objects = sorted(objects, key = lambda obj: obj.revolt.zone_id)
+    world_matrices = numpy.array([[list(row) for row in obj.matrix_world] for obj in objects], dtype = numpy.float64).reshape(-1, 4, 4)
+    
+    # Each row is an axis of a zone in file space, scaled by the size along that axis.
+    extents = numpy.einsum("nki,kj->nij", world_matrices[:, :3, :3], numpy.array(matrix, dtype = numpy.float64)[:3, :3])
+    sizes = numpy.sqrt(numpy.sum(extents ** 2, axis = 2))
+    rotations = extents / numpy.where(sizes > 0, sizes, 1)[:, :, None]
+    rotations[:, 0] *= numpy.where(numpy.linalg.det(rotations) < 0, -1, 1)[:, None]
+    
+    records = numpy.zeros(len(objects), formats.zone_dtype)
+    records["id"] = [obj.revolt.zone_id for obj in objects]
+    records["position"] = formats.transform_points(world_matrices[:, :3, 3], matrix)
+    records["matrix"] = rotations
+    records["size"] = sizes
+    fh = open(filepath, "wb")
+    formats.write_records(fh, records, formats.zone_dtype)
+    fh.close()
+
+# Exports lamp objects as the lights of a track. (LIT-file) Spot lamps become spot lights and all other lamps omni lights.
+# The values of all lamps are gathered first and the records are filled in one go.
+def export_lights(filepath, matrix, objects):
+    objects = [obj for obj in objects if obj.type == "LAMP"]
+    world_matrices = numpy.array([[list(row) for row in obj.matrix_world] for obj in objects], dtype = numpy.float64).reshape(-1, 4, 4)
+    lamps = [obj.data for obj in objects]
+    scale = min(matrix.to_scale())
+
+    # Lamps shine along their -z axis and have y pointing up. The rows are the right, up and look axes in file space.
+    rows = numpy.einsum("nki,kj->nij", world_matrices[:, :3, :3], numpy.array(matrix, dtype = numpy.float64)[:3, :3])
+    rows = rows / numpy.maximum(numpy.sqrt(numpy.sum(rows ** 2, axis = 2)), 1e-12)[:, :, None]
+    rows[:, 1:] *= -1
+
+    is_spot = numpy.array([lamp.type == "SPOT" for lamp in lamps], dtype = bool)
+    records = numpy.zeros(len(objects), formats.light_dtype)
+    records["position"] = formats.transform_points(world_matrices[:, :3, 3], matrix)
+    records["matrix"] = rows
+    records["reach"] = [lamp.distance * scale for lamp in lamps]
+    records["cone"] = numpy.where(is_spot, numpy.degrees([getattr(lamp, "spot_size", 0) for lamp in lamps]), 0)
+    records["color"] = numpy.array([list(lamp.color) for lamp in lamps], dtype = numpy.float64).reshape(-1, 3) * numpy.array([lamp.energy * (-255 if lamp.use_negative else 255) for lamp in lamps])[:, None]
+    records["type"] = is_spot * 2 + numpy.array([obj.revolt.light_normal for obj in objects], dtype = numpy.uint8)
+    records["flag"] = [obj.revolt.light_flag for obj in objects]
+    records["speed"] = [obj.revolt.light_speed for obj in objects]
+    fh = open(filepath, "wb")
+    formats.write_records(fh, records, formats.light_dtype)
+    fh.close()
+    return len(records)
+
+# Returns the triangles of a mesh object in world space as a (T, 3, 3) array. Polygons are split into fans.
+def object_triangles(obj):
+    mesh = obj.data
+    coordinates = numpy.zeros(len(mesh.vertices) * 3, dtype = numpy.float32)
+    mesh.vertices.foreach_get("co", coordinates)
+    positions = formats.transform_points(coordinates, obj.matrix_world.transposed())
+    loop_vertices = numpy.zeros(len(mesh.loops), dtype = numpy.int32)
+    mesh.loops.foreach_get("vertex_index", loop_vertices)
+    loop_starts = numpy.zeros(len(mesh.polygons), dtype = numpy.int32)
+    mesh.polygons.foreach_get("loop_start", loop_starts)
+    loop_totals = numpy.zeros(len(mesh.polygons), dtype = numpy.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+
+    counts = numpy.maximum(loop_totals.astype(numpy.int64) - 2, 0)
+    first = numpy.repeat(loop_starts.astype(numpy.int64), counts)
+    steps = numpy.arange(numpy.sum(counts)) - numpy.repeat(numpy.cumsum(counts) - counts, counts) + 1
+    return positions[loop_vertices[numpy.column_stack([first, first + steps, first + steps + 1])]]
+
+# Bakes the lighting of the lamps in the scene into the Color layer of the objects. Every visible mesh in the scene casts shadows.
+# Point and spot lamps are treated as point lights. The Alpha layer holds the transparency, so the shadow of the ambient occlusion is only written to it if occlusion_alpha is True.
+def bake_lighting(objects, scene, ambient, ao_samples, ao_distance, shadow_distance, occlusion_alpha = False):
+    from . import bake
+    occluders = [obj for obj in scene.objects if obj.type == "MESH" and obj.is_visible(scene)]
+    triangles = numpy.concatenate([object_triangles(obj) for obj in occluders] + [numpy.zeros((0, 3, 3))])
+    lights = []
+    for obj in scene.objects:
+        if obj.type != "LAMP" or not obj.is_visible(scene) or obj.data.type not in ("POINT", "SPOT", "SUN"):
+            continue
+        if obj.data.type == "SUN":
+            lights.append(("SUN", tuple(obj.matrix_world.to_3x3() * Vector((0, 0, -1))), tuple(obj.data.color), obj.data.energy, 0))
+        else:
+            lights.append(("POINT", tuple(obj.matrix_world.translation), tuple(obj.data.color), obj.data.energy, obj.data.distance))
+
+    # The corners of all objects are lit at once so the work can be split evenly.
+    points, normals = [], []
+    for obj in objects:
+        mesh = obj.data
+        mesh.calc_normals_split()
+        coordinates = numpy.zeros(len(mesh.vertices) * 3, dtype = numpy.float32)
+        mesh.vertices.foreach_get("co", coordinates)
+        loop_vertices = numpy.zeros(len(mesh.loops), dtype = numpy.int32)
+        mesh.loops.foreach_get("vertex_index", loop_vertices)
+        loop_normals = numpy.zeros(len(mesh.loops) * 3, dtype = numpy.float32)
+        mesh.loops.foreach_get("normal", loop_normals)
+        mesh.free_normals_split()
+
+        # Normals are transformed by the inverse transpose, which is just the inverse with row vectors.
+        normal = formats.transform_points(loop_normals, obj.matrix_world.to_3x3().inverted())
+        normals.append(normal / numpy.maximum(numpy.sqrt(numpy.sum(normal ** 2, axis = 1)), 1e-12)[:, None])
+        points.append(formats.transform_points(coordinates, obj.matrix_world.transposed())[loop_vertices])
+
+    colors, occlusion = bake.bake(triangles, numpy.concatenate(points), numpy.concatenate(normals), lights, ambient, ao_samples, ao_distance, shadow_distance)
+
+    start = 0
+    for obj in objects:
+        mesh = obj.data
+        layer = mesh.vertex_colors.get("Color") or mesh.vertex_colors.new("Color")
+        layer.data.foreach_set("color", colors[start:start + len(mesh.loops)].astype(numpy.float32).ravel())
+        mesh.vertex_colors.active = layer
+        if occlusion_alpha:
+            alpha_layer = mesh.vertex_colors.get("Alpha") or mesh.vertex_colors.new("Alpha")
+            alpha_layer.data.foreach_set("color", numpy.repeat(1 - occlusion[start:start + len(mesh.loops)], 3).astype(numpy.float32))
+        mesh.update()
+        start += len(mesh.loops)
+    return len(colors)
+
 # This method converts a Blender coordinate to a Re-Volt coordinate. In Re-Volt the Y-axis is up and inverted. In Blender the Z-axis is up.
 def revolt_fix(input, scale = 1):
     t = type(input)
@@ -0,0 +1,449 @@
+# File specifications can be found here: http://www.perror.de/rv/rvstruct.html
+# Re-Volt source code can be found here: http://revenant1.net/rvsource.rar
+
+# Readers and writers that keep Re-Volt data as flat arrays instead of bmesh. Nothing in here may import bpy so the functions can run in worker processes.
+
+import struct, os, glob
+import numpy
+
+# Layout of a polygon in PRM-, M- and W-files. Colors are stored as BGRA bytes and the fourth corner is unused by triangles.
+polygon_dtype = numpy.dtype([
+    ("type", "<i2"),
+    ("texture", "<i2"),
+    ("vertices", "<i2", 4),
+    ("colors", "u1", (4, 4)),
+    ("uvs", "<f4", (4, 2)),
+    ])
+
+# Layout of a vertex in PRM-, M- and W-files.
+vertex_dtype = numpy.dtype([
+    ("position", "<f4", 3),
+    ("normal", "<f4", 3),
+    ])
+
+# Layout of vertices when the positions are quantized to 16 bits. Normals are stored as signed bytes.
+quantized_vertex_dtype = numpy.dtype([
+    ("position", "<u2", 3),
+    ("normal", "i1", 3),
+    ])
+
+# Layout of the bounding header in front of each mesh in W-files.
+chunk_header_dtype = numpy.dtype([
+    ("center", "<f4", 3),
+    ("radius", "<f4"),
+    ("bounds", "<f4", (3, 2)),
+    ])
+
+# Layout of an instance in FIN-files. The name is limited to 9 characters and the matrix is stored row by row.
+instance_dtype = numpy.dtype([
+    ("name", "S9"),
+    ("color", "u1", 3),
+    ("env_color", "<u4"),
+    ("priority", "u1"),
+    ("flag", "u1"),
+    ("padding", "<u2"),
+    ("lod_bias", "<f4"),
+    ("position", "<f4", 3),
+    ("matrix", "<f4", (3, 3)),
+    ])
+
+# Layout of an object in FOB-files.
+object_dtype = numpy.dtype([
+    ("type", "<i4"),
+    ("flags", "<i4", 4),
+    ("position", "<f4", 3),
+    ("up", "<f4", 3),
+    ("forward", "<f4", 3),
+    ])
+
+# Layout of a polyhedron in NCP-files. Triangles use the first four planes, quads all five. The first plane is the face itself and the others are the edges.
+polyhedron_dtype = numpy.dtype([
+    ("type", "<i4"),
+    ("surface", "<i4"),
+    ("planes", "<f4", (5, 4)),
+    ("bbox", "<f4", 6),
+    ])
+
+# Layout of a track zone in TAZ-files. Zones are boxes turned by the matrix (one axis per row) and reaching size away from the position along each axis.
+# The id is the order in which the zones are passed during a lap.
+zone_dtype = numpy.dtype([
+    ("id", "<i4"),
+    ("position", "<f4", 3),
+    ("matrix", "<f4", (3, 3)),
+    ("size", "<f4", 3),
+    ])
+
+# Layout of a light in LIT-files. The matrix holds the right, up and look axes as rows and spot lights shine along the look axis.
+# The color can be negative for lights that darken. The type is 0 for omni, 1 for omni lights only lighting faces turned towards them, 2 for spot and 3 for such spot lights.
+# The reach is the distance where the light fades out and the cone is the angle of spot lights in degrees. The speed is used by flickering lights.
+light_dtype = numpy.dtype([
+    ("position", "<f4", 3),
+    ("reach", "<f4"),
+    ("matrix", "<f4", (3, 3)),
+    ("cone", "<f4"),
+    ("color", "<f4", 3),
+    ("flag", "u1"),
+    ("type", "u1"),
+    ("speed", "u1"),
+    ("padding", "u1"),
+    ])
+
+# Layout of a visibox in VIS-files. The flag is 1 for camera boxes and 2 for cube boxes. While the camera is in a camera box,
+# the meshes of the W-file that lie completely inside a cube box with the same id aren't drawn. The bounds are the lowest and highest x, y and z.
+visibox_dtype = numpy.dtype([
+    ("flag", "<i4"),
+    ("id", "<i4"),
+    ("bounds", "<f4", (3, 2)),
+    ])
+
+# Layout of a position node in PAN-files. Unused links are -1. The distance is how far the finish line is when driving on from the node.
+position_node_dtype = numpy.dtype([
+    ("position", "<f4", 3),
+    ("distance", "<f4"),
+    ("previous", "<i4", 4),
+    ("next", "<i4", 4),
+    ])
+
+# Layout of an AI node in FAN-files. Each node is a line across the track from the red to the green side with a speed for each side.
+# The racing line is where the cars drive between the sides (0 is red, 1 is green). Unused links are -1.
+ai_node_dtype = numpy.dtype([
+    ("priority", "u1"),
+    ("start_node", "u1"),
+    ("padding", "u1", 2),
+    ("racing_line", "<f4"),
+    ("finish_distance", "<f4"),
+    ("previous", "<i4", 2),
+    ("next", "<i4", 2),
+    ("speeds", "<f4", 2),
+    ("positions", "<f4", (2, 3)),
+    ])
+
+# Class holding the polygons and vertices of one mesh exactly like they are stored in the file.
+# The vertices can be quantized to save memory. They are converted back to floats whenever they're accessed.
+class MeshData:
+    __slots__ = ("polygons", "stored_vertices", "origin", "step")
+
+    def __init__(self, polygons = None, vertices = None):
+        self.polygons = numpy.zeros(0, polygon_dtype) if polygons is None else polygons
+        self.stored_vertices = numpy.zeros(0, vertex_dtype) if vertices is None else vertices
+        self.origin = None
+        self.step = None
+
+    @property
+    def vertices(self):
+        if self.origin is None:
+            return self.stored_vertices
+        vertices = numpy.empty(len(self.stored_vertices), vertex_dtype)
+        vertices["position"] = self.origin + self.stored_vertices["position"] * self.step
+        vertices["normal"] = self.stored_vertices["normal"] / 127.0
+        return vertices
+
+    @vertices.setter
+    def vertices(self, vertices):
+        self.stored_vertices = vertices
+        self.origin = None
+        self.step = None
+
+    # True if the positions are stored with 16 bits.
+    def is_quantized(self):
+        return self.origin is not None
+
+    # Stores the positions as 16 bit integers spread over the bounding box and the normals as bytes.
+    def quantize(self):
+        if self.is_quantized() or len(self.stored_vertices) == 0:
+            return self
+        positions = self.stored_vertices["position"].astype(numpy.float64)
+        origin = positions.min(axis = 0)
+        step = (positions.max(axis = 0) - origin) / 65535
+        step[step == 0] = 1
+        vertices = numpy.empty(len(positions), quantized_vertex_dtype)
+        vertices["position"] = numpy.round((positions - origin) / step)
+        vertices["normal"] = numpy.round(numpy.clip(self.stored_vertices["normal"], -1, 1) * 127)
+        self.stored_vertices, self.origin, self.step = vertices, origin, step
+        return self
+
+    # Number of bytes used by the arrays.
+    def nbytes(self):
+        return self.polygons.nbytes + self.stored_vertices.nbytes
+
+    # Number of corners used by each polygon. The first bit in the type tells if it's a quad.
+    def corner_counts(self):
+        return 3 + (self.polygons["type"] & 1)
+
+    # Number of triangles the game has to draw. A quad counts as two.
+    def triangle_count(self):
+        return int(numpy.sum(1 + (self.polygons["type"] & 1)))
+
+    def copy(self):
+        return self.slice(slice(None), slice(None)).copy_arrays()
+
+    # Returns a mesh sharing the given ranges of polygons and vertices. The vertices stay quantized if they are.
+    def slice(self, polygon_range, vertex_range):
+        mesh = MeshData(self.polygons[polygon_range], self.stored_vertices[vertex_range])
+        mesh.origin, mesh.step = self.origin, self.step
+        return mesh
+
+    def copy_arrays(self):
+        self.polygons = self.polygons.copy()
+        self.stored_vertices = self.stored_vertices.copy()
+        return self
+
+# Class holding all meshes of a W-file. The polygons and vertices of all meshes are stored in two big arrays and each mesh is a slice of those.
+class WorldData:
+    __slots__ = ("headers", "polygon_offsets", "vertex_offsets", "mesh", "funnyballs", "tail")
+
+    def __init__(self, headers, polygon_offsets, vertex_offsets, mesh, funnyballs = None, tail = b""):
+        self.headers = headers
+        self.polygon_offsets = polygon_offsets
+        self.vertex_offsets = vertex_offsets
+        self.mesh = mesh
+        self.funnyballs = funnyballs or []
+        self.tail = tail
+
+    def __len__(self):
+        return len(self.headers)
+
+    # Returns the index of the mesh each polygon belongs to.
+    def polygon_meshes(self):
+        return numpy.repeat(numpy.arange(len(self.polygon_offsets) - 1), numpy.diff(self.polygon_offsets))
+
+    # Returns the vertex indices of all polygons (P, 4) moved to where the vertices of their mesh are in the big array.
+    def global_indices(self):
+        return self.mesh.polygons["vertices"].astype(numpy.int64) + self.vertex_offsets[self.polygon_meshes()][:, None]
+
+    # Returns a single mesh. Vertex indices are local to the mesh just like in the file.
+    def chunk(self, i):
+        return self.mesh.slice(slice(self.polygon_offsets[i], self.polygon_offsets[i + 1]), slice(self.vertex_offsets[i], self.vertex_offsets[i + 1]))
+
+    def quantize(self):
+        self.mesh.quantize()
+        return self
+
+    def nbytes(self):
+        return self.headers.nbytes + self.polygon_offsets.nbytes + self.vertex_offsets.nbytes + self.mesh.nbytes() + len(self.tail)
+
+    # Returns the bounding header of a mesh with a bounding sphere and box.
+    @staticmethod
+    def calculate_header(mesh):
+        header = numpy.zeros(1, chunk_header_dtype)[0]
+        positions = mesh.vertices["position"]
+        if len(positions) > 0:
+            low, high = positions.min(axis = 0), positions.max(axis = 0)
+            header["bounds"] = numpy.array([low, high]).T
+            header["center"] = (low + high) / 2
+            header["radius"] = numpy.sqrt(numpy.max(numpy.sum((positions - header["center"]) ** 2, axis = 1)))
+        return header
+
+    # Creates world data from a list of MeshData. The funnyball is set to cover all meshes.
+    @staticmethod
+    def from_chunks(chunks, headers = None):
+        if headers is None:
+            headers = numpy.array([WorldData.calculate_header(chunk) for chunk in chunks], chunk_header_dtype)
+        polygon_offsets = numpy.cumsum([0] + [len(chunk.polygons) for chunk in chunks])
+        vertex_offsets = numpy.cumsum([0] + [len(chunk.vertices) for chunk in chunks])
+        polygons = numpy.concatenate([chunk.polygons for chunk in chunks] or [numpy.zeros(0, polygon_dtype)])
+        vertices = numpy.concatenate([chunk.vertices for chunk in chunks] or [numpy.zeros(0, vertex_dtype)])
+        world = WorldData(headers, polygon_offsets, vertex_offsets, MeshData(polygons, vertices))
+        if len(vertices) > 0:
+            low, high = vertices["position"].min(axis = 0), vertices["position"].max(axis = 0)
+            world.funnyballs = [((low + high) / 2, float(numpy.sqrt(numpy.sum((high - low) ** 2))) / 2, list(range(len(chunks))))]
+        world.tail = struct.pack("<l", 0)
+        return world
+
+# Transforms an array of points the same way as Vector(point) * matrix does.
+def transform_points(points, matrix):
+    points = numpy.asarray(points, dtype = numpy.float64).reshape(-1, 3)
+    matrix = numpy.array(matrix, dtype = numpy.float64)
+    return numpy.dot(points, matrix[:3, :3]) + matrix[3, :3] if len(matrix) == 4 else numpy.dot(points, matrix)
+
+# Reads a mesh from the current position of the file handle.
+def read_mesh(fh):
+    polygon_count, vertex_count = struct.unpack("<hh", fh.read(4))
+    polygons = numpy.frombuffer(fh.read(polygon_count * polygon_dtype.itemsize), polygon_dtype).copy()
+    vertices = numpy.frombuffer(fh.read(vertex_count * vertex_dtype.itemsize), vertex_dtype).copy()
+    return MeshData(polygons, vertices)
+
+# Writes a mesh at the current position of the file handle.
+def write_mesh(fh, mesh):
+    fh.write(struct.pack("<hh", len(mesh.polygons), len(mesh.vertices)))
+    fh.write(mesh.polygons.astype(polygon_dtype, copy = False).tobytes())
+    fh.write(mesh.vertices.astype(vertex_dtype, copy = False).tobytes())
+
+# Reads a whole W-file from the file handle.
+def read_world(fh):
+    mesh_count = struct.unpack("<l", fh.read(4))[0]
+    headers = numpy.zeros(mesh_count, chunk_header_dtype)
+    chunks = []
+    for i in range(mesh_count):
+        headers[i] = numpy.frombuffer(fh.read(chunk_header_dtype.itemsize), chunk_header_dtype)[0]
+        chunks.append(read_mesh(fh))
+    
+    # Reads FunnyBalls. Each one has a bounding sphere and a list of the meshes inside.
+    funnyballs = []
+    funnyball_count = struct.unpack("<l", fh.read(4))[0]
+    for i in range(funnyball_count):
+        center_x, center_y, center_z, radius, count = struct.unpack("<ffffl", fh.read(20))
+        funnyballs.append(((center_x, center_y, center_z), radius, list(struct.unpack("<" + "l" * count, fh.read(4 * count)))))
+    
+    # The unknown list and the EnvList are kept as they are.
+    world = WorldData.from_chunks(chunks, headers)
+    world.funnyballs = funnyballs
+    world.tail = fh.read()
+    return world
+
+# Writes a whole W-file to the file handle.
+def write_world(fh, world):
+    fh.write(struct.pack("<l", len(world)))
+    for i in range(len(world)):
+        fh.write(world.headers[i:i + 1].tobytes())
+        write_mesh(fh, world.chunk(i))
+    fh.write(struct.pack("<l", len(world.funnyballs)))
+    for center, radius, meshes in world.funnyballs:
+        fh.write(struct.pack("<ffffl", center[0], center[1], center[2], radius, len(meshes)))
+        fh.write(struct.pack("<" + "l" * len(meshes), *meshes))
+    fh.write(world.tail)
+
+# Loads a PRM-, M- or W-file without any Blender objects. Returns MeshData for models and WorldData for worlds.
+def load(filepath, quantize = False):
+    fh = open(filepath, "rb")
+    data = read_world(fh) if filepath.lower().endswith(".w") else read_mesh(fh)
+    fh.close()
+    return data.quantize() if quantize else data
+
+# Reads a file made of a record count followed by the records. (FIN- and FOB-files)
+def read_records(fh, dtype):
+    count = struct.unpack("<l", fh.read(4))[0]
+    return numpy.frombuffer(fh.read(count * dtype.itemsize), dtype).copy()
+
+# Writes a file made of a record count followed by the records. (FIN- and FOB-files)
+def write_records(fh, records, dtype):
+    fh.write(struct.pack("<l", len(records)))
+    fh.write(records.astype(dtype, copy = False).tobytes())
+
+# Reads a FIN-, FOB-, TAZ-, VIS- or LIT-file. Returns an empty array if the file doesn't exist.
+def load_records(filepath, dtype):
+    if not os.path.isfile(filepath) or os.path.getsize(filepath) == 0:
+        return numpy.zeros(0, dtype)
+    fh = open(filepath, "rb")
+    records = read_records(fh, dtype)
+    fh.close()
+    return records
+
+# Reads a PAN-file. Returns the position nodes and the index of the node at the finish line. Returns no nodes if the file doesn't exist.
+def load_position_nodes(filepath):
+    if not os.path.isfile(filepath) or os.path.getsize(filepath) == 0:
+        return numpy.zeros(0, position_node_dtype), 0
+    fh = open(filepath, "rb")
+    count, start = struct.unpack("<ll", fh.read(8))
+    nodes = numpy.frombuffer(fh.read(count * position_node_dtype.itemsize), position_node_dtype).copy()
+    fh.close()
+    return nodes, start
+
+# Writes a PAN-file.
+def write_position_nodes(fh, nodes, start):
+    fh.write(struct.pack("<ll", len(nodes), start))
+    fh.write(nodes.astype(position_node_dtype, copy = False).tobytes())
+
+# Reads a FAN-file. Returns no nodes if the file doesn't exist.
+def load_ai_nodes(filepath):
+    if not os.path.isfile(filepath) or os.path.getsize(filepath) == 0:
+        return numpy.zeros(0, ai_node_dtype)
+    fh = open(filepath, "rb")
+    count = struct.unpack("<h", fh.read(2))[0]
+    nodes = numpy.frombuffer(fh.read(count * ai_node_dtype.itemsize), ai_node_dtype).copy()
+    fh.close()
+    return nodes
+
+# Writes a FAN-file.
+def write_ai_nodes(fh, nodes):
+    fh.write(struct.pack("<h", len(nodes)))
+    fh.write(nodes.astype(ai_node_dtype, copy = False).tobytes())
+
+# Reads the polyhedrons of an NCP-file. The collision grid after them is skipped. Returns an empty array if the file doesn't exist.
+def load_hitbox(filepath):
+    if not os.path.isfile(filepath) or os.path.getsize(filepath) == 0:
+        return numpy.zeros(0, polyhedron_dtype)
+    fh = open(filepath, "rb")
+    count = struct.unpack("<h", fh.read(2))[0]
+    polyhedra = numpy.frombuffer(fh.read(count * polyhedron_dtype.itemsize), polyhedron_dtype).copy()
+    fh.close()
+    return polyhedra
+
+# Reads the lookup grid at the end of an NCP-file. Returns the grid header (x and z of the first cell, number of cells along x and z, cell size),
+# the number of polyhedrons in each cell and the indices of those polyhedrons one cell after another. Returns None if the file has no grid.
+def load_hitbox_grid(filepath):
+    if not os.path.isfile(filepath) or os.path.getsize(filepath) == 0:
+        return None
+    fh = open(filepath, "rb")
+    count = struct.unpack("<h", fh.read(2))[0]
+    fh.seek(count * polyhedron_dtype.itemsize, 1)
+    header = fh.read(20)
+    values = numpy.frombuffer(fh.read(), "<i4")
+    fh.close()
+    if len(header) < 20:
+        return None
+    header = struct.unpack("<fffff", header)
+    
+    # Each cell is a count followed by that many indices.
+    cell_count = int(header[2]) * int(header[3])
+    counts = numpy.zeros(cell_count, dtype = numpy.int64)
+    starts = numpy.zeros(cell_count, dtype = numpy.int64)
+    position = 0
+    for i in range(cell_count):
+        if position >= len(values):
+            return None
+        starts[i] = position + 1
+        counts[i] = max(int(values[position]), 0)
+        position += 1 + counts[i]
+    if position > len(values):
+        return None
+    indices = values[numpy.repeat(starts, counts) + numpy.arange(int(counts.sum())) - numpy.repeat(numpy.cumsum(counts) - counts, counts)] if cell_count > 0 else values[:0]
+    return header, counts, indices
+
+# Writes a lookup grid in the layout read by load_hitbox_grid.
+def write_hitbox_grid(fh, grid):
+    header, counts, indices = grid
+    fh.write(struct.pack("<fffff", *header))
+    
+    # Each cell is its count followed by its indices.
+    values = numpy.zeros(len(counts) + len(indices), "<i4")
+    count_positions = numpy.arange(len(counts)) + numpy.cumsum(counts) - counts
+    values[count_positions] = counts
+    is_index = numpy.ones(len(values), dtype = bool)
+    is_index[count_positions] = False
+    values[is_index] = indices
+    fh.write(values.tobytes())
+
+# Calculates the corners of each polyhedron by intersecting the face plane with two neighbouring edge planes. http://mathworld.wolfram.com/Plane-PlaneIntersection.html
+# Returns an array with 4 corners for each polyhedron and a mask telling which of them exist. The corners are in the order they're used by the face.
+def polyhedron_corners(polyhedra):
+    planes = polyhedra["planes"].astype(numpy.float64)
+    counts = 3 + (polyhedra["type"] & 1)
+    normals, distances = planes[:, :, :3], planes[:, :, 3]
+    corners = numpy.zeros((len(polyhedra), 4, 3))
+    valid = numpy.zeros((len(polyhedra), 4), dtype = bool)
+    rows = numpy.arange(len(polyhedra))
+    for n in range(4):
+        a = n + 1
+        b = (n + 1) % counts + 1
+        v0, va, vb = normals[:, 0], normals[:, a], normals[rows, b]
+        determinant = numpy.einsum("ij,ij->i", v0, numpy.cross(va, vb))
+        valid[:, n] = (n < counts) & (determinant != 0)
+        position = -distances[:, 0, None] * numpy.cross(va, vb) - distances[:, a, None] * numpy.cross(vb, v0) - distances[rows, b][:, None] * numpy.cross(v0, va)
+        corners[:, n] = position / numpy.where(determinant != 0, determinant, 1)[:, None]
+    
+    # The corners are stored in reverse.
+    return corners[:, ::-1], valid[:, ::-1]
+
+# Returns the corners of each polyhedron with the ones that exist moved to the front, so each face is a fan around its first corner, and the number of corners.
+def polyhedron_outlines(polyhedra):
+    corners, valid = polyhedron_corners(polyhedra)
+    order = numpy.argsort(~valid, axis = 1, kind = "mergesort")
+    return corners[numpy.arange(len(polyhedra))[:, None], order], numpy.sum(valid, axis = 1)
+
+# Returns the path to a model in a FIN-file. The path is incomplete sometimes due to limitations in the FIN-file format so it's only used if exactly one model matches.
+def find_model_path(path, mesh_name):
+    if os.path.isfile(path + mesh_name + ".prm"):
+        return path + mesh_name + ".prm"
+    found_paths = glob.glob(path + mesh_name + "*.prm")
+    return found_paths[0] if len(found_paths) == 1 else None
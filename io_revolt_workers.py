@@ -0,0 +1,18 @@
+# Entry point of the worker processes started by workers.py. It's imported as a top-level module, so its name has to be unique on the search path of the workers.
+# The workers don't have bpy, so the package can't be imported the normal way since __init__.py needs it.
+# In a worker this registers the package without running __init__.py, so the bpy-free modules can be imported from it.
+
+import os, sys, types, importlib
+
+package_directory = os.path.dirname(os.path.abspath(__file__))
+package_name = os.path.basename(package_directory)
+
+if __name__ == "io_revolt_workers" and package_name not in sys.modules:
+    package = types.ModuleType(package_name)
+    package.__path__ = [package_directory]
+    sys.modules[package_name] = package
+
+# Runs a job sent by workers.parallel_map or workers.Pool. The function is looked up by the name of its module.
+def run_job(job):
+    module_name, function_name, item = job
+    return getattr(importlib.import_module(module_name), function_name)(item)
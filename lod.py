@@ -0,0 +1,121 @@
+# Level of detail generation for PRM-/M-files. Works on formats.MeshData so it can run in worker processes.
+
+import io, numpy
+from math import sqrt
+from . import formats, optimize
+from .formats import MeshData
+
+# Merges all vertices within the same grid cell into one vertex (vertex clustering). Polygons keep their type, texture, colors and uvs.
+def cluster_vertices(mesh, cell_size):
+    positions = mesh.vertices["position"].astype(numpy.float64)
+    cells = numpy.floor((positions - positions.min(axis = 0)) / cell_size).astype(numpy.int64)
+    dims = cells.max(axis = 0) + 1
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    cell_keys, clusters = numpy.unique(keys, return_inverse = True)
+    cluster_count = len(cell_keys)
+
+    # The new vertex is placed at the center of the merged vertices. Normals are summed and normalized.
+    weights = numpy.bincount(clusters, minlength = cluster_count)
+    cluster_positions = numpy.empty((cluster_count, 3))
+    cluster_normals = numpy.empty((cluster_count, 3))
+    for axis in range(3):
+        cluster_positions[:, axis] = numpy.bincount(clusters, positions[:, axis], cluster_count) / weights
+        cluster_normals[:, axis] = numpy.bincount(clusters, mesh.vertices["normal"][:, axis], cluster_count)
+    lengths = numpy.sqrt(numpy.sum(cluster_normals ** 2, axis = 1))
+    cluster_normals /= numpy.where(lengths > 0, lengths, 1)[:, None]
+
+    # Remaps the polygons to the merged vertices. Unused corners of triangles are marked with -1.
+    polygons = mesh.polygons.copy()
+    is_quad = (polygons["type"] & 1) == 1
+    indices = clusters[polygons["vertices"].astype(numpy.int64)]
+    indices[~is_quad, 3] = -1
+
+    # A triangle is gone as soon as two of its corners are merged.
+    keep = ~is_quad & (indices[:, 0] != indices[:, 1]) & (indices[:, 1] != indices[:, 2]) & (indices[:, 2] != indices[:, 0])
+
+    # A quad stays a quad if no corners are merged and turns into a triangle if exactly two neighbouring corners are merged.
+    adjacent = numpy.array([indices[:, i] == indices[:, (i + 1) % 4] for i in range(4)]).T
+    crossed = (indices[:, 0] == indices[:, 2]) | (indices[:, 1] == indices[:, 3])
+    merged_count = numpy.sum(adjacent, axis = 1)
+    keep |= is_quad & ~crossed & (merged_count == 0)
+    to_triangle = is_quad & ~crossed & (merged_count == 1)
+
+    # Rotates the corners of those quads so the merged corner ends up in the unused fourth slot.
+    rows = numpy.nonzero(to_triangle)[0]
+    if len(rows) > 0:
+        dropped = numpy.argmax(adjacent[rows], axis = 1)
+        order = (dropped[:, None] + numpy.arange(1, 5)[None, :]) % 4
+        for field in ("vertices", "colors", "uvs"):
+            polygons[field][rows] = polygons[field][rows[:, None], order]
+        indices[rows] = indices[rows[:, None], order]
+        indices[rows, 3] = -1
+        polygons["type"][rows] &= ~1
+        keep |= to_triangle
+
+    # Removes polygons that ended up using the same vertices as another polygon.
+    corner_sets = numpy.sort(indices, axis = 1)
+    order = numpy.lexsort(corner_sets.T[::-1])
+    duplicate = numpy.zeros(len(order), dtype = bool)
+    duplicate[1:] = numpy.all(corner_sets[order][1:] == corner_sets[order][:-1], axis = 1)
+    keep[order[duplicate]] = False
+    polygons = polygons[keep]
+    indices = indices[keep]
+
+    # Drops unused vertices and writes the new indices.
+    used = numpy.unique(indices[indices >= 0])
+    remap = numpy.zeros(cluster_count, dtype = numpy.int64)
+    remap[used] = numpy.arange(len(used))
+    polygons["vertices"] = numpy.where(indices >= 0, remap[numpy.maximum(indices, 0)], 0)
+    vertices = numpy.zeros(len(used), mesh.vertices.dtype)
+    vertices["position"] = cluster_positions[used]
+    vertices["normal"] = cluster_normals[used]
+    return MeshData(polygons, vertices)
+
+# Returns a decimated copy of the mesh with at most triangle_budget triangles. The grid size is found with a binary search.
+def decimate(mesh, triangle_budget):
+    if mesh.triangle_count() <= triangle_budget or len(mesh.vertices) == 0:
+        return mesh.copy()
+
+    positions = mesh.vertices["position"]
+    extent = float(numpy.max(positions.max(axis = 0) - positions.min(axis = 0)))
+    if extent == 0:
+        return mesh.copy()
+
+    low, high = extent / 2**20, extent * 2
+    best = None
+    for i in range(24):
+        cell_size = sqrt(low * high)
+        result = cluster_vertices(mesh, cell_size)
+        if result.triangle_count() > triangle_budget:
+            low = cell_size
+        else:
+            best, high = result, cell_size
+    return best or cluster_vertices(mesh, high)
+
+# Returns a list of meshes where each level has about ratio times the triangles of the previous one. The first level is the original mesh.
+def build_chain(mesh, levels, ratio):
+    base = mesh.triangle_count()
+    return [mesh] + [decimate(mesh, int(base * ratio ** level)) for level in range(1, levels)]
+
+# Builds the levels of detail of a model and encodes them one after another as the content of a PRM-file, so whole models can be encoded in worker processes.
+# If optimize_order is True the polygons are sorted for the vertex cache and the vertices by first use. If sort_faces is True the polygons are sorted into runs with the same texture page and render state afterwards.
+# Returns the content, the number of triangles in each level and a line for each level describing what the sorting changed.
+def encode_levels(mesh, levels = 1, ratio = 0.5, optimize_order = False, sort_faces = False):
+    chain = build_chain(mesh, levels, ratio)
+    notes = []
+    if optimize_order:
+        optimized = optimize.optimize_levels(chain)
+        chain = [level for level, before, after in optimized]
+        notes += ["LOD " + str(i) + ": ACMR " + str(round(before, 3)) + " -> " + str(round(after, 3)) for i, (level, before, after) in enumerate(optimized)]
+    if sort_faces:
+        for i, level in enumerate(chain):
+            chain[i] = optimize.sort_by_state(level)
+            notes.append("LOD " + str(i) + ": " + str(optimize.count_runs(level.polygons)) + " -> " + str(optimize.count_runs(chain[i].polygons)) + " runs")
+    fh = io.BytesIO()
+    for level in chain:
+        formats.write_mesh(fh, level)
+    return fh.getvalue(), [level.triangle_count() for level in chain], notes
+
+# Used with workers.parallel_map which only passes one argument.
+def encode_levels_job(job):
+    return encode_levels(*job)
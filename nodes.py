@@ -0,0 +1,194 @@
+# Graphs of position nodes (PAN-files) and AI nodes (FAN-files). A graph is an array of node positions and an (E, 2) array of links from one node to the next.
+# Nothing in here may import bpy, so tracks can be checked in worker processes.
+
+import heapq
+import numpy
+from . import formats
+
+# Number of link slots in each direction.
+max_position_links = 4
+max_ai_links = 2
+
+# Returns the links stored in the link slots of a file as (from, to) rows. Empty slots are skipped.
+def slots_to_edges(slots):
+    slots = numpy.asarray(slots, dtype = numpy.int64)
+    sources = numpy.repeat(numpy.arange(len(slots)), slots.shape[1])
+    targets = slots.ravel()
+    used = targets >= 0
+    return numpy.column_stack([sources[used], targets[used]])
+
+# Fills the link slots of count nodes. Links keep their order within each node. Returns the next and previous slots and the nodes with more links than slots.
+def edges_to_slots(count, edges, slot_count):
+    edges = numpy.asarray(edges, dtype = numpy.int64).reshape(-1, 2)
+    overfull = numpy.zeros(count, dtype = bool)
+    result = []
+    for column in (0, 1):
+        order = numpy.argsort(edges[:, column], kind = "mergesort")
+        nodes, others = edges[order, column], edges[order, 1 - column]
+        places = numpy.arange(len(nodes)) - numpy.searchsorted(nodes, nodes)
+        slots = numpy.full((count, slot_count), -1, dtype = numpy.int64)
+        fits = places < slot_count
+        slots[nodes[fits], places[fits]] = others[fits]
+        overfull[nodes[~fits]] = True
+        result.append(slots)
+    return result[0], result[1], numpy.nonzero(overfull)[0]
+
+# Removes links to nodes that don't exist, links from a node to itself and repeated links.
+def clean_edges(count, edges):
+    edges = numpy.asarray(edges, dtype = numpy.int64).reshape(-1, 2)
+    edges = edges[numpy.all((edges >= 0) & (edges < count), axis = 1) & (edges[:, 0] != edges[:, 1])]
+    if len(edges) == 0:
+        return edges
+    keys = edges[:, 0] * count + edges[:, 1]
+    first = numpy.unique(keys, return_index = True)[1]
+    return edges[numpy.sort(first)]
+
+# Returns the links leaving (column 0) or entering (column 1) each node as lists: the first link of each node, the nodes on the other end and the lengths.
+def adjacency(count, edges, lengths, column):
+    order = numpy.argsort(edges[:, column], kind = "mergesort")
+    starts = numpy.searchsorted(edges[order, column], numpy.arange(count + 1))
+    return starts.tolist(), edges[order, 1 - column].tolist(), lengths[order].tolist()
+
+# Returns how far the finish line is from each node when following the links, and the next node on the shortest way there.
+# It's one Dijkstra pass from the start node backwards along the links. The start node gets the length of the shortest lap.
+# Nodes that can't reach the finish line get an infinite distance and -1.
+def finish_distances(positions, edges, start):
+    positions = numpy.asarray(positions, dtype = numpy.float64).reshape(-1, 3)
+    count = len(positions)
+    distances = [float("inf")] * count
+    following = [-1] * count
+    if count == 0:
+        return numpy.zeros(0), numpy.zeros(0, dtype = numpy.int64)
+    lengths = numpy.sqrt(numpy.sum((positions[edges[:, 1]] - positions[edges[:, 0]]) ** 2, axis = 1))
+    starts, sources, source_lengths = adjacency(count, edges, lengths, 1)
+
+    distances[start] = 0.0
+    lap = float("inf")
+    heap = [(0.0, start)]
+    while len(heap) > 0:
+        distance, node = heapq.heappop(heap)
+        if distance > distances[node]:
+            continue
+        for i in range(starts[node], starts[node + 1]):
+            source, new_distance = sources[i], distance + source_lengths[i]
+
+            # Links leaving the start node close the lap.
+            if source == start:
+                if new_distance < lap:
+                    lap, following[start] = new_distance, node
+            elif new_distance < distances[source]:
+                distances[source], following[source] = new_distance, node
+                heapq.heappush(heap, (new_distance, source))
+    distances[start] = lap
+    return numpy.array(distances), numpy.array(following, dtype = numpy.int64)
+
+# Moves the link of each node to the next node on the shortest way to the finish line in front of its other links, so it's stored in the first next slot.
+def shortest_first(edges, following):
+    preferred = following[edges[:, 0]] == edges[:, 1]
+    return edges[numpy.argsort(~preferred, kind = "mergesort")]
+
+# Returns which nodes can be reached from the start node by following the links.
+def reachable(count, edges, start):
+    seen = numpy.zeros(count, dtype = bool)
+    if count == 0:
+        return seen
+    starts, targets, lengths = adjacency(count, edges, numpy.zeros(len(edges)), 0)
+    seen[start] = True
+    stack = [start]
+    while len(stack) > 0:
+        node = stack.pop()
+        for target in targets[starts[node]:starts[node + 1]]:
+            if not seen[target]:
+                seen[target] = True
+                stack.append(target)
+    return seen
+
+# Checks that every node is part of the lap. Returns a list of (rule, message, nodes) for each problem.
+def graph_problems(count, edges, start, distances, overfull):
+    problems = []
+    if count == 0:
+        return problems
+    if not numpy.isfinite(distances[start]):
+        problems.append(("open-lap", "The links never lead back to the start node", [start]))
+    dead_ends = numpy.bincount(edges[:, 0], minlength = count) == 0
+    if numpy.any(dead_ends):
+        problems.append(("dead-end-node", "Nodes without a link to a next node", numpy.nonzero(dead_ends)[0]))
+    unreachable = ~reachable(count, edges, start)
+    if numpy.any(unreachable):
+        problems.append(("unreachable-node", "Nodes that can't be reached from the start node", numpy.nonzero(unreachable)[0]))
+    stranded = ~numpy.isfinite(distances)
+    stranded[start] = False
+    if numpy.any(stranded):
+        problems.append(("no-way-to-finish", "Nodes without a way to the finish line", numpy.nonzero(stranded)[0]))
+    if len(overfull) > 0:
+        problems.append(("too-many-links", "Nodes with more links than the file can store", overfull))
+    return problems
+
+# Builds the records of a PAN-file from node positions (in file space) and links. The first next slot of each node holds the next node on the shortest way to the finish line.
+# Returns the records and the problems found.
+def build_position_nodes(positions, edges, start):
+    positions = numpy.asarray(positions, dtype = numpy.float64).reshape(-1, 3)
+    edges = clean_edges(len(positions), edges)
+    distances, following = finish_distances(positions, edges, start)
+    next_slots, previous_slots, overfull = edges_to_slots(len(positions), shortest_first(edges, following), max_position_links)
+
+    nodes = numpy.zeros(len(positions), formats.position_node_dtype)
+    nodes["position"] = positions
+    nodes["distance"] = numpy.where(numpy.isfinite(distances), distances, 0)
+    nodes["next"] = next_slots
+    nodes["previous"] = previous_slots
+    return nodes, graph_problems(len(positions), edges, start, distances, overfull)
+
+# Returns the point of each AI node where its racing line crosses it.
+def racing_points(nodes):
+    positions = nodes["positions"].astype(numpy.float64)
+    return positions[:, 0] + (positions[:, 1] - positions[:, 0]) * nodes["racing_line"][:, None]
+
+# Returns the node an AI graph starts at. That's the first node marked as start node or the first node.
+def ai_start_node(nodes):
+    marked = numpy.nonzero(nodes["start_node"])[0]
+    return int(marked[0]) if len(marked) > 0 else 0
+
+# Builds the records of a FAN-file. red and green are the ends of each node (in file space), speeds the speed on each side.
+# The finish distances and the next node in the first next slot are found along the racing line. Returns the records and the problems found.
+def build_ai_nodes(red, green, speeds, racing_line, priority, start_node, edges):
+    nodes = numpy.zeros(len(red), formats.ai_node_dtype)
+    nodes["positions"][:, 0] = red
+    nodes["positions"][:, 1] = green
+    nodes["speeds"] = speeds
+    nodes["racing_line"] = racing_line
+    nodes["priority"] = priority
+    nodes["start_node"] = start_node
+    start = ai_start_node(nodes)
+
+    edges = clean_edges(len(nodes), edges)
+    distances, following = finish_distances(racing_points(nodes), edges, start)
+    next_slots, previous_slots, overfull = edges_to_slots(len(nodes), shortest_first(edges, following), max_ai_links)
+    nodes["finish_distance"] = numpy.where(numpy.isfinite(distances), distances, 0)
+    nodes["next"] = next_slots
+    nodes["previous"] = previous_slots
+    return nodes, graph_problems(len(nodes), edges, start, distances, overfull)
+
+# Checks the links of nodes read from a file. Returns a list of (rule, message, nodes) for each problem.
+def check_nodes(positions, next_slots, previous_slots, start):
+    count = len(positions)
+    problems = []
+    if count == 0:
+        return problems
+    if start < 0 or start >= count:
+        return [("bad-start-node", "The start node doesn't exist", [start])]
+    bad = numpy.any((next_slots >= count) | (previous_slots >= count) | (next_slots < -1) | (previous_slots < -1), axis = 1)
+    if numpy.any(bad):
+        problems.append(("bad-link", "Nodes linking to nodes that don't exist", numpy.nonzero(bad)[0]))
+    edges = clean_edges(count, slots_to_edges(next_slots))
+
+    # Every next link should be stored as a previous link on the other end too.
+    backwards = clean_edges(count, slots_to_edges(previous_slots))[:, ::-1]
+    forward_keys, backward_keys = edges[:, 0] * count + edges[:, 1], backwards[:, 0] * count + backwards[:, 1]
+    all_keys = numpy.unique(numpy.concatenate([forward_keys, backward_keys]))
+    one_sided = numpy.bincount(numpy.searchsorted(all_keys, numpy.concatenate([numpy.unique(forward_keys), numpy.unique(backward_keys)])), minlength = len(all_keys)) == 1
+    if numpy.any(one_sided):
+        problems.append(("one-sided-link", "Nodes with a link that the other node doesn't link back", numpy.unique(all_keys[one_sided] // count)))
+
+    distances = finish_distances(positions, edges, start)[0]
+    return problems + graph_problems(count, edges, start, distances, [])
@@ -0,0 +1,156 @@
+# Polygon and vertex ordering for PRM-/M- and W-meshes. Works on formats.MeshData so it can run in worker processes.
+# The polygon ordering is Tom Forsyth's "Linear-Speed Vertex Cache Optimisation": https://tomforsyth1000.github.io/papers/fast_vert_cache_opt.html
+
+import numpy
+from collections import deque
+from .formats import MeshData, polygon_dtype
+
+# Scoring constants from the paper.
+cache_decay_power = 1.5
+last_triangle_score = 0.75
+valence_boost_scale = 2.0
+valence_boost_power = 0.5
+max_cache_size = 32
+
+# Returns the corners of each polygon as lists of vertex indices.
+def polygon_corners(mesh):
+    counts = mesh.corner_counts()
+    return [list(vertices[:count]) for vertices, count in zip(mesh.polygons["vertices"].tolist(), counts.tolist())]
+
+# Average cache miss ratio: the number of vertices transformed per triangle drawn with a FIFO cache. Quads are drawn as two triangles.
+def acmr(mesh, cache_size = 16):
+    triangle_count = mesh.triangle_count()
+    if triangle_count == 0:
+        return 0.0
+    cache = deque()
+    cached = set()
+    misses = 0
+    for corners in polygon_corners(mesh):
+        triangles = [corners[:3]] if len(corners) == 3 else [corners[:3], [corners[0], corners[2], corners[3]]]
+        for triangle in triangles:
+            for index in triangle:
+                if index not in cached:
+                    misses += 1
+                    cache.append(index)
+                    cached.add(index)
+                    if len(cache) > cache_size:
+                        cached.discard(cache.popleft())
+    return misses / triangle_count
+
+# Returns the scores of vertices as a table by their position in the simulated cache (-1 for vertices not in it, stored in row 0) and by the number of polygons still using them.
+def vertex_score_table(max_remaining):
+    positions = numpy.arange(max_cache_size)
+    cache_scores = numpy.where(positions < 3, last_triangle_score, (1.0 - (positions - 3) / (max_cache_size - 3)) ** cache_decay_power)
+    remaining = numpy.arange(max_remaining + 1, dtype = numpy.float64)
+    boosts = valence_boost_scale * numpy.maximum(remaining, 1) ** -valence_boost_power
+    table = numpy.concatenate([[0.0], cache_scores])[:, None] + boosts[None, :]
+    table[:, 0] = -1.0
+    return table
+
+# Returns the order in which the polygons should be drawn.
+# The polygons using each vertex are found by sorting the corners and stored in one row per vertex. Scores and counts are numpy arrays, so each step only updates
+# the vertices in the cache and the polygons using them. The next polygon is the best one using a vertex in the cache. All polygons are only searched when there's none.
+def vertex_cache_order(mesh):
+    counts = mesh.corner_counts().astype(numpy.int64)
+    polygon_count, vertex_count = len(counts), len(mesh.vertices)
+    if polygon_count == 0:
+        return numpy.zeros(0, dtype = numpy.int64)
+
+    # Unused corners point to an extra vertex which is never in the cache and adds nothing to the score of its polygon.
+    used = numpy.arange(4)[None, :] < counts[:, None]
+    corners = numpy.where(used, mesh.polygons["vertices"].astype(numpy.int64), vertex_count)
+
+    # Polygons using each vertex. Unused places point to an extra polygon that always has the lowest score.
+    order = numpy.argsort(corners[used], kind = "mergesort")
+    sorted_vertices = corners[used][order]
+    starts = numpy.searchsorted(sorted_vertices, numpy.arange(vertex_count + 2))
+    remaining = numpy.diff(starts)
+    vertex_polygons = numpy.full((vertex_count + 1, max(int(remaining.max()), 1)), polygon_count, dtype = numpy.int64)
+    vertex_polygons[sorted_vertices, numpy.arange(len(order)) - starts[sorted_vertices]] = numpy.repeat(numpy.arange(polygon_count), counts)[order]
+
+    table = vertex_score_table(int(remaining.max()))
+    positions = numpy.arange(max_cache_size + 4)
+    positions[max_cache_size:] = -1
+    scores = table[0, remaining]
+    scores[vertex_count] = 0.0
+    weights = 3.0 / counts
+    polygon_scores = numpy.append(scores[corners].sum(axis = 1) * weights, -numpy.inf)
+    last_drawn = numpy.full(vertex_count + 1, -1, dtype = numpy.int64)
+    cache = numpy.zeros(0, dtype = numpy.int64)
+    result = numpy.empty(polygon_count, dtype = numpy.int64)
+    best = int(polygon_scores.argmax())
+
+    for step in range(polygon_count):
+        result[step] = best
+        polygon_scores[best] = -numpy.inf
+
+        # Removes the polygon from its vertices and moves them to the front of the cache. Vertices pushed out of the cache are updated once more.
+        vertices = corners[best, :counts[best]]
+        remaining[vertices] -= 1
+        last_drawn[vertices] = step
+        cache = numpy.concatenate((vertices, cache[last_drawn[cache] != step]))
+        scores[cache] = table[positions[:len(cache)] + 1, remaining[cache]]
+
+        # Scores the polygons still using these vertices again.
+        candidates = vertex_polygons[cache].ravel()
+        candidates = candidates[polygon_scores[candidates] > -numpy.inf]
+        cache = cache[:max_cache_size]
+        if len(candidates) > 0:
+            polygon_scores[candidates] = scores[corners[candidates]].sum(axis = 1) * weights[candidates]
+            best = int(candidates[polygon_scores[candidates].argmax()])
+        else:
+            best = int(polygon_scores.argmax())
+    return result
+
+# Renumbers the vertices in the order they are first used by the polygons. Unused vertices are moved to the end.
+def reorder_vertices(mesh):
+    counts = mesh.corner_counts()
+    indices = mesh.polygons["vertices"].astype(numpy.int64)
+    used = indices[numpy.arange(4)[None, :] < counts[:, None]]
+    first_used = numpy.full(len(mesh.vertices), len(used), dtype = numpy.int64)
+    numpy.minimum.at(first_used, used, numpy.arange(len(used)))
+    order = numpy.argsort(first_used, kind = "mergesort")
+    remap = numpy.empty(len(order), dtype = numpy.int64)
+    remap[order] = numpy.arange(len(order))
+    polygons = mesh.polygons.copy()
+    polygons["vertices"] = numpy.where(numpy.arange(4)[None, :] < counts[:, None], remap[indices], 0)
+    return MeshData(polygons, mesh.vertices[order])
+
+# Reorders polygons for the vertex cache and vertices by first use. Returns the new mesh with the cache miss ratio before and after.
+def optimize_mesh(mesh, cache_size = 16):
+    before = acmr(mesh, cache_size)
+    optimized = reorder_vertices(MeshData(mesh.polygons[vertex_cache_order(mesh)], mesh.vertices))
+    return optimized, before, acmr(optimized, cache_size)
+
+# Used with workers.parallel_map. Optimizes each level of detail of a model.
+def optimize_levels(levels):
+    return [optimize_mesh(level) for level in levels]
+
+# Bits of the polygon type that change the render state: double sided, translucent and additive.
+state_flags = 2 | 4 | 256
+
+# Returns the texture page and the render state flags of each polygon.
+def state_keys(polygons):
+    return polygons["texture"].astype(numpy.int64), polygons["type"].astype(numpy.int64) & state_flags
+
+# Number of runs of polygons that can be drawn without changing the texture or the render state.
+def count_runs(polygons):
+    if len(polygons) == 0:
+        return 0
+    texture, flags = state_keys(polygons)
+    return 1 + int(numpy.sum((texture[1:] != texture[:-1]) | (flags[1:] != flags[:-1])))
+
+# Sorts the polygons by texture page and then by render state. The sort is stable so the order inside each run (e.g. for the vertex cache) is kept.
+def sort_by_state(mesh):
+    texture, flags = state_keys(mesh.polygons)
+    return MeshData(mesh.polygons[numpy.lexsort((flags, texture))], mesh.vertices)
+
+# Sorts the polygons of each chunk of a world and then the chunks by the state of their first polygon, so the runs continue from one chunk to the next.
+def sort_chunks_by_state(chunks):
+    chunks = [sort_by_state(chunk) for chunk in chunks]
+    first = numpy.zeros(len(chunks), polygon_dtype)
+    for i, chunk in enumerate(chunks):
+        if len(chunk.polygons) > 0:
+            first[i] = chunk.polygons[0]
+    texture, flags = state_keys(first)
+    return [chunks[i] for i in numpy.lexsort((flags, texture)).tolist()]
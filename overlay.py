@@ -0,0 +1,162 @@
+# Draws the hitbox, its lookup grid and the bounds of the meshes of a track in the 3D view without creating any objects.
+# The geometry is read from the exported files and compiled into OpenGL display lists. A list is only rebuilt when its file or the import settings change.
+
+import bpy, bgl, os, colorsys
+import numpy
+from bpy_extras.io_utils import axis_conversion
+from . import formats
+
+# Handle of the draw handler while the overlay is shown.
+handle = None
+
+# Display list of each layer and the key it was built for.
+layers = {}
+
+# Transparency of the faces and grid cells.
+face_alpha = 0.35
+cell_alpha = 0.25
+
+# Returns a color for each surface material. The hues are spread so neighbouring materials look different.
+def material_colors(materials):
+    unique_materials, inverse = numpy.unique(numpy.asarray(materials, dtype = numpy.int64), return_inverse = True)
+    palette = numpy.array([colorsys.hsv_to_rgb(hue, 0.7, 1) + (face_alpha,) for hue in ((unique_materials * 0.382) % 1).tolist()]).reshape(-1, 4)
+    return palette[inverse.ravel()]
+
+# Returns the faces of the polyhedrons as triangles (T, 3, 3) in Blender space and a color for each triangle from its material.
+def face_geometry(polyhedra, matrix):
+    corners, counts = formats.polyhedron_outlines(polyhedra)
+    quads = numpy.nonzero(counts == 4)[0]
+    triangles = numpy.concatenate([corners[counts >= 3][:, [0, 1, 2]], corners[quads][:, [0, 2, 3]]])
+    materials = numpy.concatenate([polyhedra["surface"][counts >= 3], polyhedra["surface"][quads]])
+    return formats.transform_points(triangles, matrix).reshape(-1, 3, 3), material_colors(materials)
+
+# Returns a quad (Q, 4, 3) in Blender space for each cell of the lookup grid that has polyhedrons, colored from green to red by how many it has.
+# The cells are drawn at the height of the highest polyhedron.
+def grid_geometry(grid, polyhedra, matrix):
+    header, counts, indices = grid
+    cells = numpy.nonzero(counts)[0]
+    size = header[4]
+    x = header[0] + (cells % int(header[2])) * size
+    z = header[1] + (cells // int(header[2])) * size
+    y = numpy.full(len(cells), float(polyhedra["bbox"][:, 2].min()) if len(polyhedra) > 0 else 0.0)
+    quads = numpy.zeros((len(cells), 4, 3))
+    quads[:, :, 0] = x[:, None] + numpy.array([0, size, size, 0])
+    quads[:, :, 1] = y[:, None]
+    quads[:, :, 2] = z[:, None] + numpy.array([0, 0, size, size])
+    heat = counts[cells] / float(max(counts.max(), 1)) if len(cells) > 0 else numpy.zeros(0)
+    colors = numpy.column_stack([heat, 1 - heat, numpy.zeros(len(cells)), numpy.full(len(cells), cell_alpha)])
+    return formats.transform_points(quads, matrix).reshape(-1, 4, 3), colors
+
+# Returns the edges of the bounding box of each mesh in a W-file as lines (L, 2, 3) in Blender space.
+def bounds_geometry(headers, matrix):
+    bounds = headers["bounds"].astype(numpy.float64).reshape(-1, 3, 2)
+    corner_bits = numpy.array([[x, y, z] for x in (0, 1) for y in (0, 1) for z in (0, 1)])
+    corners = bounds[:, numpy.arange(3)[None, :], corner_bits]
+    edges = numpy.array([[a, b] for a in range(8) for b in range(a + 1, 8) if numpy.sum(corner_bits[a] != corner_bits[b]) == 1])
+    return formats.transform_points(corners[:, edges], matrix).reshape(-1, 2, 3)
+
+# Compiles a display list drawing primitives. colors has one color for each primitive.
+def compile_list(primitive, vertices, colors):
+    corners_per_primitive = vertices.shape[1]
+    index = bgl.glGenLists(1)
+    bgl.glNewList(index, bgl.GL_COMPILE)
+    bgl.glBegin(primitive)
+    for color, corners in zip(colors.tolist(), vertices.tolist()):
+        bgl.glColor4f(*color)
+        for i in range(corners_per_primitive):
+            bgl.glVertex3f(*corners[i])
+    bgl.glEnd()
+    bgl.glEndList()
+    return index
+
+# Reads the files of a layer and compiles its display list. Returns None if the files don't exist.
+def build_layer(name, base, matrix):
+    if name == "bounds":
+        if not os.path.isfile(base + ".w"):
+            return None
+        lines = bounds_geometry(formats.load(base + ".w").headers, matrix)
+        return compile_list(bgl.GL_LINES, lines, numpy.tile([[1, 1, 0, 0.8]], (len(lines), 1)))
+    polyhedra = formats.load_hitbox(base + ".ncp")
+    if len(polyhedra) == 0:
+        return None
+    if name == "faces":
+        triangles, colors = face_geometry(polyhedra, matrix)
+        return compile_list(bgl.GL_TRIANGLES, triangles, colors)
+    grid = formats.load_hitbox_grid(base + ".ncp")
+    if grid == None:
+        return None
+    quads, colors = grid_geometry(grid, polyhedra, matrix)
+    return compile_list(bgl.GL_QUADS, quads, colors)
+
+# Returns the display list of a layer. It's rebuilt when the file it's read from was changed or the import settings are different.
+def get_layer(name, base, matrix):
+    filepath = base + (".w" if name == "bounds" else ".ncp")
+    stat = os.stat(filepath) if os.path.isfile(filepath) else None
+    key = (filepath, stat and stat.st_mtime, stat and stat.st_size, tuple(tuple(row) for row in matrix))
+    if name not in layers or layers[name][0] != key:
+        free_layer(name)
+        layers[name] = (key, build_layer(name, base, matrix))
+    return layers[name][1]
+
+def free_layer(name):
+    if name in layers:
+        if layers[name][1] != None:
+            bgl.glDeleteLists(layers[name][1], 1)
+        del layers[name]
+
+# Returns the path of the track files without extension, e.g. .../levels/toy/toy. Returns None if no world path is set.
+def track_base(world_parameters):
+    path = bpy.path.abspath(world_parameters.path).rstrip("/\\")
+    if path == "" or not os.path.isdir(path):
+        return None
+    return os.path.join(path, os.path.basename(path))
+
+# Called by Blender each time a 3D view is drawn.
+def draw():
+    world_parameters = bpy.context.scene.revolt_world
+    base = track_base(world_parameters)
+    if base == None:
+        return
+    matrix = axis_conversion(to_up = world_parameters.up_axis, to_forward = world_parameters.forward_axis).to_4x4() * world_parameters.scale
+
+    bgl.glEnable(bgl.GL_BLEND)
+    bgl.glEnable(bgl.GL_DEPTH_TEST)
+    if world_parameters.overlay_faces:
+        call_layer("faces", base, matrix)
+    if world_parameters.overlay_bounds:
+        call_layer("bounds", base, matrix)
+
+    # The grid is drawn on top so it can be seen through the track.
+    bgl.glDisable(bgl.GL_DEPTH_TEST)
+    if world_parameters.overlay_grid:
+        call_layer("grid", base, matrix)
+    bgl.glDisable(bgl.GL_BLEND)
+    bgl.glColor4f(0, 0, 0, 1)
+
+def call_layer(name, base, matrix):
+    index = get_layer(name, base, matrix)
+    if index != None:
+        bgl.glCallList(index)
+
+def is_enabled():
+    return handle != None
+
+def enable():
+    global handle
+    if handle == None:
+        handle = bpy.types.SpaceView3D.draw_handler_add(draw, (), "WINDOW", "POST_VIEW")
+
+# Removes the draw handler and frees the display lists.
+def disable():
+    global handle
+    if handle != None:
+        bpy.types.SpaceView3D.draw_handler_remove(handle, "WINDOW")
+        handle = None
+    for name in list(layers):
+        free_layer(name)
+
+def toggle():
+    if is_enabled():
+        disable()
+    else:
+        enable()
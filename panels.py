@@ -1,6 +1,6 @@
 import bpy, bmesh
 from bpy.props import *
-from io_revolt.encode import export_world_full
+from io_revolt.encode import export_world_full, export_car
 
 class RevoltFacePropertiesPanel(bpy.types.Panel):
     bl_label = "Revolt Face Properties"
@@ -14,6 +14,13 @@ class RevoltFacePropertiesPanel(bpy.types.Panel):
         return context.object.type == "MESH"
     
     def draw(self, context):
+        if "revolt_nodes" in context.object.data:
+            self.layout.prop(context.object.data.revolt, "node_start")
+            if context.object.data["revolt_nodes"] == "AI":
+                self.layout.prop(context.object.data.revolt, "node_priority")
+                self.layout.prop(context.object.data.revolt, "node_racing_line")
+                self.layout.prop(context.object.data.revolt, "node_speed")
+            return
         self.layout.prop(context.object.data.revolt, "face_material")
         self.layout.prop(context.object.data.revolt, "face_double_sided")
         self.layout.prop(context.object.data.revolt, "face_translucent")
@@ -36,18 +43,44 @@ class WorldExportPanel(bpy.types.Panel):
         self.layout.prop(context.scene.revolt_world, "path")
         self.layout.prop(context.scene.revolt_world, "name")
         self.layout.prop_search(context.scene.revolt_world, "startpos_object", context.scene, "objects")
+        self.layout.prop_search(context.scene.revolt_world, "position_nodes", context.scene, "objects")
+        self.layout.prop_search(context.scene.revolt_world, "ai_nodes", context.scene, "objects")
         self.layout.prop(context.scene.revolt_world, "farclip")
         self.layout.prop(context.scene.revolt_world, "fogstart")
         self.layout.prop(context.scene.revolt_world, "fogcolor")
+        self.layout.prop(context.scene.revolt_world, "lod_levels")
+        self.layout.prop(context.scene.revolt_world, "lod_ratio")
+        self.layout.prop(context.scene.revolt_world, "optimize_order")
+        self.layout.prop(context.scene.revolt_world, "sort_faces")
+        self.layout.prop(context.scene.revolt_world, "raster_size")
+        self.layout.prop(context.scene.revolt_world, "deduplicate_models")
+        self.layout.prop(context.scene.revolt_world, "texture_atlas")
+        if context.scene.revolt_world.texture_atlas:
+            self.layout.prop(context.scene.revolt_world, "atlas_size")
+        self.layout.prop(context.scene.revolt_world, "visiboxes")
+        if context.scene.revolt_world.visiboxes:
+            self.layout.prop(context.scene.revolt_world, "camera_height")
+            self.layout.prop(context.scene.revolt_world, "camera_spacing")
         
         self.layout.operator(EXPORT_SCENE_OT_revolt_world_complete.bl_idname)
         
+        self.layout.operator("view3d.revolt_overlay")
+        row = self.layout.row()
+        row.prop(context.scene.revolt_world, "overlay_faces")
+        row.prop(context.scene.revolt_world, "overlay_grid")
+        row.prop(context.scene.revolt_world, "overlay_bounds")
+        
 class EXPORT_SCENE_OT_revolt_world_complete(bpy.types.Operator):
     bl_idname = "export_scene.revolt_world_complete"
     bl_label = "Export Re-Volt world"
     
     def execute(self, context):
-        export_world_full()
+        report = export_world_full()
+        if report == None:
+            self.report({'ERROR'}, "The world path doesn't exist")
+            return {'CANCELLED'}
+        if len(report) > 0:
+            self.report({'INFO'}, ", ".join([key.capitalize() + ": " + str(value) for key, value in sorted(report.items())]))
         return {'FINISHED'}
 
 class DATA_PT_revolt_mesh(bpy.types.Panel):
@@ -60,6 +93,7 @@ class DATA_PT_revolt_mesh(bpy.types.Panel):
         self.layout.prop(context.object.data.revolt, "export_as_prm")
         self.layout.prop(context.object.data.revolt, "export_as_ncp")
         self.layout.prop(context.object.data.revolt, "export_as_w")
+        self.layout.operator("object.revolt_bake_lighting")
 
 class OBJECT_PT_revolt_object(bpy.types.Panel):
     bl_label = "Re-Volt object properties"
@@ -68,6 +102,8 @@ class OBJECT_PT_revolt_object(bpy.types.Panel):
     bl_context = "object"
     
     def draw(self, context):
+        if "revolt_source" in context.object:
+            self.layout.operator("object.revolt_expand")
         self.layout.prop(context.object.revolt, "type")
         
         if context.object.revolt.type == "OBJECT":
@@ -76,6 +112,12 @@ class OBJECT_PT_revolt_object(bpy.types.Panel):
             self.layout.prop(context.object.revolt, "flag2_long")
             self.layout.prop(context.object.revolt, "flag3_long")
             self.layout.prop(context.object.revolt, "flag4_long")
+        elif context.object.revolt.type == "ZONE":
+            self.layout.prop(context.object.revolt, "zone_id")
+        elif context.object.revolt.type == "LIGHT":
+            self.layout.prop(context.object.revolt, "light_normal")
+            self.layout.prop(context.object.revolt, "light_flag")
+            self.layout.prop(context.object.revolt, "light_speed")
 
 class RENDER_PT_revolt_car(bpy.types.Panel):
     bl_label = "Re-Volt car export"
@@ -86,6 +128,9 @@ class RENDER_PT_revolt_car(bpy.types.Panel):
     def draw(self, context):
         car_parameters = context.scene.revolt_car
     
+        self.layout.prop(car_parameters, "scale")
+        self.layout.prop(car_parameters, "up_axis")
+        self.layout.prop(car_parameters, "forward_axis")
         self.layout.prop(car_parameters, "path")
         self.layout.prop(car_parameters, "name")
         self.layout.prop(car_parameters, "engine_class")
@@ -103,3 +148,18 @@ class RENDER_PT_revolt_car(bpy.types.Panel):
         row.column().prop(wheel, "is_turnable")
         self.layout.prop(wheel, "steer_ratio")
         self.layout.prop(wheel, "engine_ratio")
+        
+        self.layout.separator()
+        self.layout.operator(EXPORT_SCENE_OT_revolt_car_complete.bl_idname)
+
+class EXPORT_SCENE_OT_revolt_car_complete(bpy.types.Operator):
+    bl_idname = "export_scene.revolt_car_complete"
+    bl_label = "Export Re-Volt car"
+    
+    def execute(self, context):
+        written = export_car()
+        if written == None:
+            self.report({'ERROR'}, "The car path doesn't exist")
+            return {'CANCELLED'}
+        self.report({'INFO'}, "Exported " + str(len(written)) + " file(s)")
+        return {'FINISHED'}
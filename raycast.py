@@ -0,0 +1,119 @@
+# Bounding volume hierarchy over triangles for testing many rays at once. It's pure numpy since worker processes don't have mathutils.
+# Nothing in here may import bpy.
+
+import numpy
+
+# Largest number of triangles in a leaf of the tree.
+triangles_per_leaf = 8
+
+# Number of rays pushed down the tree together. Limits the memory used by the pairs of rays and nodes.
+rays_per_batch = 4096
+
+# Tree over triangles (T, 3, 3). Rays are pushed down the tree in arrays one level at a time, so each level costs a few array operations for a whole batch of rays.
+# Triangles can be one sided: they only block rays coming from the side their normal points to.
+class TriangleTree:
+    __slots__ = ("triangles", "normals", "double_sided", "low", "high", "children", "leaf_start", "leaf_count")
+
+    # normals are used to tell the front of one sided triangles. All triangles block from both sides if double_sided is None.
+    def __init__(self, triangles, normals = None, double_sided = None):
+        triangles = numpy.asarray(triangles, dtype = numpy.float64).reshape(-1, 3, 3)
+        centers = triangles.mean(axis = 1)
+        triangle_low, triangle_high = triangles.min(axis = 1), triangles.max(axis = 1)
+
+        # Builds the tree from the top. Nodes are split in the middle of their triangles along the longest side of their box.
+        # The triangles are reordered so each leaf is a range.
+        order, placed = [], 0
+        low, high, children, leaf_start, leaf_count = [], [], [], [], []
+        stack = [(numpy.arange(len(triangles)), None)]
+        while len(stack) > 0:
+            members, parent = stack.pop()
+            node = len(low)
+            if parent != None:
+                children[parent].append(node)
+            low.append(triangle_low[members].min(axis = 0) if len(members) > 0 else numpy.zeros(3))
+            high.append(triangle_high[members].max(axis = 0) if len(members) > 0 else numpy.zeros(3))
+            children.append([])
+            if len(members) <= triangles_per_leaf:
+                leaf_start.append(placed)
+                leaf_count.append(len(members))
+                order.append(members)
+                placed += len(members)
+                continue
+            leaf_start.append(-1)
+            leaf_count.append(0)
+            axis = numpy.argmax(high[node] - low[node])
+            sorted_members = members[numpy.argsort(centers[members, axis], kind = "mergesort")]
+            stack.append((sorted_members[len(members) // 2:], node))
+            stack.append((sorted_members[:len(members) // 2], node))
+
+        order = numpy.concatenate(order) if len(order) > 0 else numpy.zeros(0, dtype = numpy.int64)
+        self.triangles = triangles[order]
+        self.normals = None if normals is None else numpy.asarray(normals, dtype = numpy.float64).reshape(-1, 3)[order]
+        self.double_sided = None if double_sided is None else numpy.asarray(double_sided, dtype = bool)[order]
+        self.low, self.high = numpy.array(low).reshape(-1, 3), numpy.array(high).reshape(-1, 3)
+
+        # Every node that isn't a leaf has two children. Leaves have -1 instead.
+        self.children = numpy.array([nodes if len(nodes) == 2 else [-1, -1] for nodes in children], dtype = numpy.int64).reshape(-1, 2)
+        self.leaf_start, self.leaf_count = numpy.array(leaf_start, dtype = numpy.int64), numpy.array(leaf_count, dtype = numpy.int64)
+
+    def __len__(self):
+        return len(self.triangles)
+
+    # Returns which rays hit a triangle closer than their distance. Each ray is paired with the nodes it reaches, and all pairs of a level are tested at once.
+    def blocked(self, origins, directions, distances):
+        origins = numpy.asarray(origins, dtype = numpy.float64).reshape(-1, 3)
+        directions = numpy.asarray(directions, dtype = numpy.float64).reshape(-1, 3)
+        distances = numpy.asarray(distances, dtype = numpy.float64).ravel()
+        result = numpy.zeros(len(origins), dtype = bool)
+        if len(self) == 0 or len(origins) == 0:
+            return result
+
+        # Components that are 0 are replaced by a tiny value, so rays parallel to a side of a box need no special case.
+        inverse = 1 / numpy.where(numpy.abs(directions) < 1e-30, 1e-30, directions)
+        for start in range(0, len(origins), rays_per_batch):
+            rays = numpy.arange(start, min(start + rays_per_batch, len(origins)))
+            nodes = numpy.zeros(len(rays), dtype = numpy.int64)
+            while len(rays) > 0:
+
+                # Slab test against the boxes of the nodes. Rays that hit something in another branch are done.
+                near = (self.low[nodes] - origins[rays]) * inverse[rays]
+                far = (self.high[nodes] - origins[rays]) * inverse[rays]
+                enter = numpy.max(numpy.minimum(near, far), axis = 1)
+                leave = numpy.min(numpy.maximum(near, far), axis = 1)
+                inside = (leave >= numpy.maximum(enter, 0)) & (enter <= distances[rays]) & ~result[rays]
+                rays, nodes = rays[inside], nodes[inside]
+
+                # Rays that reached a leaf are tested against each of its triangles.
+                leaf = self.leaf_start[nodes] >= 0
+                if numpy.any(leaf):
+                    counts = self.leaf_count[nodes[leaf]]
+                    pair_rays = numpy.repeat(rays[leaf], counts)
+                    pair_triangles = numpy.repeat(self.leaf_start[nodes[leaf]] - (numpy.cumsum(counts) - counts), counts) + numpy.arange(numpy.sum(counts))
+                    hit = self.hit(origins[pair_rays], directions[pair_rays], distances[pair_rays], pair_triangles)
+                    result[pair_rays[hit]] = True
+
+                # The other rays go on to both children.
+                rays = numpy.repeat(rays[~leaf], 2)
+                nodes = self.children[nodes[~leaf]].ravel()
+        return result
+
+    # Tests pairs of rays and triangles with the Möller-Trumbore test. Returns which rays hit their triangle closer than limit.
+    def hit(self, o, d, limit, triangles):
+        v0 = self.triangles[triangles, 0]
+        b, c = self.triangles[triangles, 1] - v0, self.triangles[triangles, 2] - v0
+        p = numpy.cross(d, c)
+        det = numpy.sum(b * p, axis = 1)
+        parallel = numpy.abs(det) < 1e-12
+        inverse = 1 / numpy.where(parallel, 1, det)
+        s = o - v0
+        u = numpy.sum(s * p, axis = 1) * inverse
+        q = numpy.cross(s, b)
+        v = numpy.sum(d * q, axis = 1) * inverse
+        t = numpy.sum(c * q, axis = 1) * inverse
+        hit = ~parallel & (u >= 0) & (v >= 0) & (u + v <= 1) & (t > 0) & (t < limit)
+        if self.normals is not None:
+            front = numpy.sum(d * self.normals[triangles], axis = 1) < 0
+            if self.double_sided is not None:
+                front |= self.double_sided[triangles]
+            hit &= front
+        return hit
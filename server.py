@@ -0,0 +1,244 @@
+# Long running conversion service, so build scripts don't have to start Blender and register the add-on for every file.
+# Start it inside Blender, e.g. blender -b --python-expr "from io_revolt import server; server.serve()"
+# Clients send one JSON object per line over a local TCP connection, e.g. {"id": 1, "job": "validate", "args": {"filepath": ".../toy.w"}},
+# and get one JSON object per line back with the result or the error.
+# Jobs that need bpy run one after another on Blender's main thread. All other jobs run in a pool of worker processes that stays alive,
+# so nothing in this module may import bpy at the top.
+
+import os, json, time, socket, socketserver, threading, queue, collections
+import numpy
+from . import formats, workers, validate, budget, visibility, collision
+
+default_port = 47300
+
+# Number of decoded files kept in memory for the next jobs.
+max_cached_files = 32
+
+# Decoded files by path with the modification time and size they were read at. The oldest files are dropped first.
+decoded = collections.OrderedDict()
+
+# Modification time of the file of each image the last time it was checked.
+image_times = {}
+
+# Returns a decoded PRM-, M- or W-file. Files are only read again after they've been changed.
+def cached_load(filepath):
+    stat = os.stat(filepath)
+    entry = decoded.pop(filepath, None)
+    if entry == None or entry[0] != (stat.st_mtime, stat.st_size):
+        entry = ((stat.st_mtime, stat.st_size), formats.load(filepath))
+    decoded[filepath] = entry
+    while len(decoded) > max_cached_files:
+        decoded.popitem(last = False)
+    return entry[1]
+
+# Checks a track. (see validate.validate_track)
+def validate_job(args):
+    return validate.validate_track(args["filepath"], args.get("max_cell_candidates", 256))
+
+# Measures a track against budgets. (see budget.analyze_track)
+def budget_job(args):
+    return budget.analyze_track(args["filepath"], args.get("budgets"))
+
+# Writes the visiboxes of a track. The job already runs in a worker, so the regions are tested in this process.
+def visiboxes_job(args):
+    output = args.get("output") or os.path.splitext(args["filepath"])[0] + ".vis"
+    return visibility.generate(args["filepath"], output, args.get("camera_height", 100.0), args.get("spacing", 200.0), processes = 1)
+
+# Simulates the collision grid of an NCP-file and writes the report next to it. (see collision.analyze)
+def collision_job(args):
+    base = os.path.splitext(args["filepath"])[0]
+    return collision.analyze(args["filepath"], args.get("report") or base + ".grid.json", args.get("heatmap"), args.get("raster_sizes", (256, 512, 1024, 2048)), args.get("spacing", 64.0), args.get("radius", 0.0))
+
+# Jobs run in the worker pool.
+pool_jobs = {
+    "validate": validate_job,
+    "budget": budget_job,
+    "visiboxes": visiboxes_job,
+    "collision": collision_job,
+    }
+
+# Returns the matrix used by the importers and the exporters for the axes and scale in args.
+def job_matrix(args, export):
+    from bpy_extras.io_utils import axis_conversion
+    up, forward, scale = args.get("up_axis", "-Y"), args.get("forward_axis", "Z"), args.get("scale", 0.01)
+    if export:
+        return axis_conversion(from_up = up, from_forward = forward).to_4x4() * (1 / scale)
+    return axis_conversion(to_up = up, to_forward = forward).to_4x4() * scale
+
+# Removes all objects, meshes and lamps left by the previous job. Images are kept so textures don't have to be loaded again, but they're reloaded if their file changed.
+def clear_scene():
+    import bpy
+    for scene in bpy.data.scenes:
+        for obj in list(scene.objects):
+            scene.objects.unlink(obj)
+    for collection in (bpy.data.objects, bpy.data.meshes, bpy.data.lamps):
+        for item in list(collection):
+            if item.users == 0:
+                collection.remove(item)
+    for image in bpy.data.images:
+        filepath = bpy.path.abspath(image.filepath)
+        if not os.path.isfile(filepath):
+            continue
+        modified = os.path.getmtime(filepath)
+        if image.name in image_times and image_times[image.name] != modified:
+            image.reload()
+        image_times[image.name] = modified
+
+# Opens a blend-file if args has one. Returns the scene.
+def open_blend(args):
+    import bpy
+    if args.get("blend"):
+        bpy.ops.wm.open_mainfile(filepath = args["blend"])
+    return bpy.context.scene
+
+# Saves the blend-file if args has a path for it.
+def save_blend(args):
+    import bpy
+    if args.get("save"):
+        bpy.ops.wm.save_as_mainfile(filepath = args["save"])
+
+# Imports a track into an empty scene. The W-file comes from the cache if it hasn't been changed.
+def import_world_job(args):
+    import bpy
+    from . import decode
+    clear_scene()
+    decode.run_steps(decode.iter_import_world(args["filepath"], job_matrix(args, False), args.get("include_models", True), args.get("include_objects", True), args.get("include_hitboxes", True), True,
+        world_data = cached_load(args["filepath"]), split_chunks = args.get("split_chunks", False), include_lights = args.get("include_lights", True)))
+    save_blend(args)
+    return {"objects": len(bpy.context.scene.objects), "meshes": len(bpy.data.meshes), "images": len(bpy.data.images)}
+
+# Imports a model into an empty scene.
+def import_model_job(args):
+    from . import decode
+    clear_scene()
+    obj = decode.import_model(args["filepath"], job_matrix(args, False), data = cached_load(args["filepath"]))
+    save_blend(args)
+    return {"object": obj.name, "polygons": len(obj.data.polygons), "vertices": len(obj.data.vertices)}
+
+# Exports a whole track from a blend-file to the folder in args["path"] or to the folder set in the file.
+def export_world_job(args):
+    from . import encode
+    scene = open_blend(args)
+    if args.get("path"):
+        scene.revolt_world.path = args["path"]
+    report = encode.export_world_full()
+    if report == None:
+        raise IOError("The world path doesn't exist: " + scene.revolt_world.path)
+    return report
+
+# Exports the mesh of an object in a blend-file as a model. Returns the number of triangles in each level of detail.
+def export_model_job(args):
+    import bpy
+    from . import encode
+    open_blend(args)
+    obj = bpy.data.objects[args["object"]]
+    return encode.export_model(args["filepath"], job_matrix(args, True), args.get("include_textures", True), obj.data, args.get("lod_levels", 1), args.get("lod_ratio", 0.5), args.get("optimize_order", False), args.get("sort_faces", False))
+
+# Jobs run on Blender's main thread.
+main_jobs = {
+    "import_world": import_world_job,
+    "import_model": import_model_job,
+    "export_world": export_world_job,
+    "export_model": export_model_job,
+    }
+
+# Converts numpy values in results to plain Python values for json.
+def to_json(value):
+    if isinstance(value, numpy.ndarray):
+        return value.tolist()
+    if isinstance(value, numpy.generic):
+        return value.item()
+    raise TypeError(repr(value) + " can't be written as JSON")
+
+# Holds the worker pool and the queue of jobs waiting for the main thread.
+class Service:
+    __slots__ = ("pool", "main_queue", "running")
+
+    def __init__(self, processes = None):
+        self.pool = workers.Pool(processes)
+        self.main_queue = queue.Queue()
+        self.running = True
+
+    # Runs a request and returns the response. Called from the thread of a connection, which waits until the job is done.
+    def run(self, request):
+        start_time = time.time()
+        job, args = request.get("job"), request.get("args") or {}
+        try:
+            if job in pool_jobs:
+                result = self.pool.submit(pool_jobs[job], args).result()
+            elif job in main_jobs:
+                done, outcome = threading.Event(), {}
+                self.main_queue.put((main_jobs[job], args, done, outcome))
+                done.wait()
+                if "error" in outcome:
+                    raise outcome["error"]
+                result = outcome["result"]
+            elif job == "status":
+                result = {"jobs": sorted(list(pool_jobs) + list(main_jobs)), "waiting": self.main_queue.qsize(), "cached_files": list(decoded)}
+            elif job == "shutdown":
+                self.running = False
+                result = None
+            else:
+                raise ValueError("Unknown job: " + str(job))
+            return {"id": request.get("id"), "ok": True, "result": result, "seconds": round(time.time() - start_time, 3)}
+        except Exception as error:
+            return {"id": request.get("id"), "ok": False, "error": type(error).__name__ + ": " + str(error), "seconds": round(time.time() - start_time, 3)}
+
+    # Runs the jobs waiting for the main thread until the service is shut down.
+    def run_main_jobs(self):
+        while self.running:
+            try:
+                function, args, done, outcome = self.main_queue.get(timeout = 0.1)
+            except queue.Empty:
+                continue
+            try:
+                outcome["result"] = function(args)
+            except Exception as error:
+                outcome["error"] = error
+            done.set()
+
+# Reads requests from a connection and writes the responses in the same order.
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if line.strip() == b"":
+                continue
+            try:
+                request = json.loads(line.decode("utf-8"))
+                response = self.server.service.run(request if isinstance(request, dict) else {})
+            except ValueError as error:
+                response = {"id": None, "ok": False, "error": "Invalid request: " + str(error)}
+            self.wfile.write((json.dumps(response, default = to_json) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+class Server(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+# Starts the service and blocks until a shutdown job arrives. Only connections from this machine are accepted by default.
+def serve(host = "127.0.0.1", port = default_port, processes = None):
+    service = Service(processes)
+    server = Server((host, port), RequestHandler)
+    server.service = service
+    thread = threading.Thread(target = server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    print("Re-Volt conversion service listening on " + host + ":" + str(port))
+    try:
+        service.run_main_jobs()
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.pool.shutdown()
+
+# Sends one job to a running service and returns the response.
+def request(job, args = None, host = "127.0.0.1", port = default_port, timeout = None):
+    connection = socket.create_connection((host, port), timeout)
+    try:
+        connection.sendall((json.dumps({"id": 0, "job": job, "args": args or {}}, default = to_json) + "\n").encode("utf-8"))
+        reader = connection.makefile("rb")
+        line = reader.readline()
+        reader.close()
+    finally:
+        connection.close()
+    return json.loads(line.decode("utf-8"))
@@ -0,0 +1,172 @@
+# Track snapshots. A snapshot holds everything the world import reads (W-, FIN-, FOB-, NCP- and INF-file and the models used by the FIN-file) in a single file.
+# Importing a snapshot skips parsing all those files. The arrays are stored like in formats so they can be used straight from a memory map. Nothing in here may import bpy.
+
+# Layout of a snapshot file:
+#   header:  "RVSN", version, entry count, unused (4 x 4 bytes)
+#   entries: name (56 bytes), array type (16 bytes), offset and item count (2 x 8 bytes)
+#   data:    the arrays, each one starting at a multiple of 16 bytes
+
+import struct, os, mmap
+import numpy
+from . import formats
+
+magic = b"RVSN"
+version = 1
+header_format = "<4sIII"
+entry_format = "<56s16sQQ"
+alignment = 16
+
+# Array types that can be stored. The names are written to the files so they must never change.
+array_types = {
+    "polygon": formats.polygon_dtype,
+    "vertex": formats.vertex_dtype,
+    "chunk_header": formats.chunk_header_dtype,
+    "instance": formats.instance_dtype,
+    "object": formats.object_dtype,
+    "polyhedron": formats.polyhedron_dtype,
+    "int64": numpy.dtype("<i8"),
+    "bytes": numpy.dtype("u1"),
+    }
+
+# Class holding the named arrays of a snapshot. When loaded from a file the arrays point into a memory map of the file.
+class Snapshot:
+    __slots__ = ("arrays", "mapping")
+
+    def __init__(self, arrays = None, mapping = None):
+        self.arrays = arrays or {}
+        self.mapping = mapping
+
+    def get(self, name, dtype):
+        return self.arrays.get(name, numpy.zeros(0, dtype))
+
+    def get_text(self, name):
+        return self.arrays[name].tobytes().decode("utf-8") if name in self.arrays else None
+
+    def set_text(self, name, text):
+        self.arrays[name] = numpy.frombuffer(text.encode("utf-8"), numpy.uint8)
+
+    # Path to the W-file the snapshot was created from. Textures and models are looked up next to it.
+    def source(self):
+        return self.get_text("source")
+
+    def world(self):
+        mesh = formats.MeshData(self.get("world/polygons", formats.polygon_dtype), self.get("world/vertices", formats.vertex_dtype))
+        return formats.WorldData(self.get("world/headers", formats.chunk_header_dtype), self.get("world/polygon_offsets", numpy.int64), self.get("world/vertex_offsets", numpy.int64), mesh)
+
+    def instances(self):
+        return self.get("instances", formats.instance_dtype)
+
+    def objects(self):
+        return self.get("objects", formats.object_dtype)
+
+    def hitbox(self):
+        return self.get("hitbox", formats.polyhedron_dtype)
+
+    def inf(self):
+        return self.get_text("inf")
+
+    # Returns the models used by the FIN-file. Maps the name stored in the FIN-file to the model path, formats.MeshData and the polyhedrons of its hitbox.
+    def models(self):
+        models = {}
+        i = 0
+        while "models/" + str(i) + "/name" in self.arrays:
+            prefix = "models/" + str(i) + "/"
+            path = os.path.join(os.path.dirname(self.source()), self.get_text(prefix + "path"))
+            mesh = formats.MeshData(self.get(prefix + "polygons", formats.polygon_dtype), self.get(prefix + "vertices", formats.vertex_dtype))
+            models[self.arrays[prefix + "name"].tobytes()] = (path, mesh, self.get(prefix + "hitbox", formats.polyhedron_dtype))
+            i += 1
+        return models
+
+# Reads a world and all files belonging to it into a snapshot. world can be supplied if the W-file has already been read.
+# The models of the FIN-file, the FOB-file and the hitboxes are left out if their include flag is False. Snapshots that are saved should include everything.
+def create(filepath, world = None, include_models = True, include_objects = True, include_hitboxes = True):
+    base = os.path.splitext(filepath)[0]
+    path = os.path.dirname(filepath) + os.sep
+    if world == None:
+        world = formats.load(filepath)
+    snapshot = Snapshot()
+    snapshot.set_text("source", os.path.abspath(filepath))
+
+    # Quantized vertices are converted back to floats.
+    snapshot.arrays["world/polygons"] = world.mesh.polygons
+    snapshot.arrays["world/vertices"] = world.mesh.vertices
+    snapshot.arrays["world/headers"] = world.headers
+    snapshot.arrays["world/polygon_offsets"] = numpy.asarray(world.polygon_offsets, numpy.int64)
+    snapshot.arrays["world/vertex_offsets"] = numpy.asarray(world.vertex_offsets, numpy.int64)
+
+    # Each model used by the FIN-file is only stored once.
+    snapshot.arrays["instances"] = formats.load_records(base + ".fin", formats.instance_dtype) if include_models else numpy.zeros(0, formats.instance_dtype)
+    i = 0
+    for name in sorted(set(snapshot.arrays["instances"]["name"].tolist())):
+        model_path = formats.find_model_path(path, name.split(b"\x00")[0].decode("ASCII", "ignore").lower())
+        if model_path == None or os.path.getsize(model_path) == 0:
+            continue
+        prefix = "models/" + str(i) + "/"
+        mesh = formats.load(model_path)
+        snapshot.arrays[prefix + "name"] = numpy.frombuffer(name, numpy.uint8)
+        snapshot.set_text(prefix + "path", os.path.relpath(model_path, path))
+        snapshot.arrays[prefix + "polygons"] = mesh.polygons
+        snapshot.arrays[prefix + "vertices"] = mesh.vertices
+        if include_hitboxes:
+            snapshot.arrays[prefix + "hitbox"] = formats.load_hitbox(os.path.splitext(model_path)[0] + ".ncp")
+        i += 1
+
+    if include_objects:
+        snapshot.arrays["objects"] = formats.load_records(base + ".fob", formats.object_dtype)
+    if include_hitboxes:
+        snapshot.arrays["hitbox"] = formats.load_hitbox(base + ".ncp")
+    if os.path.isfile(base + ".inf"):
+        fh = open(base + ".inf", "r")
+        snapshot.set_text("inf", fh.read())
+        fh.close()
+    return snapshot
+
+# Returns the name of the array type used for an array.
+def array_type(array):
+    for name, dtype in array_types.items():
+        if array.dtype == dtype:
+            return name
+    raise ValueError("Arrays of type " + str(array.dtype) + " can't be stored in snapshots")
+
+# Writes a snapshot to a file.
+def save(snapshot, filepath):
+    names = sorted(snapshot.arrays)
+
+    # Calculates where each array starts.
+    offset = struct.calcsize(header_format) + struct.calcsize(entry_format) * len(names)
+    entries = []
+    for name in names:
+        array = snapshot.arrays[name]
+        offset += -offset % alignment
+        entries.append((name, array_type(array), offset, len(array)))
+        offset += array.nbytes
+
+    fh = open(filepath, "wb")
+    fh.write(struct.pack(header_format, magic, version, len(entries), 0))
+    for name, type_name, offset, count in entries:
+        fh.write(struct.pack(entry_format, name.encode("utf-8"), type_name.encode("ASCII"), offset, count))
+    for name, type_name, offset, count in entries:
+        fh.write(b"\x00" * (offset - fh.tell()))
+        fh.write(numpy.ascontiguousarray(snapshot.arrays[name], array_types[type_name]).tobytes())
+    fh.close()
+
+# Loads a snapshot. The arrays are read-only views into a memory map of the file.
+def load(filepath):
+    fh = open(filepath, "rb")
+    mapping = mmap.mmap(fh.fileno(), 0, access = mmap.ACCESS_READ)
+    fh.close()
+
+    file_magic, file_version, entry_count, unused = struct.unpack_from(header_format, mapping, 0)
+    if file_magic != magic:
+        raise ValueError(os.path.basename(filepath) + " isn't a Re-Volt snapshot")
+    if file_version > version:
+        raise ValueError(os.path.basename(filepath) + " was saved by a newer version of the add-on")
+
+    arrays = {}
+    position = struct.calcsize(header_format)
+    for i in range(entry_count):
+        name, type_name, offset, count = struct.unpack_from(entry_format, mapping, position)
+        position += struct.calcsize(entry_format)
+        dtype = array_types[type_name.rstrip(b"\x00").decode("ASCII")]
+        arrays[name.rstrip(b"\x00").decode("utf-8")] = numpy.frombuffer(mapping, dtype, count, offset) if count > 0 else numpy.zeros(0, dtype)
+    return Snapshot(arrays, mapping)
@@ -0,0 +1,113 @@
+# Spatial index over the faces of a W- or NCP-file for ray casts, nearest point and box queries. Uses a BVH from mathutils and never touches bpy or the scene.
+# Each query returns the surface material of the face that was hit: the material of the polyhedron for NCP-files and -1 for W-files.
+
+import os
+import numpy
+from mathutils import Vector
+from mathutils.bvhtree import BVHTree
+from . import formats
+
+# Result of a query. location and normal are Vectors, index is the face (or polyhedron) in the file.
+class Hit:
+    __slots__ = ("location", "normal", "index", "distance", "material")
+
+    def __init__(self, location, normal, index, distance, material):
+        self.location = location
+        self.normal = normal
+        self.index = index
+        self.distance = distance
+        self.material = material
+
+    def __repr__(self):
+        return "Hit(" + ", ".join([str(tuple(self.location)), str(tuple(self.normal)), str(self.index), str(self.distance), str(self.material)]) + ")"
+
+# Class holding the BVH of one file. The faces are transformed by the matrix they were loaded with, so queries are done in the same space.
+class SpatialIndex:
+    __slots__ = ("filepath", "tree", "indices", "materials", "bounds")
+
+    # indices are the indices of the faces in the file.
+    def __init__(self, filepath, corners, counts, indices, materials):
+        self.filepath = filepath
+        self.indices = indices
+        self.materials = materials
+        used = numpy.arange(4)[None, :] < counts[:, None]
+
+        # Every face gets its own vertices. That's how hitboxes are stored anyway.
+        polygons = numpy.split(numpy.arange(int(numpy.sum(counts))), numpy.cumsum(counts)[:-1]) if len(counts) > 0 else []
+        self.tree = BVHTree.FromPolygons(corners[used].tolist(), [p.tolist() for p in polygons], all_triangles = False)
+
+        # Bounding box of each face for box queries. Unused corners are replaced by the first corner.
+        filled = numpy.where(used[:, :, None], corners, corners[:, :1])
+        self.bounds = numpy.concatenate([filled.min(axis = 1), filled.max(axis = 1)], axis = 1) if len(counts) > 0 else numpy.zeros((0, 6))
+
+    def __len__(self):
+        return len(self.materials)
+
+    def hit(self, result):
+        location, normal, index, distance = result
+        if index == None:
+            return None
+        return Hit(location, normal, int(self.indices[index]), distance, int(self.materials[index]))
+
+    # Returns the first face hit by a ray or None. Only faces closer than distance are found if it's supplied.
+    def ray_cast(self, origin, direction, distance = None):
+        if distance == None:
+            return self.hit(self.tree.ray_cast(Vector(origin), Vector(direction)))
+        return self.hit(self.tree.ray_cast(Vector(origin), Vector(direction), distance))
+
+    # Returns the closest point on any face or None. Only faces closer than distance are found if it's supplied.
+    def find_nearest(self, point, distance = None):
+        if distance == None:
+            return self.hit(self.tree.find_nearest(Vector(point)))
+        return self.hit(self.tree.find_nearest(Vector(point), distance))
+
+    # Returns the indices of the faces whose bounding boxes overlap the box from low to high.
+    def overlap_box(self, low, high):
+        low, high = numpy.asarray(low, dtype = numpy.float64), numpy.asarray(high, dtype = numpy.float64)
+        inside = numpy.all((self.bounds[:, :3] <= high) & (self.bounds[:, 3:] >= low), axis = 1)
+        return self.indices[inside]
+
+    # Returns the materials of the faces overlapping the box.
+    def box_materials(self, low, high):
+        low, high = numpy.asarray(low, dtype = numpy.float64), numpy.asarray(high, dtype = numpy.float64)
+        return self.materials[numpy.all((self.bounds[:, :3] <= high) & (self.bounds[:, 3:] >= low), axis = 1)]
+
+    # Returns the pairs of faces that intersect between this and another index.
+    def overlap(self, other):
+        return [(int(self.indices[i]), int(other.indices[j])) for i, j in self.tree.overlap(other.tree)]
+
+# Builds an index of a W- or NCP-file. The matrix is applied to the faces if supplied.
+def build_index(filepath, matrix = None):
+    if filepath.lower().endswith(".ncp"):
+        polyhedra = formats.load_hitbox(filepath)
+        corners, counts = formats.polyhedron_outlines(polyhedra)
+        materials = polyhedra["surface"].astype(numpy.int64)
+    else:
+        world = formats.load(filepath)
+        indices = world.global_indices()
+        positions = world.mesh.vertices["position"].astype(numpy.float64)
+        corners = positions[numpy.clip(indices, 0, max(len(positions) - 1, 0))] if len(positions) > 0 else numpy.zeros((len(indices), 4, 3))
+        counts = world.mesh.corner_counts().astype(numpy.int64)
+        materials = numpy.full(len(counts), -1, dtype = numpy.int64)
+
+    # Faces with less than three corners can't be hit.
+    keep = counts >= 3
+    corners, counts, materials = corners[keep], counts[keep], materials[keep]
+    if matrix != None:
+        corners = formats.transform_points(corners, matrix).reshape(-1, 4, 3)
+    return SpatialIndex(filepath, corners, counts, numpy.nonzero(keep)[0], materials)
+
+# Indices that have been built. The key contains the modification time and size so indices of changed files are built again.
+index_cache = {}
+
+# Returns the index of a file. It's only built once for each file and matrix as long as the file doesn't change.
+def get_index(filepath, matrix = None):
+    filepath = os.path.abspath(filepath)
+    if not os.path.isfile(filepath):
+        return None
+    key = (filepath, os.path.getmtime(filepath), os.path.getsize(filepath), None if matrix == None else tuple([x for row in matrix for x in row]))
+    if key not in index_cache:
+        for old_key in [k for k in index_cache if k[0] == filepath]:
+            del index_cache[old_key]
+        index_cache[key] = build_index(filepath, matrix)
+    return index_cache[key]
@@ -0,0 +1,10 @@
+# The tests only use the bpy-free modules. The package is registered without running __init__.py, which needs Blender, like in io_revolt_workers.py.
+
+import os, sys, types
+
+package_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if "io_revolt" not in sys.modules:
+    package = types.ModuleType("io_revolt")
+    package.__path__ = [package_directory]
+    sys.modules["io_revolt"] = package
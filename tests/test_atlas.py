@@ -0,0 +1,23 @@
+import numpy, pytest
+from io_revolt import atlas
+
+def test_pack():
+    sizes = [(64, 32), (32, 32), (32, 32), (16, 16), (48, 40)]
+    placements, page_count = atlas.pack(sizes, 64)
+    assert page_count == 2
+    covered = numpy.zeros((page_count, 64, 64), dtype = numpy.int64)
+    for (width, height), (page, x, y) in zip(sizes, placements.tolist()):
+        assert x + width <= 64 and y + height <= 64
+        covered[page, y:y + height, x:x + width] += 1
+    assert covered.max() == 1
+
+def test_pack_too_large():
+    with pytest.raises(ValueError):
+        atlas.pack([(16, 16), (65, 8)], 64)
+
+def test_remap_uvs():
+    # The first face is moved one tile back before it's mapped, the second one covers two tiles and is clamped, the third one has no image.
+    uvs = [[1, 1], [2, 1], [2, 2], [0, 0], [2, 0], [2, 1], [5, 5], [6, 6], [7, 7]]
+    uvs, clamped = atlas.remap_uvs(uvs, numpy.array([0, 3, 6]), numpy.array([0, 1, -1]), [[0, 0, 32, 32], [32, 0, 32, 16]], 64)
+    assert clamped == 1
+    assert numpy.allclose(uvs, [[0, 0], [0.5, 0], [0.5, 0.5], [0.5, 0], [1, 0], [1, 0.25], [5, 5], [6, 6], [7, 7]])
@@ -0,0 +1,20 @@
+from io_revolt import collision
+
+# Boxes (min x, max x, min y, max y, min z, max z). The second one spans three cells, the last one is flat and lies exactly on a cell border.
+bounds = [[0, 5, 0, 1, 0, 5], [5, 25, 0, 1, 0, 5], [10, 10, 0, 1, 20, 20]]
+
+def test_build_grid():
+    header, counts, indices = collision.build_grid(bounds, 10)
+    assert header == (0.0, 0.0, 3, 2, 10.0)
+    assert counts.tolist() == [2, 1, 1, 0, 1, 0]
+    assert indices.tolist() == [0, 1, 1, 1, 2]
+
+def test_empty_grid():
+    header, counts, indices = collision.build_grid([], 10)
+    assert header[2:4] == (0, 0) and len(counts) == 0 and len(indices) == 0
+
+def test_replay():
+    grid = collision.build_grid(bounds, 10)
+    tests, heat = collision.replay(grid, [[1, 1], [15, 15], [100, 100]])
+    assert tests.tolist() == [2, 1, 0]
+    assert heat.tolist() == [[2, 0, 0], [0, 1, 0]]
@@ -0,0 +1,49 @@
+import numpy
+from io_revolt import nodes
+
+# A ring 0 -> 1 -> 2 -> 3 -> 0 with a longer branch 1 -> 4 -> 2. The branch is listed first, so the order of the links can't decide the next hop.
+positions = numpy.array([[0, 0, 0], [100, 0, 0], [100, 0, 100], [0, 0, 100], [200, 0, 50]], dtype = numpy.float64)
+edges = numpy.array([[0, 1], [1, 4], [1, 2], [4, 2], [2, 3], [3, 0]])
+branch = numpy.sqrt(100 ** 2 + 50 ** 2)
+
+def test_finish_distances():
+    distances, following = nodes.finish_distances(positions, edges, 0)
+    assert numpy.allclose(distances, [400, 300, 200, 100, 200 + branch])
+    assert following.tolist() == [1, 2, 3, 0, 2]
+
+def test_position_nodes():
+    records, problems = nodes.build_position_nodes(positions, edges, 0)
+    assert problems == []
+    assert numpy.allclose(records["distance"], [400, 300, 200, 100, 200 + branch])
+    assert records["next"][:, 0].tolist() == nodes.finish_distances(positions, edges, 0)[1].tolist()
+    assert records["next"][1].tolist() == [2, 4, -1, -1]
+    assert sorted(records["previous"][2].tolist()) == [-1, -1, 1, 4]
+    assert nodes.check_nodes(positions, records["next"], records["previous"], 0) == []
+
+def test_ai_nodes():
+    count = len(positions)
+    records, problems = nodes.build_ai_nodes(positions, positions + [0, 0, 10], numpy.ones((count, 2)), numpy.zeros(count), numpy.zeros(count), numpy.arange(count) == 0, edges)
+    assert problems == []
+    assert numpy.isclose(records["finish_distance"][0], 400)
+    assert records["next"][:, 0].tolist() == [1, 2, 3, 0, 2]
+
+def test_one_sided_link():
+    records, problems = nodes.build_position_nodes(positions, edges, 0)
+    previous = records["previous"].copy()
+    previous[3] = -1
+    rules = [rule for rule, message, items in nodes.check_nodes(positions, records["next"], previous, 0)]
+    assert rules == ["one-sided-link"]
+
+def test_too_many_links():
+    # Node 0 links to four extra nodes that all lead to node 1, so both have five links. The link from node 0 to node 1 comes last but is the shortest way, so it still gets the first slot.
+    extra = numpy.array([[50, 0, -100], [50, 0, -200], [50, 0, -300], [50, 0, -400]], dtype = numpy.float64)
+    more_edges = numpy.concatenate([edges[1:], [[0, 5], [0, 6], [0, 7], [0, 8]], [[5, 1], [6, 1], [7, 1], [8, 1]], edges[:1]])
+    records, problems = nodes.build_position_nodes(numpy.concatenate([positions, extra]), more_edges, 0)
+    assert [(rule, list(items)) for rule, message, items in problems] == [("too-many-links", [0, 1])]
+    assert records["next"][0, 0] == 1
+    assert numpy.isclose(records["distance"][0], 400)
+
+def test_open_lap():
+    records, problems = nodes.build_position_nodes(positions, edges[:-1], 0)
+    rules = [rule for rule, message, items in problems]
+    assert "open-lap" in rules and "dead-end-node" in rules and "no-way-to-finish" in rules
@@ -0,0 +1,31 @@
+import numpy
+from io_revolt import raycast
+
+floor = [[[-1, -1, 0], [1, -1, 0], [0, 1, 0]]]
+
+def test_distance():
+    tree = raycast.TriangleTree(floor)
+    blocked = tree.blocked([[0, 0, 1], [0, 0, 1], [0, 0, 1]], [[0, 0, -1], [0, 0, -1], [1, 0, 0]], [2, 0.5, 10])
+    assert blocked.tolist() == [True, False, False]
+
+def test_one_sided():
+    origins, directions = [[0, 0, 1], [0, 0, -1]], [[0, 0, -1], [0, 0, 1]]
+    tree = raycast.TriangleTree(floor, normals = [[0, 0, 1]])
+    assert tree.blocked(origins, directions, [2, 2]).tolist() == [True, False]
+    tree = raycast.TriangleTree(floor, normals = [[0, 0, 1]], double_sided = [True])
+    assert tree.blocked(origins, directions, [2, 2]).tolist() == [True, True]
+
+def test_matches_brute_force():
+    random = numpy.random.RandomState(0)
+    triangles = random.uniform(-10, 10, (200, 1, 3)) + random.uniform(-2, 2, (200, 3, 3))
+    origins = random.uniform(-12, 12, (300, 3))
+    directions = random.normal(size = (300, 3))
+    directions /= numpy.linalg.norm(directions, axis = 1)[:, None]
+    distances = random.uniform(0, 20, 300)
+    tree = raycast.TriangleTree(triangles)
+
+    rays = numpy.repeat(numpy.arange(300), len(tree))
+    pairs = numpy.tile(numpy.arange(len(tree)), 300)
+    expected = numpy.any(tree.hit(origins[rays], directions[rays], distances[rays], pairs).reshape(300, -1), axis = 1)
+    assert 0 < numpy.sum(expected) < 300
+    assert tree.blocked(origins, directions, distances).tolist() == expected.tolist()
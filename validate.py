@@ -0,0 +1,257 @@
+# Checks tracks for data that Re-Volt or the importer can't handle. Every rule runs on whole arrays at once and nothing in here may import bpy, so tracks can be checked in worker processes.
+
+import os, glob, json, time
+import numpy
+from . import formats, workers, nodes, zones
+
+# Keys every INF-file should have.
+required_inf_keys = ["NAME", "STARTPOS", "STARTROT", "STARTGRID", "FARCLIP", "FOGSTART", "FOGCOLOR"]
+
+# Highest object type in FOB-files. (see object_types in __init__.py)
+max_object_type = 37
+
+# Number of polygon indices listed for each issue. The count always includes all of them.
+max_listed_items = 20
+
+# Returns an issue for the report. items are the indices of the polygons, instances or cells with the problem.
+def issue(rule, severity, filepath, message, items = None):
+    items = [] if items is None else numpy.asarray(items).ravel().tolist()
+    return {"rule": rule, "severity": severity, "file": filepath, "message": message, "count": len(items), "items": items[:max_listed_items]}
+
+# Checks polygons of a PRM-, M- or W-file. indices are the vertex indices of each polygon into positions and limits the number of vertices each polygon may use.
+def check_polygons(filepath, polygons, positions, indices, limits, texture_pages):
+    issues = []
+    counts = 3 + (polygons["type"] & 1)
+    used = numpy.arange(4)[None, :] < counts[:, None]
+
+    out_of_range = numpy.any(used & ((indices < 0) | (indices >= limits[:, None])), axis = 1)
+    if numpy.any(out_of_range):
+        issues.append(issue("vertex-index-out-of-range", "error", filepath, "Polygons use vertices that don't exist", numpy.nonzero(out_of_range)[0]))
+
+    if not numpy.all(numpy.isfinite(positions)):
+        issues.append(issue("non-finite-vertex", "error", filepath, "Vertices with NaN or infinite positions", numpy.nonzero(~numpy.all(numpy.isfinite(positions), axis = 1))[0]))
+
+    # A polygon is degenerate if it uses a vertex twice or if it has no area. These polygons are skipped by the importer.
+    safe = numpy.where(used & ~out_of_range[:, None], indices, 0)
+    corners = positions[safe].astype(numpy.float64)
+    area = numpy.sqrt(numpy.sum(numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0]) ** 2, axis = 1))
+    area += numpy.where(counts == 4, numpy.sqrt(numpy.sum(numpy.cross(corners[:, 2] - corners[:, 0], corners[:, 3] - corners[:, 0]) ** 2, axis = 1)), 0)
+    corner_sets = numpy.sort(numpy.where(used, indices, -1), axis = 1)
+    repeated = numpy.any((corner_sets[:, 1:] == corner_sets[:, :-1]) & (corner_sets[:, 1:] >= 0), axis = 1)
+    degenerate = ~out_of_range & (repeated | (area < 1e-6))
+    if numpy.any(degenerate):
+        issues.append(issue("degenerate-polygon", "warning", filepath, "Polygons with a repeated vertex or without area", numpy.nonzero(degenerate)[0]))
+
+    # Texture pages are named after the folder, e.g. toys/toysa.bmp. Pages without a letter can't be loaded at all.
+    pages = polygons["texture"]
+    out_of_range = (pages < -1) | (pages > 25)
+    if numpy.any(out_of_range):
+        issues.append(issue("texture-out-of-range", "error", filepath, "Texture pages outside of a to z", numpy.nonzero(out_of_range)[0]))
+    available = numpy.zeros(26, dtype = bool)
+    available[texture_pages] = True
+    missing = ~out_of_range & (pages >= 0) & ~available[numpy.clip(pages, 0, 25)]
+    if numpy.any(missing):
+        letters = "".join(sorted(set([chr(97 + page) for page in pages[missing].tolist()])))
+        issues.append(issue("missing-texture", "warning", filepath, "Texture pages without a bitmap: " + letters, numpy.nonzero(missing)[0]))
+    return issues
+
+# Returns the texture pages that have a bitmap next to the file.
+def find_texture_pages(filepath):
+    path = os.path.dirname(filepath)
+    name = os.path.basename(path).lower()
+    files = set([f.lower() for f in os.listdir(path)]) if os.path.isdir(path) else set()
+    return numpy.array([page for page in range(26) if name + chr(97 + page) + ".bmp" in files], dtype = numpy.int64)
+
+# Checks a PRM- or M-file.
+def check_model(filepath, texture_pages):
+    mesh = formats.load(filepath)
+    indices = mesh.polygons["vertices"].astype(numpy.int64)
+    limits = numpy.full(len(mesh.polygons), len(mesh.vertices), dtype = numpy.int64)
+    return check_polygons(filepath, mesh.polygons, mesh.vertices["position"], indices, limits, texture_pages)
+
+# Checks all meshes of a W-file at once. The vertex indices of each mesh are moved to where its vertices are in the big array.
+def check_world(filepath, texture_pages):
+    world = formats.load(filepath)
+    meshes = world.polygon_meshes()
+    offsets = world.vertex_offsets[meshes]
+    indices = world.global_indices()
+    limits = world.vertex_offsets[meshes + 1]
+    issues = check_polygons(filepath, world.mesh.polygons, world.mesh.vertices["position"], indices, limits, texture_pages)
+
+    # Polygons below the first vertex of their mesh.
+    below = numpy.any((numpy.arange(4)[None, :] < (3 + (world.mesh.polygons["type"] & 1))[:, None]) & (indices < offsets[:, None]), axis = 1)
+    if numpy.any(below):
+        issues.append(issue("vertex-index-out-of-range", "error", filepath, "Polygons use vertices of another mesh", numpy.nonzero(below)[0]))
+    return issues
+
+# Checks that each model in a FIN-file can be found. Model names are cut to 8 characters so a name can match several models.
+def check_instances(filepath):
+    issues = []
+    path = os.path.dirname(filepath) + os.sep
+    names = formats.load_records(filepath, formats.instance_dtype)["name"].tolist()
+    unique_names, inverse = numpy.unique(numpy.array(names, dtype = "S9"), return_inverse = True)
+    for i, name in enumerate(unique_names.tolist()):
+        mesh_name = name.split(b"\x00")[0].decode("ASCII", "ignore").lower()
+        if os.path.isfile(path + mesh_name + ".prm"):
+            continue
+        found_paths = glob.glob(path + mesh_name + "*.prm")
+        instances = numpy.nonzero(inverse == i)[0]
+        if len(found_paths) == 0:
+            issues.append(issue("missing-model", "error", filepath, "No model for " + mesh_name, instances))
+        elif len(found_paths) > 1:
+            issues.append(issue("ambiguous-model", "error", filepath, mesh_name + " matches " + ", ".join(sorted([os.path.basename(p) for p in found_paths])), instances))
+    return issues
+
+# Checks the object types in a FOB-file.
+def check_objects(filepath):
+    types = formats.load_records(filepath, formats.object_dtype)["type"]
+    unknown = (types < -1) | (types > max_object_type)
+    return [issue("unknown-object-type", "error", filepath, "Objects with unknown types", numpy.nonzero(unknown)[0])] if numpy.any(unknown) else []
+
+# Checks the polyhedrons and the lookup grid of an NCP-file. Cells with more than max_cell_candidates polyhedrons make collisions slow.
+def check_hitbox(filepath, max_cell_candidates):
+    issues = []
+    polyhedra = formats.load_hitbox(filepath)
+    corners, valid = formats.polyhedron_corners(polyhedra)
+    degenerate = numpy.sum(valid, axis = 1) < 3
+    if numpy.any(degenerate):
+        issues.append(issue("degenerate-polyhedron", "warning", filepath, "Polyhedrons with less than three corners", numpy.nonzero(degenerate)[0]))
+    lengths = numpy.sqrt(numpy.sum(polyhedra["planes"][:, 0, :3].astype(numpy.float64) ** 2, axis = 1))
+    unnormalized = numpy.abs(lengths - 1) > 0.01
+    if numpy.any(unnormalized):
+        issues.append(issue("unnormalized-plane", "warning", filepath, "Polyhedrons whose face normal isn't of unit length", numpy.nonzero(unnormalized)[0]))
+
+    grid = formats.load_hitbox_grid(filepath)
+    if grid == None:
+        issues.append(issue("missing-grid", "error", filepath, "The lookup grid is missing or cut off"))
+        return issues
+    header, counts, indices = grid
+    crowded = counts > max_cell_candidates
+    if numpy.any(crowded):
+        issues.append(issue("crowded-cell", "warning", filepath, "Grid cells with more than " + str(max_cell_candidates) + " polyhedrons (at most " + str(int(counts.max())) + ")", numpy.nonzero(crowded)[0]))
+    bad = (indices < 0) | (indices >= len(polyhedra))
+    if numpy.any(bad):
+        cells = numpy.repeat(numpy.arange(len(counts)), counts)[bad]
+        issues.append(issue("bad-grid-index", "error", filepath, "Grid cells pointing to polyhedrons that don't exist", numpy.unique(cells)))
+    return issues
+
+# Checks the links of the position nodes in a PAN-file.
+def check_position_nodes(filepath):
+    records, start = formats.load_position_nodes(filepath)
+    problems = nodes.check_nodes(records["position"].astype(numpy.float64), records["next"], records["previous"], start)
+    return [issue(rule, "error", filepath, message, items) for rule, message, items in problems]
+
+# Checks the links of the AI nodes in a FAN-file. Cars can still drive on when AI nodes have problems, so they're only warnings.
+def check_ai_nodes(filepath):
+    records = formats.load_ai_nodes(filepath)
+    problems = nodes.check_nodes(nodes.racing_points(records), records["next"], records["previous"], nodes.ai_start_node(records))
+    return [issue(rule, "warning", filepath, message, items) for rule, message, items in problems]
+
+# Checks the zones of a TAZ-file. The ids should count the zones from 0 in the order they're passed.
+def check_zones(filepath):
+    issues = []
+    records = formats.load_records(filepath, formats.zone_dtype)
+    ids = records["id"]
+    bad = (ids < 0) | (ids >= len(records))
+    if numpy.any(bad):
+        issues.append(issue("bad-zone-id", "error", filepath, "Zones with an id outside of 0 to " + str(len(records) - 1), numpy.nonzero(bad)[0]))
+    missing = numpy.nonzero(numpy.bincount(ids[~bad], minlength = len(records)) == 0)[0]
+    if len(missing) > 0:
+        issues.append(issue("missing-zone-id", "warning", filepath, "Zone ids that no zone has", missing))
+    empty = numpy.any(records["size"] <= 0, axis = 1)
+    if numpy.any(empty):
+        issues.append(issue("empty-zone", "warning", filepath, "Zones without a size along some axis", numpy.nonzero(empty)[0]))
+    return issues
+
+# Checks that the floors of the hitbox and the AI nodes are inside the zones of a TAZ-file. Cars outside of all zones lose track of their lap.
+def check_zone_coverage(filepath, hitbox_path, ai_path):
+    issues = []
+    polyhedra = formats.load_hitbox(hitbox_path) if os.path.isfile(hitbox_path) else None
+    ai_nodes = formats.load_ai_nodes(ai_path) if os.path.isfile(ai_path) else None
+    floor_gaps, ai_gaps = zones.coverage_gaps(formats.load_records(filepath, formats.zone_dtype), polyhedra, ai_nodes)
+    if len(floor_gaps) > 0:
+        issues.append(issue("floor-outside-zones", "warning", hitbox_path, "Floors that aren't inside any zone", floor_gaps))
+    if len(ai_gaps) > 0:
+        issues.append(issue("ai-node-outside-zones", "warning", ai_path, "AI nodes that aren't inside any zone", ai_gaps))
+    return issues
+
+# Checks that the INF-file has all required keys.
+def check_inf(filepath):
+    keys = set()
+    fh = open(filepath, "r")
+    for line in fh:
+        words = line.split(";")[0].split()
+        if len(words) > 0:
+            keys.add(words[0].upper())
+    fh.close()
+    missing = [key for key in required_inf_keys if key not in keys]
+    return [issue("missing-inf-key", "error", filepath, "Missing keys: " + ", ".join(missing))] if len(missing) > 0 else []
+
+# Runs all checks on a track. The models in the track folder are checked as well.
+def validate_track(filepath, max_cell_candidates = 256):
+    start_time = time.time()
+    base = os.path.splitext(filepath)[0]
+    texture_pages = find_texture_pages(filepath)
+    issues = []
+
+    # Files that can't be read at all are reported instead of stopping the whole run.
+    def run(check, *args):
+        try:
+            issues.extend(check(*args))
+        except Exception as error:
+            issues.append(issue("unreadable-file", "error", args[0], str(error)))
+
+    run(check_world, filepath, texture_pages)
+    for model_path in sorted(glob.glob(os.path.join(os.path.dirname(filepath), "*.prm")) + glob.glob(os.path.join(os.path.dirname(filepath), "*.m"))):
+        if os.path.getsize(model_path) > 0:
+            run(check_model, model_path, texture_pages)
+    if os.path.isfile(base + ".fin"):
+        run(check_instances, base + ".fin")
+    if os.path.isfile(base + ".fob"):
+        run(check_objects, base + ".fob")
+    if os.path.isfile(base + ".ncp"):
+        run(check_hitbox, base + ".ncp", max_cell_candidates)
+    if os.path.isfile(base + ".pan"):
+        run(check_position_nodes, base + ".pan")
+    if os.path.isfile(base + ".fan"):
+        run(check_ai_nodes, base + ".fan")
+    if os.path.isfile(base + ".taz"):
+        run(check_zones, base + ".taz")
+        run(check_zone_coverage, base + ".taz", base + ".ncp", base + ".fan")
+    if os.path.isfile(base + ".inf"):
+        run(check_inf, base + ".inf")
+    else:
+        issues.append(issue("missing-inf", "error", base + ".inf", "The track has no INF-file"))
+    return {"track": filepath, "issues": issues, "seconds": round(time.time() - start_time, 3)}
+
+# Used with workers.parallel_map which only passes one argument.
+def validate_track_job(job):
+    return validate_track(*job)
+
+# Returns the W-files in a folder and all its subfolders.
+def find_tracks(path):
+    if os.path.isfile(path):
+        return [path]
+    tracks = []
+    for directory, directories, files in os.walk(path):
+        tracks += [os.path.join(directory, f) for f in files if f.lower().endswith(".w")]
+    return sorted(tracks)
+
+# Validates all tracks found in the paths with one worker process per track. The report is written as JSON if report_path is supplied.
+def validate_tracks(paths, report_path = None, max_cell_candidates = 256):
+    start_time = time.time()
+    tracks = [track for path in paths for track in find_tracks(path)]
+    results = workers.parallel_map(validate_track_job, [(track, max_cell_candidates) for track in tracks])
+
+    # Number of issues per rule over all tracks.
+    summary = {}
+    for result in results:
+        for found in result["issues"]:
+            summary[found["rule"]] = summary.get(found["rule"], 0) + max(found["count"], 1)
+    report = {"version": 1, "seconds": round(time.time() - start_time, 3), "summary": summary, "tracks": results}
+
+    if report_path != None:
+        fh = open(report_path, "w")
+        json.dump(report, fh, indent = 2, sort_keys = True)
+        fh.close()
+    return report
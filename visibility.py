@@ -0,0 +1,207 @@
+# Finds which meshes of a W-file can be seen from each part of the track and writes visiboxes (VIS-file) that hide the rest.
+# Cameras are sampled along the position nodes, the AI nodes or the floors of the hitbox and grouped into regions on a grid.
+# Each region casts rays from its cameras to points on every mesh. Nothing in here may import bpy, so the regions are tested in worker processes.
+
+import os, time
+import numpy
+from . import formats, nodes, zones, raycast, workers
+
+# The game keeps the visibility groups in a 64 bit mask.
+max_regions = 64
+
+# Most visiboxes the game loads from a VIS-file.
+max_visiboxes = 300
+
+# Rays stop this far in front of their target so they don't hit the surface the target lies on.
+target_margin = 1.0
+
+# Returns the triangles of a W-file as (T, 3, 3) with the summed vertex normals, the polygon type and the mesh of each triangle. Quads are split in two.
+def world_triangles(world):
+    polygons = world.mesh.polygons
+    indices = world.global_indices()
+    is_quad = (polygons["type"] & 1) == 1
+    corners = numpy.concatenate([indices[:, [0, 1, 2]], indices[is_quad][:, [0, 2, 3]]])
+    owners = numpy.concatenate([numpy.arange(len(polygons)), numpy.nonzero(is_quad)[0]])
+
+    # Skips triangles with broken vertex indices.
+    positions = world.mesh.vertices["position"].astype(numpy.float64)
+    valid = numpy.all((corners >= 0) & (corners < len(positions)), axis = 1)
+    corners, owners = corners[valid], owners[valid]
+    normals = world.mesh.vertices["normal"].astype(numpy.float64)[corners].sum(axis = 1)
+    return positions[corners], normals, polygons["type"][owners], world.polygon_meshes()[owners]
+
+# Returns points on each mesh that rays are cast to: the center of its bounding sphere and up to per_chunk of its vertices spread over the mesh.
+# Also returns the mesh of each point and the round in which it is tested.
+def chunk_targets(world, per_chunk):
+    counts = numpy.diff(world.vertex_offsets)
+    ranks = numpy.arange(per_chunk)
+    picks = world.vertex_offsets[:-1, None] + ranks[None, :] * counts[:, None] // per_chunk
+    valid = ranks[None, :] < counts[:, None]
+    positions = world.mesh.vertices["position"].astype(numpy.float64)
+    targets = numpy.concatenate([world.headers["center"].astype(numpy.float64).reshape(-1, 3), positions[picks[valid]]])
+    target_chunks = numpy.concatenate([numpy.arange(len(world)), numpy.nonzero(valid)[0]])
+    target_ranks = numpy.concatenate([numpy.zeros(len(world), dtype = numpy.int64), numpy.nonzero(valid)[1] + 1])
+    return targets, target_chunks, target_ranks
+
+# Returns points spaced at most spacing apart along the links between nodes.
+def sample_links(positions, edges, spacing):
+    if len(edges) == 0:
+        return positions
+    starts, ends = positions[edges[:, 0]], positions[edges[:, 1]]
+    steps = numpy.maximum(numpy.ceil(numpy.sqrt(numpy.sum((ends - starts) ** 2, axis = 1)) / spacing).astype(numpy.int64), 1)
+    links = numpy.repeat(numpy.arange(len(edges)), steps)
+    fractions = (numpy.arange(len(links)) - numpy.repeat(numpy.cumsum(steps) - steps, steps)) / numpy.repeat(steps, steps)
+    return numpy.concatenate([positions, starts[links] + (ends[links] - starts[links]) * fractions[:, None]])
+
+# Returns camera positions for a track. The position nodes are used if there are any, then the AI nodes and then the floors of the hitbox.
+# The cameras are lifted by height (the y axis points down) and only one is kept within each cube of spacing.
+def camera_points(base, height, spacing):
+    points = numpy.zeros((0, 3))
+    position_nodes = formats.load_position_nodes(base + ".pan")[0]
+    ai_nodes = formats.load_ai_nodes(base + ".fan")
+    if len(position_nodes) > 0:
+        positions = position_nodes["position"].astype(numpy.float64)
+        points = sample_links(positions, nodes.clean_edges(len(positions), nodes.slots_to_edges(position_nodes["next"])), spacing)
+    elif len(ai_nodes) > 0:
+        positions = nodes.racing_points(ai_nodes)
+        points = sample_links(positions, nodes.clean_edges(len(positions), nodes.slots_to_edges(ai_nodes["next"])), spacing)
+    elif os.path.isfile(base + ".ncp"):
+        points = zones.floor_points(formats.load_hitbox(base + ".ncp"), 0)[1]
+    if len(points) == 0:
+        return points
+    points = points - [0, height, 0]
+    cells = numpy.ascontiguousarray(numpy.floor(points / spacing).astype(numpy.int64))
+    first = numpy.unique(cells.view(numpy.dtype((numpy.void, cells.itemsize * 3))).ravel(), return_index = True)[1]
+    return points[numpy.sort(first)]
+
+# Groups cameras into at most count regions. The regions are cells of a grid on the ground, which grows until few enough cells are used.
+# Returns the region of each camera and the lowest and highest x and z of each region.
+def assign_regions(points, count):
+    ground = points[:, [0, 2]]
+    low = ground.min(axis = 0)
+    size = max(float(numpy.max(ground.max(axis = 0) - low)), 1.0) / numpy.sqrt(count)
+    while True:
+        cells = numpy.floor((ground - low) / size).astype(numpy.int64)
+        keys = cells[:, 0] * (int(cells[:, 1].max()) + 1) + cells[:, 1]
+        unique_keys, first, regions = numpy.unique(keys, return_index = True, return_inverse = True)
+        if len(unique_keys) <= count:
+            break
+        size *= 1.25
+    cell_low = low + cells[first] * size
+    return regions.ravel(), numpy.concatenate([cell_low, cell_low + size], axis = 1)
+
+# Returns which meshes can be seen from any of the cameras. Meshes with a camera inside their bounding box are always visible.
+# The points of each mesh are tested one round after another and meshes that were seen are skipped in later rounds.
+def visible_chunks(cameras, targets, target_chunks, target_ranks, chunk_bounds, tree, max_distance = None):
+    low, high = chunk_bounds[:, :, 0], chunk_bounds[:, :, 1]
+    visible = numpy.any(numpy.all((cameras[:, None] >= low[None]) & (cameras[:, None] <= high[None]), axis = 2), axis = 0)
+    for rank in range(int(target_ranks.max()) + 1 if len(target_ranks) > 0 else 0):
+        selected = numpy.nonzero((target_ranks == rank) & ~visible[target_chunks])[0]
+        if len(selected) == 0:
+            continue
+        offsets = (targets[selected][None] - cameras[:, None]).reshape(-1, 3)
+        lengths = numpy.sqrt(numpy.sum(offsets ** 2, axis = 1))
+        directions = offsets / numpy.maximum(lengths, 1e-12)[:, None]
+        clear = ~tree.blocked(numpy.repeat(cameras, len(selected), axis = 0), directions, numpy.maximum(lengths - target_margin, 0))
+        if max_distance != None:
+            clear &= lengths <= max_distance
+        visible[target_chunks[selected][numpy.any(clear.reshape(len(cameras), -1), axis = 0)]] = True
+    return visible
+
+# Used with workers.parallel_map which only passes one argument.
+def visible_chunks_job(job):
+    return visible_chunks(*job)
+
+# Returns cube boxes around the meshes that aren't visible. Neighbouring meshes share a box as long as the box doesn't contain a visible mesh completely.
+# Returns the boxes as (B, 3, 2) and the number of meshes in each box.
+def cube_boxes(chunk_bounds, visible, padding):
+    hidden = numpy.nonzero(~visible)[0]
+    low, high = chunk_bounds[:, :, 0] - padding, chunk_bounds[:, :, 1] + padding
+    visible_low, visible_high = chunk_bounds[visible, :, 0], chunk_bounds[visible, :, 1]
+    if len(hidden) == 0:
+        return numpy.zeros((0, 3, 2)), numpy.zeros(0, dtype = numpy.int64)
+
+    # The hidden meshes are sorted along a coarse grid so neighbouring meshes come after each other.
+    centers = (low[hidden] + high[hidden]) / 2
+    extent = max(float(numpy.max(centers.max(axis = 0) - centers.min(axis = 0))), 1.0)
+    cells = numpy.floor((centers - centers.min(axis = 0)) / (extent / 16)).astype(numpy.int64)
+    hidden = hidden[numpy.lexsort((cells[:, 1], cells[:, 2], cells[:, 0]))]
+
+    def contains_visible(box_low, box_high):
+        return numpy.any(numpy.all((visible_low >= box_low) & (visible_high <= box_high), axis = 1))
+
+    boxes = []
+    current = None
+    for chunk in hidden.tolist():
+        if current != None:
+            merged_low, merged_high = numpy.minimum(current[0], low[chunk]), numpy.maximum(current[1], high[chunk])
+            if not contains_visible(merged_low, merged_high):
+                current = (merged_low, merged_high, current[2] + 1)
+                continue
+            boxes.append(current)
+
+        # A small visible mesh can even lie inside the box of a single hidden one. Such meshes stay visible.
+        current = None if contains_visible(low[chunk], high[chunk]) else (low[chunk], high[chunk], 1)
+    if current != None:
+        boxes.append(current)
+    return numpy.array([numpy.column_stack([box_low, box_high]) for box_low, box_high, count in boxes]).reshape(-1, 3, 2), numpy.array([count for box_low, box_high, count in boxes], dtype = numpy.int64)
+
+# Generates the visiboxes of a track and writes them to vis_path. The camera positions come from the PAN-, FAN- or NCP-file next to the W-file.
+# Returns a report with the number of meshes drawn in each region before and after culling.
+def generate(world_path, vis_path, camera_height = 100.0, spacing = 200.0, region_count = max_regions, targets_per_chunk = 8, max_distance = None, padding = 1.0, processes = None):
+    start_time = time.time()
+    world = formats.load(world_path)
+    chunk_bounds = world.headers["bounds"].astype(numpy.float64).reshape(-1, 3, 2)
+    cameras = camera_points(os.path.splitext(world_path)[0], camera_height, spacing)
+    if len(cameras) == 0 or len(world) == 0:
+        return None
+
+    # Translucent faces don't hide what's behind them.
+    triangles, normals, types, triangle_chunks = world_triangles(world)
+    solid = (types & 4) == 0
+    tree = raycast.TriangleTree(triangles[solid], normals[solid], (types[solid] & 2) != 0)
+    targets, target_chunks, target_ranks = chunk_targets(world, targets_per_chunk)
+
+    regions, areas = assign_regions(cameras, min(region_count, max_regions))
+    jobs = [(cameras[regions == region], targets, target_chunks, target_ranks, chunk_bounds, tree, max_distance) for region in range(len(areas))]
+    visibility = workers.parallel_map(visible_chunks_job, jobs, processes)
+
+    # The camera boxes cover the cells of the regions from the highest to the lowest camera.
+    camera_boxes = []
+    for region in range(len(areas)):
+        heights = cameras[regions == region, 1]
+        camera_boxes.append([[areas[region, 0], areas[region, 2]], [heights.min() - camera_height, heights.max() + camera_height], [areas[region, 1], areas[region, 3]]])
+
+    # Keeps the cube boxes hiding the most meshes if there are too many.
+    region_boxes = [cube_boxes(chunk_bounds, visible, padding) for visible in visibility]
+    box_regions = numpy.concatenate([numpy.full(len(counts), region, dtype = numpy.int64) for region, (boxes, counts) in enumerate(region_boxes)])
+    all_boxes = numpy.concatenate([boxes for boxes, counts in region_boxes]).reshape(-1, 3, 2)
+    kept = numpy.argsort(-numpy.concatenate([counts for boxes, counts in region_boxes]), kind = "mergesort")[:max(max_visiboxes - len(camera_boxes), 0)]
+    kept = numpy.sort(kept)
+
+    records = numpy.zeros(len(camera_boxes) + len(kept), formats.visibox_dtype)
+    records["flag"][:len(camera_boxes)] = 1
+    records["id"][:len(camera_boxes)] = numpy.arange(len(camera_boxes))
+    records["bounds"][:len(camera_boxes)] = camera_boxes
+    records["flag"][len(camera_boxes):] = 2
+    records["id"][len(camera_boxes):] = box_regions[kept]
+    records["bounds"][len(camera_boxes):] = all_boxes[kept]
+    fh = open(vis_path, "wb")
+    formats.write_records(fh, records, formats.visibox_dtype)
+    fh.close()
+
+    # Counts the meshes that end up completely inside a cube box of each region. That's what the game skips.
+    report_regions = []
+    for region in range(len(areas)):
+        boxes = all_boxes[kept[box_regions[kept] == region]]
+        culled = numpy.any(numpy.all((chunk_bounds[None, :, :, 0] >= boxes[:, None, :, 0]) & (chunk_bounds[None, :, :, 1] <= boxes[:, None, :, 1]), axis = 2), axis = 0) if len(boxes) > 0 else numpy.zeros(len(world), dtype = bool)
+        report_regions.append({"region": region, "cameras": int(numpy.sum(regions == region)), "visible": int(numpy.sum(visibility[region])), "drawn": int(len(world) - numpy.sum(culled)), "cube boxes": len(boxes)})
+    drawn = numpy.array([region["drawn"] for region in report_regions], dtype = numpy.float64)
+    return {
+        "meshes": len(world),
+        "regions": report_regions,
+        "visiboxes": len(records),
+        "average drawn": round(float(drawn.mean()), 1),
+        "average savings": round(float(1 - drawn.mean() / len(world)), 3),
+        "seconds": round(time.time() - start_time, 3),
+        }
@@ -0,0 +1,61 @@
+# Helpers for spreading bpy-free work over several processes.
+
+import os, sys, importlib, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Inside Blender sys.executable is the Blender binary, so spawned workers have to be pointed at the bundled Python interpreter.
+try:
+    import bpy
+    if getattr(bpy.app, "binary_path_python", ""):
+        multiprocessing.set_executable(bpy.app.binary_path_python)
+except ImportError:
+    pass
+
+package_directory = os.path.dirname(os.path.abspath(__file__))
+
+# Jobs are sent through io_revolt_workers.py imported as a top-level module, since the workers can't import the package. (see io_revolt_workers.py)
+entry_module = "io_revolt_workers"
+
+# Calls function for each item and returns the results in the same order. The work is done in worker processes when there's more than one item.
+# The function has to be defined at the top of a bpy-free module in this package.
+def parallel_map(function, items, processes = None):
+    items = list(items)
+    processes = min(processes or os.cpu_count() or 1, len(items))
+    if processes < 2:
+        return [function(item) for item in items]
+
+    # The workers get the search path of this process when they start, so the package directory is only added while the pool is running.
+    added_path = package_directory not in sys.path
+    if added_path:
+        sys.path.append(package_directory)
+    try:
+        top_level = importlib.import_module(entry_module)
+        with ProcessPoolExecutor(processes) as pool:
+            return list(pool.map(top_level.run_job, [(function.__module__, function.__name__, item) for item in items]))
+
+    # Does the work in this process if the workers couldn't be started.
+    except (BrokenProcessPool, OSError):
+        return [function(item) for item in items]
+    finally:
+        if added_path:
+            sys.path.remove(package_directory)
+
+# Pool of worker processes that stays alive between jobs, e.g. for a long running service. The modules a job needs are only imported once in each worker.
+class Pool:
+    __slots__ = ("executor", "top_level")
+
+    def __init__(self, processes = None):
+        if package_directory not in sys.path:
+            sys.path.append(package_directory)
+        self.top_level = importlib.import_module(entry_module)
+        self.executor = ProcessPoolExecutor(processes or os.cpu_count() or 1)
+
+    # Starts function(item) in a worker and returns a future for its result. The same rules as for parallel_map apply to the function.
+    def submit(self, function, item):
+        return self.executor.submit(self.top_level.run_job, (function.__module__, function.__name__, item))
+
+    def shutdown(self):
+        self.executor.shutdown()
+        if package_directory in sys.path:
+            sys.path.remove(package_directory)
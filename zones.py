@@ -0,0 +1,95 @@
+# Track zones (TAZ-files) are turned boxes the game uses to follow the cars around the lap. ZoneIndex finds the zones containing large numbers of points at once.
+# Nothing in here may import bpy, so tracks can be checked in worker processes.
+
+import numpy
+from . import formats, nodes
+
+# Largest number of zones in a leaf of the tree.
+zones_per_leaf = 4
+
+# Bounding volume hierarchy over the zones of a TAZ-file. Every node of the tree has an axis aligned box around its zones.
+# Points are pushed down the tree in arrays, so each node is tested once for all points that reached it.
+class ZoneIndex:
+    __slots__ = ("centers", "axes", "sizes", "low", "high", "children", "leaf_zones")
+
+    def __init__(self, zones):
+        self.centers = zones["position"].astype(numpy.float64)
+        self.axes = zones["matrix"].astype(numpy.float64)
+        self.sizes = zones["size"].astype(numpy.float64)
+
+        # The box around a zone reaches as far along each axis as the corners of the zone do.
+        extents = numpy.sum(numpy.abs(self.axes) * self.sizes[:, :, None], axis = 1)
+        zone_low, zone_high = self.centers - extents, self.centers + extents
+
+        # Builds the tree from the top. Nodes are split in the middle of the zones along the longest side of their box.
+        self.low, self.high, self.children, self.leaf_zones = [], [], [], []
+        stack = [(numpy.arange(len(zones)), None)]
+        while len(stack) > 0:
+            members, parent = stack.pop()
+            node = len(self.low)
+            if parent != None:
+                self.children[parent].append(node)
+            self.low.append(zone_low[members].min(axis = 0) if len(members) > 0 else numpy.zeros(3))
+            self.high.append(zone_high[members].max(axis = 0) if len(members) > 0 else numpy.zeros(3))
+            self.children.append([])
+            if len(members) <= zones_per_leaf:
+                self.leaf_zones.append(members)
+                continue
+            self.leaf_zones.append(None)
+            axis = numpy.argmax(self.high[node] - self.low[node])
+            order = members[numpy.argsort(self.centers[members, axis], kind = "mergesort")]
+            stack.append((order[len(order) // 2:], node))
+            stack.append((order[:len(order) // 2], node))
+        self.low, self.high = numpy.array(self.low), numpy.array(self.high)
+
+    def __len__(self):
+        return len(self.centers)
+
+    # Returns which points are inside a zone. The points are moved into the space of the zone and compared to its size.
+    def contains(self, zone, points):
+        local = numpy.dot(points - self.centers[zone], self.axes[zone].T)
+        return numpy.all(numpy.abs(local) <= self.sizes[zone], axis = 1)
+
+    # Returns the index of the zone containing each point or -1. Points inside several zones get the zone that comes first in the file.
+    def query(self, points):
+        points = numpy.asarray(points, dtype = numpy.float64).reshape(-1, 3)
+        result = numpy.full(len(points), -1, dtype = numpy.int64)
+        if len(self) == 0 or len(points) == 0:
+            return result
+
+        # The points that reached a node are carried along with their indices so they're only gathered once per node.
+        stack = [(0, numpy.arange(len(points)), points)]
+        while len(stack) > 0:
+            node, candidates, candidate_points = stack.pop()
+            inside = numpy.all((candidate_points >= self.low[node]) & (candidate_points <= self.high[node]), axis = 1)
+            candidates, candidate_points = candidates[inside], candidate_points[inside]
+            if len(candidates) == 0:
+                continue
+            if self.leaf_zones[node] is None:
+                stack.extend([(child, candidates, candidate_points) for child in self.children[node]])
+                continue
+            for zone in self.leaf_zones[node].tolist():
+                found = candidates[self.contains(zone, candidate_points)]
+                result[found] = numpy.where((result[found] < 0) | (result[found] > zone), zone, result[found])
+        return result
+
+# Returns the polyhedrons of a hitbox that are floors and a point above the middle of each. Re-Volt's y axis points down, so floors face towards -y.
+# Faces steeper than max_slope (the sine of the angle to the ground) are walls. The points are lifted off the floor since zones often start right at it.
+def floor_points(polyhedra, lift = 10.0, max_slope = 0.7):
+    corners, valid = formats.polyhedron_corners(polyhedra)
+    normals = polyhedra["planes"][:, 0, :3].astype(numpy.float64)
+    counts = numpy.sum(valid, axis = 1)
+    floors = numpy.nonzero((counts >= 3) & (-normals[:, 1] >= numpy.sqrt(1 - max_slope ** 2)))[0]
+    centers = numpy.sum(numpy.where(valid[floors, :, None], corners[floors], 0), axis = 1) / counts[floors, None]
+    return floors, centers + normals[floors] * lift
+
+# Returns the floors of the hitbox and the AI nodes that aren't inside any zone. Either file may be None.
+def coverage_gaps(zones, polyhedra = None, ai_nodes = None, lift = 10.0):
+    index = ZoneIndex(zones)
+    floor_gaps = ai_gaps = numpy.zeros(0, dtype = numpy.int64)
+    if polyhedra is not None:
+        floors, points = floor_points(polyhedra, lift)
+        floor_gaps = floors[index.query(points) < 0]
+    if ai_nodes is not None:
+        ai_gaps = numpy.nonzero(index.query(nodes.racing_points(ai_nodes)) < 0)[0]
+    return floor_gaps, ai_gaps